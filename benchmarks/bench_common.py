@@ -0,0 +1,101 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Timing, result files and comparison shared by the benchmarks.
+#
+# Results are JSON: {"benchmark": ..., "version": [0, 8], "python": ..., "results": {name: {...}}}
+# where every result has the seconds per call (min, mean over the repeats) and the calls timed.
+#
+
+import ast
+import json
+import os
+import platform
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+
+
+#
+# The addon's version, read without importing it (it requires bpy).
+#
+def addon_version():
+    with open(os.path.join(ROOT, "render_to_print.py")) as f:
+        for node in ast.parse(f.read()).body:
+            if isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', '') == 'bl_info':
+                return list(ast.literal_eval(node.value)['version'])
+    return None
+
+
+
+#
+# Calls function number times per repeat, returns the seconds per call.
+#
+def measure(function, number=1, repeat=3):
+    times = []
+    for i in range(repeat):
+        time_start = time.perf_counter()
+        for j in range(number):
+            function()
+        times.append((time.perf_counter() - time_start) / number)
+    return {'min_s': min(times), 'mean_s': sum(times) / len(times), 'calls': number * repeat}
+
+
+
+def write_results(path, benchmark, results, **info):
+    data = {
+            'benchmark': benchmark,
+            'version': addon_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+            }
+    data.update(info)
+    if path:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    return data
+
+
+
+#
+# Prints the ratio of the current to the previous minimum time per result (> 1 is slower).
+#
+def compare(previous_path, data):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+    for name in sorted(data['results']):
+        if name in previous:
+            ratio = data['results'][name]['min_s'] / max(previous[name]['min_s'], 1e-12)
+            print("%-50s %8.2fx %s" % (name, ratio, "SLOWER" if ratio > 1.1 else ""))
+
+
+
+def print_results(data):
+    for name in sorted(data['results']):
+        result = data['results'][name]
+        print("%-50s %12.3f us" % (name, result['min_s'] * 1e6))
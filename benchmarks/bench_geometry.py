@@ -0,0 +1,93 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Micro benchmarks of the print math (no blender required):
+#
+#   python benchmarks/bench_geometry.py [--output geometry.json] [--compare previous.json]
+#
+# pixels_from_print is measured by its math, i.e. the preset lookup and printable_pixels for
+# both sides, as the addon function itself only adds property access.
+#
+
+import argparse
+
+import bench_common
+import render_to_print_geometry as geometry
+
+
+SHEET = ("A1_59.4_84.1", "Landscape", 300, (.015, .015, .015, 1.5))
+
+
+
+def pixels_from_print():
+    preset, orientation, dpi, margins = SHEET
+    tipo, dim_w, dim_h = geometry.paper_presets_data[preset]
+    width_cm, height_cm = geometry.sheet_size_cm(dim_w, dim_h, orientation)
+    ref_x = geometry.pixels_to_printed_m(9000, dpi)
+    ref_y = geometry.pixels_to_printed_m(6000, dpi)
+    return (
+            geometry.printable_pixels(width_cm, dpi, margins[3], margins[1], ref_x, True),
+            geometry.printable_pixels(height_cm, dpi, margins[0], margins[2], ref_y, True)
+            )
+
+
+
+def benchmarks():
+    cases = {
+            'pixels_from_print': (pixels_from_print, 10000),
+            'rel_to_abs_m (absolute)': (lambda: geometry.rel_to_abs_m(.015, .841), 100000),
+            'rel_to_abs_m (percent)': (lambda: geometry.rel_to_abs_m(1.5, .841), 100000),
+            'convertScaleFactorToRatioString (1:50)': (lambda: geometry.convertScaleFactorToRatioString(.02), 100000),
+            'convertScaleFactorToRatioString (20:1)': (lambda: geometry.convertScaleFactorToRatioString(20), 100000),
+            'get_smallest_central_and_largest': (lambda: geometry.get_smallest_central_and_largest((.3, .1, .02)), 100000),
+            }
+    if geometry.numpy is not None:
+        presets = [p[0] for p in geometry.paper_presets if not p[0].startswith('custom')]
+        for count in (1000, 100000):
+            sheets = [presets[i % len(presets)] for i in range(count)]
+            dpis = [(150, 300, 600)[i % 3] for i in range(count)]
+            cases['solve_print_geometry (%s sheets)' % count] = (
+                    lambda sheets=sheets, dpis=dpis: geometry.solve_print_geometry(
+                        sheets, "Landscape", dpis, .015, .015, .015, .015, scale_factor=.01),
+                    10)
+    return cases
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro benchmarks of the render to print math.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', help="Results of an earlier run to compare with.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, (function, number) in sorted(benchmarks().items()):
+        results[name] = bench_common.measure(function, number, args.repeat)
+    data = bench_common.write_results(args.output, 'geometry', results)
+    bench_common.print_results(data)
+    if args.compare:
+        bench_common.compare(args.compare, data)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Scenario benchmarks of the addon on generated scenes, run in background blender:
+#
+#   blender -b --factory-startup -P benchmarks/bench_scenarios.py -- \
+#       [--sizes 10 1000 10000 100000] [--output scenarios.json] [--compare previous.json]
+#
+# For every size a fresh scene with that many mesh objects (sharing one mesh), a camera and
+# the scale ratio text is generated, then apply_print_settings, position_within_render,
+# change_text and ensure_height (of a changed text) are timed.
+#
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import bench_common
+
+import bpy
+import render_to_print
+
+
+SIZES = (10, 1000, 10000, 100000)
+
+
+
+#
+# A new scene with count objects in a grid, a camera and print settings, made the active scene.
+#
+def generate_scene(count):
+    scene = bpy.data.scenes.new("bench_%s" % count)
+    bpy.context.screen.scene = scene
+
+    mesh = bpy.data.meshes.new("bench_cube")
+    mesh.from_pydata(
+            [(x, y, z) for x in (-.5, .5) for y in (-.5, .5) for z in (-.5, .5)], [],
+            [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+            )
+    columns = max(int(count ** .5), 1)
+    for i in range(count):
+        o = bpy.data.objects.new("bench_%06d" % i, mesh)
+        o.location = (i % columns * 2.0, i // columns * 2.0, 0.0)
+        scene.objects.link(o)
+
+    camera = bpy.data.objects.new("bench_camera", bpy.data.cameras.new("bench_camera"))
+    camera.location = (columns, columns, 100.0)
+    scene.objects.link(camera)
+    scene.camera = camera
+    scene.update()
+
+    ps = scene.print_settings
+    with render_to_print.print_settings_batch(bpy.context):
+        ps.preset = "A1_59.4_84.1"
+        ps.orientation = "Landscape"
+        ps.dpi = 150
+        ps.scale_factor = .01
+    return scene
+
+
+
+def run_scenario(count, repeat):
+    scene = generate_scene(count)
+    context = bpy.context
+    ps = scene.print_settings
+    results = {}
+
+    def apply():
+        render_to_print.apply_print_settings(context)
+    results['apply_print_settings'] = bench_common.measure(apply, 1, repeat)
+
+    text = scene.objects.get(ps.scale_ratio_text_object) or render_to_print.find_scale_ratio_text_object(context, ps)
+
+    def position():
+        render_to_print.position_within_render(context, obj=text, ps=ps)
+    results['position_within_render'] = bench_common.measure(position, 1, repeat)
+
+    bodies = iter(range(10 ** 9))
+    def change():
+        render_to_print.change_text(context, text, "1:%s" % next(bodies))
+    results['change_text'] = bench_common.measure(change, 1, repeat)
+
+    # A new body each time, measuring the text rather than looking up its cached bounds:
+    def height():
+        text.data.body = "1:%s" % next(bodies)
+        render_to_print.ensure_height(obj=text, print_settings=ps)
+    results['ensure_height'] = bench_common.measure(height, 1, repeat)
+
+    return {"%s (%s objects)" % (name, count): result for name, result in results.items()}
+
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="bench_scenarios.py", description="Scenario benchmarks of render to print.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', help="Results of an earlier run to compare with.")
+    args = parser.parse_args(argv)
+
+    render_to_print.register()
+    results = {}
+    for count in args.sizes:
+        print("Scene with %s objects ..." % count)
+        results.update(run_scenario(count, args.repeat))
+    data = bench_common.write_results(args.output, 'scenarios', results, blender=bpy.app.version_string)
+    bench_common.print_results(data)
+    if args.compare:
+        bench_common.compare(args.compare, data)
+
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
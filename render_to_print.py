@@ -34,17 +34,76 @@ bl_info = {
 }
 
 
+import argparse
+import array
+import contextlib
+import hashlib
+import json
 import math
+import os
+import shutil
+import subprocess
+import sys
+import time
 import bpy
-from bpy.types import Panel, Operator, Scene, PropertyGroup
+from bpy.app.handlers import persistent
+from mathutils import Matrix, Vector
+try:
+    import numpy
+except ImportError:
+    numpy = None # Bulk reading of vertices falls back to the bounding boxes.
+from bpy.types import Panel, Operator, Scene, Object, PropertyGroup
 from bpy.props import (IntProperty,
                        FloatProperty,
                        StringProperty,
                        EnumProperty,
                        PointerProperty,
-                       BoolProperty
+                       BoolProperty,
+                       FloatVectorProperty
                        )
 
+# The print geometry, the paper presets, the render farm, the tile stitcher, the stage timings, the render cache and the annotation overlays live in bpy independent modules next to this file.
+# The add-ons directory is on sys.path, but not when run as a script (blender -P).
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+if ADDON_DIR not in sys.path:
+    sys.path.append(ADDON_DIR)
+import render_to_print_geometry as geometry
+import render_to_print_presets as presets
+import render_to_print_farm as farm
+import render_to_print_stitch as stitch
+import render_to_print_stats as stats
+import render_to_print_cache as render_cache
+import render_to_print_overlay as overlay
+from render_to_print_geometry import (in_TO_cm,
+                                      m_TO_cm,
+                                      paper_enum_parse,
+                                      paper_presets_data,
+                                      rel_to_abs_m,
+                                      get_smallest_central_and_largest,
+                                      convertScaleFactorToRatioString
+                                      )
+
+
+#
+# User and site paper presets (see render_to_print_presets) are read from the user's config directory
+# and the files listed in RENDER_TO_PRINT_PRESETS. They have to be loaded before the preset enums
+# are defined, new presets thus require reloading the addon.
+#
+PRESETS_FILE = "render_to_print_presets.json"
+
+def preset_files():
+    files = [bpy.utils.user_resource('CONFIG', PRESETS_FILE)]
+    files.extend(p for p in os.environ.get('RENDER_TO_PRINT_PRESETS', '').split(os.pathsep) if p)
+    return [f for f in files if os.path.isfile(f)]
+
+for path in preset_files():
+    try:
+        print("Loaded paper presets %s from %s." % (", ".join(presets.load_presets(path)), path))
+    except (OSError, ValueError) as e:
+        print("Warning: Could not load paper presets from %s: %s" % (path, e))
+
+paper_presets = presets.enum_items()
+
 LAYERS_ALL = (
         True, True, True, True, True,
         True, True, True, True, True,
@@ -52,140 +111,57 @@ LAYERS_ALL = (
         True, True, True, True, True
         )
 
-paper_presets = (
-    ("A5_14.8_21.0", "default (A5)", ""),
-    ("custom_1_1", "custom", ""),
-    ("A0_84.1_118.9", "A0 (84.1x118.9 cm)", ""),
-    ("A1_59.4_84.1", "A1 (59.4x84.1 cm)", ""),
-    ("A2_42.0_59.4", "A2 (42.0x59.4 cm)", ""),
-    ("A3_29.7_42.0", "A3 (29.7 42.0 cm)", ""),
-    ("A4_21.0_29.7", "A4 (21.0x29.7 cm)", ""),
-    ("A5_14.8_21.0", "A5 (14.8x21.0 cm)", ""),
-    ("A6_10.5_14.8", "A6 (10.5x14.8 cm)", ""),
-    ("A7_7.4_10.5", "A7 (7.4x10.5 cm)", ""),
-    ("A8_5.2_7.4", "A8 (5.2x7.4 cm)", ""),
-    ("A9_3.7_5.2", "A9 (3.7x5.2 cm)", ""),
-    ("A10_2.6_3.7", "A10 (2.6x3.7 cm)", ""),
-
-    ("B0_100.0_141.4", "B0 (100.0x141.4 cm)", ""),
-    ("B1_70.7_100.0", "B1 (70.7x100.0 cm)", ""),
-    ("B2_50.0_70.7", "B2 (50.0x70.7 cm)", ""),
-    ("B3_35.3_50.0", "B3 (35.3x50.0 cm)", ""),
-    ("B4_25.0_35.3", "B4 (25.0x35.3 cm)", ""),
-    ("B5_17.6_25.0", "B5 (17.6x25.0 cm)", ""),
-    ("B6_12.5_17.6", "B6 (12.5x17.6 cm)", ""),
-    ("B7_8.8_12.5", "B7 (8.8x12.5 cm)", ""),
-    ("B8_6.2_8.8", "B8 (6.2x8.8 cm)", ""),
-    ("B9_4.4_6.2", "B9 (4.4x6.2 cm)", ""),
-    ("B10_3.1_4.4", "B10 (3.1x4.4 cm)", ""),
-
-    ("C0_91.7_129.7", "C0 (91.7x129.7 cm)", ""),
-    ("C1_64.8_91.7", "C1 (64.8x91.7 cm)", ""),
-    ("C2_45.8_64.8", "C2 (45.8x64.8 cm)", ""),
-    ("C3_32.4_45.8", "C3 (32.4x45.8 cm)", ""),
-    ("C4_22.9_32.4", "C4 (22.9x32.4 cm)", ""),
-    ("C5_16.2_22.9", "C5 (16.2x22.9 cm)", ""),
-    ("C6_11.4_16.2", "C6 (11.4x16.2 cm)", ""),
-    ("C7_8.1_11.4", "C7 (8.1x11.4 cm)", ""),
-    ("C8_5.7_8.1", "C8 (5.7x8.1 cm)", ""),
-    ("C9_4.0_5.7", "C9 (4.0x5.7 cm)", ""),
-    ("C10_2.8_4.0", "C10 (2.8x4.0 cm)", ""),
-
-    ("Letter_21.6_27.9", "Letter (21.6x27.9 cm)", ""),
-    ("Legal_21.6_35.6", "Legal (21.6x35.6 cm)", ""),
-    ("Legal junior_20.3_12.7", "Legal junior (20.3x12.7 cm)", ""),
-    ("Ledger_43.2_27.9", "Ledger (43.2x27.9 cm)", ""),
-    ("Tabloid_27.9_43.2", "Tabloid (27.9x43.2 cm)", ""),
-
-    ("ANSI C_43.2_55.9", "ANSI C (43.2x55.9 cm)", ""),
-    ("ANSI D_55.9_86.4", "ANSI D (55.9x86.4 cm)", ""),
-    ("ANSI E_86.4_111.8", "ANSI E (86.4x111.8 cm)", ""),
-
-    ("Arch A_22.9_30.5", "Arch A (22.9x30.5 cm)", ""),
-    ("Arch B_30.5_45.7", "Arch B (30.5x45.7 cm)", ""),
-    ("Arch C_45.7_61.0", "Arch C (45.7x61.0 cm)", ""),
-    ("Arch D_61.0_91.4", "Arch D (61.0x91.4 cm)", ""),
-    ("Arch E_91.4_121.9", "Arch E (91.4x121.9 cm)", ""),
-    ("Arch E1_76.2_106.7", "Arch E1 (76.2x106.7 cm)", ""),
-    ("Arch E2_66.0_96.5", "Arch E2 (66.0x96.5 cm)", ""),
-    ("Arch E3_68.6_99.1", "Arch E3 (68.6x99.1 cm)", ""),
-    )
-
-
-def paper_enum_parse(idname):
-    tipo, dim_w, dim_h = idname.split("_")
-    return tipo, float(dim_w), float(dim_h)
-
-
-paper_presets_data = {idname: paper_enum_parse(idname)
-                      for idname, name, descr in paper_presets}
-
 
 def update_settings_cb(self, context):
-    # annoying workaround for recursive call
-    if update_settings_cb.level == False:
-        update_settings_cb.level = True
-        ps = self
-        rendersettings = context.scene.render
-        render_x_m = pixels_to_printed_m(rendersettings.resolution_x, ps)
-        render_y_m = pixels_to_printed_m(rendersettings.resolution_y, ps)
-        pixels_from_print(context, ps)
-        offset_camera(context)
-        if ps.add_scale_ratio_text:
-            height_max = ps.width_cm / m_TO_cm
-            if ps.text_height > height_max:
-                ps.text_height = height_max
-            #elif ps.text_height < height_min:
-            #    ps.text_height = height_min
-        if ps.use_margins:
-            # HORIZONTAL
-            margin_left_m = rel_to_abs_m(ps.margin_left, render_x_m)
-            margin_right_m = rel_to_abs_m(ps.margin_right, render_x_m)
-
-            length_available = render_x_m - margin_right_m
-            # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
-            if margin_left_m > length_available:
-                ps.margin_left = length_available
-
-            length_available = render_x_m - margin_left_m
-            # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
-            if margin_right_m > length_available:
-                ps.margin_right = length_available
-
-
-            # VERTICAL
-            margin_top_m = rel_to_abs_m(ps.margin_top, render_y_m)
-            margin_bottom_m = rel_to_abs_m(ps.margin_bottom, render_y_m)
-
-            length_available = render_y_m - margin_bottom_m
-            # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
-            if margin_top_m > length_available:
-                ps.margin_top = length_available
-
-            length_available = render_y_m - margin_top_m
-            # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
-            if margin_bottom_m > length_available:
-                ps.margin_bottom = length_available
-
-        if not ps.update_manually:
-            bpy.ops.render.apply_print_settings()
-
-        update_settings_cb.level = False
-
-update_settings_cb.level = False
+    stats.count('update_settings_cb')
+    # Within an edit session (see print_settings_batch) only remember that something changed:
+    if print_settings_batch.level:
+        print_settings_batch.pending = True
+        return
+    # Settings written while deriving (e.g. clamped margins) are taken care of by that derivation:
+    if update_print_settings.running:
+        return
+    # Only what depends on the changed settings is derived again (see DERIVED_SETTINGS):
+    update_print_settings_live(context)
 
 
 
 #
-# First parameter 'rel_or_abs' may be either relative or absolute.
-# If the value is already absolute then it itself is returned.
+# Edit session for the print settings:
+#
+#   with print_settings_batch(context) as ps:
+#       ps.preset = 'A3_29.7_42.0'
+#       ps.dpi = 600
+#       ps.margin_top = .02
 #
-def rel_to_abs_m(rel_or_abs, ref_size):
-    margin_m = rel_or_abs
-    if rel_or_abs >= 1:
-        # relative
-        margin_m = ref_size * rel_or_abs / 100.0
-    return margin_m
+# Suspends the update callbacks while the settings are changed and runs the update (and apply
+# unless updating manually) exactly once at the end instead of once per changed property.
+# Sessions may be nested, the outermost one applies. Sessions ended by an exception don't apply.
+#
+@contextlib.contextmanager
+def print_settings_batch(context):
+    ps = context.scene.print_settings
+    print_settings_batch.level += 1
+    finished = False
+    try:
+        yield ps
+        finished = True
+    finally:
+        outermost = print_settings_batch.level == 1
+        try:
+            # Half edited settings aren't applied:
+            if outermost and finished and print_settings_batch.pending:
+                # The level stays raised so what these write doesn't go through the update callbacks:
+                print2scale_processInput(ps, context)
+                # Not debounced, the settings are expected to be applied when the session ends:
+                update_print_settings(context)
+        finally:
+            print_settings_batch.level -= 1
+            if outermost:
+                print_settings_batch.pending = False
+
+print_settings_batch.level = 0
+print_settings_batch.pending = False
 
 
 
@@ -209,38 +185,29 @@ def offset_camera(context):
         return # no offset required if no margins.
     camera = context.scene.camera
     if camera:
-
-        margin_left_m = rel_to_abs_m(
-                ps.margin_left,
-                pixels_to_printed_m(context.scene.render.resolution_x, ps)
-                )
-        margin_right_m = rel_to_abs_m(
-                ps.margin_right,
-                pixels_to_printed_m(context.scene.render.resolution_x, ps)
+        delta_x, delta_y = geometry.camera_delta_offset(
+                (ps.margin_top, ps.margin_right, ps.margin_bottom, ps.margin_left),
+                pixels_to_printed_m(ps.width_px, ps),
+                pixels_to_printed_m(ps.height_px, ps)
                 )
-        camera.delta_location[0] = margin_left_m - margin_right_m
-
-        margin_top_m = rel_to_abs_m(
-                ps.margin_top,
-                pixels_to_printed_m(context.scene.render.resolution_y, ps)
-                )
-        margin_bottom_m = rel_to_abs_m(
-                ps.margin_bottom,
-                pixels_to_printed_m(context.scene.render.resolution_y, ps)
-                )
-        camera.delta_location[1] = margin_bottom_m - margin_top_m
+        camera.delta_location[0] = delta_x
+        camera.delta_location[1] = delta_y
 
 
 
 print2scale_scale_factor_previous = 1
 def print2scale_recalculate_camera_focal_length_or_orthographic_scale(self, context):
 
+    if print_settings_batch.level:
+        print_settings_batch.pending = True
+        return
+    if update_print_settings.running:
+        return
     # annoying workaround for recursive call
     if print2scale_recalculate_camera_focal_length_or_orthographic_scale.level == False:
         print2scale_recalculate_camera_focal_length_or_orthographic_scale.level = True
         print2scale_processInput(self, context)
-        if not self.update_manually:
-            print2scale(self, context)
+        update_print_settings_live(context)
         print2scale_recalculate_camera_focal_length_or_orthographic_scale.level = False
 
 print2scale_recalculate_camera_focal_length_or_orthographic_scale.level = False
@@ -278,11 +245,61 @@ def print2scale_processInput(self, context):
 
 
 
+def add_scale_ratio_text_cb(self, context):
+    if print_settings_batch.level:
+        print_settings_batch.pending = True
+        return
+    if update_print_settings.running:
+        return
+    update_print_settings_live(context)
+
+
+
 def print2scale(ps, context):
     print2scale__calculate_camera_paramaters(ps, context)
     print2scale_add_update_text(ps, context)
 
 
+#
+# Cache of the camera parameter calculation result.
+# Maps the camera name to the inputs the orthographic scale was calculated from and the result.
+#
+camera_parameters_cache = {}
+
+
+
+#
+# Everything the orthographic scale depends on.
+#
+def camera_parameters_key(ps, context):
+    rendersettings = context.scene.render
+    return (
+            ps.preset, ps.orientation, ps.width_cm, ps.height_cm, ps.dpi,
+            ps.use_margins, ps.margin_top, ps.margin_right, ps.margin_bottom, ps.margin_left,
+            ps.scale_factor,
+            rendersettings.resolution_x, rendersettings.resolution_y,
+            context.scene.unit_settings.scale_length
+            )
+
+
+
+#
+# Whether the scene camera still has the orthographic scale calculated for the current inputs.
+# The camera's own value is compared too, to notice when it was changed by hand.
+#
+def is_camera_parameters_cached(ps, context):
+    camera = context.scene.camera
+    if not camera or camera.type != 'CAMERA' or camera.data.type != 'ORTHO':
+        return False
+    cached = camera_parameters_cache.get(camera.name)
+    if not cached:
+        return False
+    key, ortho_scale = cached
+    return ortho_scale == camera.data.ortho_scale and key == camera_parameters_key(ps, context)
+
+
+
+@stats.timed('camera_parameters')
 def print2scale__calculate_camera_paramaters(ps, context):
     if (ps.print_to_scale):
 
@@ -299,6 +316,10 @@ def print2scale__calculate_camera_paramaters(ps, context):
         # At this point the scene must have a camera.
         #
 
+        # Nothing changed since this camera was last calculated (e.g. rendering many camera sheets):
+        if is_camera_parameters_cached(ps, context):
+            return
+
         #######
         # SET THE CAMERA's ZOOM OR ORTHOGRAPHIC SCALE
         #######
@@ -308,30 +329,13 @@ def print2scale__calculate_camera_paramaters(ps, context):
             return {'CANCELLED'}
 
 
-        longer_side = ps.height_cm / m_TO_cm
-
-        if ps.use_margins:
-            margin_top_m = rel_to_abs_m(
-                    ps.margin_top,
-                    pixels_to_printed_m(context.scene.render.resolution_y, ps)
-                    )
-            margin_bottom_m = rel_to_abs_m(
-                    ps.margin_bottom,
-                    pixels_to_printed_m(context.scene.render.resolution_y, ps)
-                    )
-            longer_side = longer_side - margin_top_m - margin_bottom_m
-        if (ps.width_cm > ps.height_cm): #if (ps.orientation == 'Landscape'):
-            longer_side = ps.width_cm / m_TO_cm
-            if ps.use_margins:
-                margin_left_m = rel_to_abs_m(
-                        ps.margin_left,
-                        pixels_to_printed_m(context.scene.render.resolution_x, ps)
-                        )
-                margin_right_m = rel_to_abs_m(
-                        ps.margin_right,
-                        pixels_to_printed_m(context.scene.render.resolution_x, ps)
-                        )
-                longer_side = longer_side - margin_left_m - margin_right_m
+        longer_side = geometry.longer_printable_side_m(
+                ps.width_cm, ps.height_cm,
+                (ps.margin_top, ps.margin_right, ps.margin_bottom, ps.margin_left),
+                pixels_to_printed_m(context.scene.render.resolution_x, ps),
+                pixels_to_printed_m(context.scene.render.resolution_y, ps),
+                use_margins=ps.use_margins
+                )
 
         #print('old ortho scale: ', context.scene.camera.data.ortho_scale)
         if not context.scene.camera.data.type == 'ORTHO':
@@ -351,8 +355,9 @@ def print2scale__calculate_camera_paramaters(ps, context):
             # <=> Orthographic_scale = H_format_real / unit_settings_scale_length / scale_factor
             #
             #print('unit setting: ', context.scene.unit_settings.scale_length, ' longer_side in meters: ', longer_side)
-            context.scene.camera.data.ortho_scale = (longer_side / context.scene.unit_settings.scale_length) / ps.scale_factor
+            context.scene.camera.data.ortho_scale = geometry.ortho_scale(longer_side, ps.scale_factor, context.scene.unit_settings.scale_length)
             zoom_result = context.scene.camera.data.ortho_scale
+            camera_parameters_cache[context.scene.camera.name] = (camera_parameters_key(ps, context), zoom_result)
 
 
         elif (context.scene.camera.data.type == 'PERSP'):
@@ -374,26 +379,12 @@ def print2scale_add_update_text(ps, context):
         ########
         # UPDATE THE TEXT OF THE SCALE RATIO TEXT OBJECT.
         #######
-        # Somehow this always gives None. So much to the topic scripting languages are quicker and while python is great, C/C++ would be straight forward.
-        #if (hasattr(ps, 'cache_scale_ratio_text_object')):
-        #    print('cache is: ' + str(ps.cache_scale_ratio_text_object))
-        #if (not hasattr(ps, 'cache_scale_ratio_text_object') or not ps.cache_scale_ratio_text_object):
-        scale_ratio_text_object = None
-        for o in context.scene.camera.children:
-            # to allow other text/font objects as camera children, check for scale_ratio too:
-            if (o and o.type == 'FONT' and o.name.find('scale_ratio') != -1):
-                scale_ratio_text_object = o
-                break
-        set_camera_as_parent = False
-        if not scale_ratio_text_object:
-            for o in context.scene.objects:
-                # to allow other text/font objects as camera children, check for scale_ratio too:
-                if (o and o.type == 'FONT' and o.name.find('scale_ratio') != -1):
-                    scale_ratio_text_object = o
-                    set_camera_as_parent = True # because it's not yet been parented.
-                    break
-
-        if (not scale_ratio_text_object and ps.add_scale_ratio_text):
+        scale_ratio_text_object = find_scale_ratio_text_object(context, ps)
+        # In overlay mode the scale ratio is composited onto the render instead (see annotation_labels):
+        use_text_object = ps.add_scale_ratio_text and ps.annotation_mode == 'OBJECT'
+        set_camera_as_parent = scale_ratio_text_object is not None and scale_ratio_text_object.parent != context.scene.camera # because it's not yet been parented.
+
+        if (not scale_ratio_text_object and use_text_object):
             # Add a text for the scale factor e.g. 1:10 on the print.
             scale_ratio_text_object = add_text(context, object_name="scale_ratio")
             scale_ratio_text_object.location[0] = 0
@@ -411,6 +402,7 @@ def print2scale_add_update_text(ps, context):
             #text_object.scale.x = object_scale * ps.scale_factor
             #text_object.scale.y = object_scale * ps.scale_factor
             #text_object.scale.z = object_scale * ps.scale_factor
+            remember_scale_ratio_text_object(ps, scale_ratio_text_object)
             set_camera_as_parent = True
 
         if scale_ratio_text_object and set_camera_as_parent:
@@ -441,13 +433,14 @@ def print2scale_add_update_text(ps, context):
 
         #######
         # Update scale ratio factor:
-        if scale_ratio_text_object and not ps.add_scale_ratio_text:
+        if scale_ratio_text_object and not use_text_object:
             # Remove the text object:
             #objects_to_be_deleted.append(scale_ratio_text_object)
             bpy.ops.object.select_all(action='DESELECT')
             context.scene.objects.active = scale_ratio_text_object
             context.scene.objects.active.select = True
             bpy.ops.object.delete()
+            ps.scale_ratio_text_object = ""
             return {'FINISHED'}
 
         elif not scale_ratio_text_object:
@@ -466,28 +459,81 @@ def print2scale_add_update_text(ps, context):
 
 
 
+#
+# Custom property marking the scale ratio text object, it survives renaming the object.
+#
+SCALE_RATIO_TEXT_TAG = 'scale_ratio'
+
+
+
+def remember_scale_ratio_text_object(ps, obj):
+    obj['render_to_print'] = SCALE_RATIO_TEXT_TAG
+    ps.scale_ratio_text_object = obj.name
+
+
+
+def is_scale_ratio_text_object(o):
+    # to allow other text/font objects as camera children, check for scale_ratio too:
+    return o and o.type == 'FONT' and (o.get('render_to_print') == SCALE_RATIO_TEXT_TAG or o.name.find('scale_ratio') != -1)
+
+
+
+#
+# The scale ratio text object is looked up by the name stored in the print settings.
+# Only if that fails (e.g. the object was renamed or deleted) the camera children and then
+# all scene objects are searched and the result is stored for the next time.
+#
+@stats.timed('scale_text_lookup')
+def find_scale_ratio_text_object(context, ps):
+    if ps.scale_ratio_text_object:
+        o = context.scene.objects.get(ps.scale_ratio_text_object)
+        if o and o.type == 'FONT' and o.get('render_to_print') == SCALE_RATIO_TEXT_TAG:
+            return o
+
+    scale_ratio_text_object = None
+    for o in context.scene.camera.children:
+        if is_scale_ratio_text_object(o):
+            scale_ratio_text_object = o
+            break
+    if not scale_ratio_text_object:
+        for o in context.scene.objects:
+            if is_scale_ratio_text_object(o):
+                scale_ratio_text_object = o
+                break
+
+    if scale_ratio_text_object:
+        remember_scale_ratio_text_object(ps, scale_ratio_text_object)
+    elif ps.scale_ratio_text_object:
+        ps.scale_ratio_text_object = ""
+    return scale_ratio_text_object
+
+
+
 def find_or_create_camera_and_assign(context):
-    if (context.scene.camera is None):
-        for scene_o in context.scene.objects:
-            if scene_o.type == 'CAMERA':
-                print("Assigning found camera %s to scene." % scene_o)
-                context.scene.camera = scene_o
-                context.scene.camera.layers = list(LAYERS_ALL)
-                return
+    scene = context.scene
+    if (scene.camera is not None):
+        return
+
+    for scene_o in scene.objects:
+        if scene_o.type == 'CAMERA':
+            print("Assigning found camera %s to scene." % scene_o)
+            scene.camera = scene_o
+            scene.camera.layers = list(LAYERS_ALL)
+            return
 
-    active_old = context.scene.objects.active
+    active_old = scene.objects.active
 
-    if (context.scene.camera is None):
-        # Create a camera:
-        bpy.ops.object.add('CAMERA', layers=list(LAYERS_ALL))
-        context.scene.camera = context.scene.objects.active
-        ##the added object keeps the short name, while the others are renamed
-        #context.scene.selected_object['Camera']
+    # Create a camera:
+    bpy.ops.object.add('CAMERA', layers=list(LAYERS_ALL))
+    scene.camera = scene.objects.active
+    ##the added object keeps the short name, while the others are renamed
+    #context.scene.selected_object['Camera']
 
-    context.scene.objects.active = active_old
+    scene.objects.active = active_old
 
 
 
+@stats.timed('set_parent')
 def set_parent(context, to_be_child_objects, parent_object):
 
     ######
@@ -523,8 +569,8 @@ def is_out_of_sync(context):
     if not ps.print_to_scale:
         return True
 
-    if not context.scene.camera or context.scene.camera.type != 'ORTHO':# or ps.camera_zoom_cache != context.scene.camera.ortho_scale: TODO Cache the camera parameter calculation result?
-        print2scale__calculate_camera_paramaters(ps, context) # <- Currently required until the scale ratio -> camera orthographic/perspective scale calculation result is cached?
+    if not is_camera_parameters_cached(ps, context):
+        print2scale__calculate_camera_paramaters(ps, context)
 
     return False
 
@@ -651,13 +697,11 @@ def position_in_bottom_left_corner(context, obj=None, ps=None):
 
 
 
+@stats.timed('position_within_render')
 def position_within_render(context, obj=None, ps=None):
     print('Positioning within render ...')
-    active_old = None
     if not obj:
         obj = context.scene.objects.active
-    else:
-        active_old = context.scene.objects.active
     if not obj:
         print('No object. obj: ', obj)
         return {'CANCELLED'}
@@ -669,234 +713,168 @@ def position_within_render(context, obj=None, ps=None):
         print(ps.width_px, context.scene.render.resolution_x, ps.height_px, context.scene.render.resolution_y)
         bpy.ops.render.apply_print_settings()
 
-    rendersettings = context.scene.render
-
     #Introduces bugs easily if margin is derived from initial object dimensions:ensure_height(obj=obj, print_settings=ps)
 
     #######
     # Position in a corner. Note: It is extra complicated in PERSPECTIVE mode which is TODO.
-    #SPACE_PER_CHAR = 2
+    MARGIN_TO_EDGE_HORIZONTAL, MARGIN_TO_EDGE_VERTICAL = positioning_margins_m(context, ps)
+
+    return place_within_render(context, obj, ps, MARGIN_TO_EDGE_HORIZONTAL, MARGIN_TO_EDGE_VERTICAL)
+
+
+
+#
+# The positioning margins (margin_left_right, margin_top_bottom) as printed in meters.
+#
+def positioning_margins_m(context, ps):
     # Extra margin also is required because dimensions of a text object can be smaller than the required space, because the center is a bit too far left because chars start farther to the right, e.g. a 1.
     if ps.margin_left_right >= 1.0: # interprete as percentage
-        MARGIN_TO_EDGE_HORIZONTAL = pixels_to_printed_m(context.scene.render.resolution_x, ps) * ps.margin_left_right / 100.0
+        margin_horizontal = pixels_to_printed_m(context.scene.render.resolution_x, ps) * ps.margin_left_right / 100.0
     else:
-        MARGIN_TO_EDGE_HORIZONTAL = ps.margin_left_right
+        margin_horizontal = ps.margin_left_right
 
     if ps.margin_top_bottom >= 1.0: # interprete as percentage
-        MARGIN_TO_EDGE_VERTICAL = pixels_to_printed_m(context.scene.render.resolution_y, ps) * ps.margin_top_bottom / 100.0
+        margin_vertical = pixels_to_printed_m(context.scene.render.resolution_y, ps) * ps.margin_top_bottom / 100.0
     else:
-        MARGIN_TO_EDGE_VERTICAL = ps.margin_top_bottom
+        margin_vertical = ps.margin_top_bottom
+    return margin_horizontal, margin_vertical
 
-    #MARGIN_TO_EDGE_VERTICAL /= ps.scale_factor
-    #MARGIN_TO_EDGE_HORIZONTAL /= ps.scale_factor
-    #print('MARGIN_TO_EDGE_HORIZONTAL: ', MARGIN_TO_EDGE_HORIZONTAL)
-    #print('MARGIN_TO_EDGE_VERTICAL: ', MARGIN_TO_EDGE_VERTICAL)
 
-    # x = camera origin.x (global) + render sizeX / 2 - space * number_of_characters
-    smallest_index, second_largest_index, largest_index = get_smallest_central_and_largest(obj.dimensions)
-    req_space_x = obj.dimensions[largest_index] / 2.0# * zoom_result
-    req_space_y = obj.dimensions[second_largest_index] / 2.0# * zoom_result
-    req_space_z = obj.dimensions[smallest_index] / 2.0# * zoom_result
-    #print('Object dimensions: ' + str(obj.dimensions))
-
-    # Allow to restore the initial origin later: (NOTE This depends on the blender functionality that setting the origin maintains the position.)
-    #TODO Determine why poll function fails:
-    #bpy.ops.view3d.snap_cursor_to_active()
-    #origin_old = context.scene.cursor_location
-
-    # TODO Correct the wrong math, to allow for reusing blender functionality.
-    p = obj.parent
-    if p:
-        bpy.ops.object.parent_clear(type='CLEAR')
-    ## clear rotation temporarily:
-    #rotation_old = obj.rotation.copy()
-    #obj.rotation = [0.0, 0.0, 0.0]
-    origin_old = obj.location + obj.delta_location#TODO Calc rotation matrix from obj.rotation_* # because origin_set influences location only.
-    #bpy.ops.object.location_clear()
-    #obj.delta_location = [0.0, 0.0, 0.0]
-    # HACK Works around the need to execute position within render twice. TODO Why is rotation clear a fix for this weirdness?
-    bpy.ops.object.rotation_clear()
-    obj.location[0] = 0
-    obj.location[1] = 0
-    obj.location[2] = 0
-    location_old = obj.location.copy()
-    delta_location_old = obj.delta_location.copy()
-    #print("origin_old: ", origin_old)
-    #if not p:
-    #    # No parent => Use the camera as this is the soon to be parent.
-    #    p = context.scene.camera
-    #origin_old = p.location + obj.location * p.matrix_world + obj.delta_location * obj.matrix_world * p.matrix_world
-    bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')#, center='BOUNDS')
-    # Create a delta, such that the missing parent information doesn't matter:
-    origin_delta = location_old - obj.location
-    #origin_new = obj.location + obj.delta_location
-    #origin_delta = origin_new - origin_old
-    #print("origin_delta: ", origin_delta, " from location_old: ", location_old, " - location: ", obj.location)
 
+#
+# Positions many objects within the render in one pass, see geometry.layout_boxes for the layouts.
+# The camera and the print settings are resolved and synced once for all objects.
+#
+def position_many_within_render(context, objects, ps=None, layout='GRID', corner='TOP_LEFT', columns=0, spacing=.005):
+    print('Positioning %s objects within render ...' % len(objects))
+    if not objects:
+        return {'CANCELLED'}
+    if not ps:
+        ps = context.scene.print_settings
+    find_or_create_camera_and_assign(context)
+
+    if is_out_of_sync(context):
+        bpy.ops.render.apply_print_settings()
+
+    camera = context.scene.camera
+    objects = [o for o in objects if o != camera]
+    rendersettings = context.scene.render
+    margin_horizontal, margin_vertical = positioning_margins_m(context, ps)
+
+    # Printed sizes:
+    sizes = []
+    for o in objects:
+        bounds_min, bounds_max = local_bounds(o)
+        sizes.append((
+                abs(bounds_max[0] - bounds_min[0]) * abs(o.scale[0] * o.delta_scale[0]) * ps.scale_factor,
+                abs(bounds_max[1] - bounds_min[1]) * abs(o.scale[1] * o.delta_scale[1]) * ps.scale_factor
+                ))
+
+    offsets = geometry.layout_boxes(
+            sizes,
+            pixels_to_printed_m(rendersettings.resolution_x, ps),
+            pixels_to_printed_m(rendersettings.resolution_y, ps),
+            margin_horizontal, margin_vertical,
+            layout=layout, corner=corner, columns=columns, spacing=spacing
+            )
+    for o, (offset_left, offset_top) in zip(objects, offsets):
+        place_within_render(context, o, ps, offset_left, offset_top, camera=camera)
+
+    return {'FINISHED'}
+
+
+
+#
+# Places the object in front of the camera such that its bounds start offset_left_m and offset_top_m
+# (as printed) from the left and top edge of the render.
+#
+# Operator free: The placement is computed from the camera frame and the object's local bounds,
+# neither the selection, the 3D cursor nor the object's origin are touched.
+#
+@stats.timed('place_within_render')
+def place_within_render(context, obj, ps, offset_left_m, offset_top_m, camera=None):
+    if not camera:
+        camera = context.scene.camera
+    rendersettings = context.scene.render
 
     #    Camera -
     #     | |   |
     #    |   |  z
     #   |     | |
-    #   |--x--| -   Assuming global Z-axis location is the greatest may not be always true.
-    # So better determine the biggest distance to scene's center first (I think this won't
-    # work without taking care of the camera's local/delta rotation)?
-    # Instead of scene center in this case it might be favourable to use all the objects' medians' median.
-    # Not to forget that the camera object's rotation is crucial as it influences the direction of the render
-    # resolution x and y. So this is TODO if the parenting approach fails but it ain't (inheriting the camera
-    # rotation is easiest).
-    x = - pixels_to_printed_m(rendersettings.resolution_x, ps) / 2.0 + MARGIN_TO_EDGE_HORIZONTAL + req_space_x * ps.scale_factor # Because the object's origin is moved to the center explicitely.
-    y = pixels_to_printed_m(rendersettings.resolution_y, ps) / 2.0 - MARGIN_TO_EDGE_VERTICAL - req_space_y * ps.scale_factor
-    print("x: %s y: %s scale_factor: %s " % (x, y, ps.scale_factor))
-    #if ps.scale_factor >= 1.0:
+    #   |--x--| -
+    # The object inherits the camera's rotation, hence its own rotation is cleared and the placement
+    # happens in the camera's local frame (x to the right, y upwards, looking along negative z).
+    obj.rotation_euler.zero()
+    obj.rotation_quaternion.identity()
+    obj.rotation_axis_angle = (0.0, 0.0, 1.0, 0.0)
+
+    # The remaining linear transform is the delta rotation and the (delta) scale:
+    if obj.rotation_mode == 'QUATERNION':
+        delta_rotation = obj.delta_rotation_quaternion.to_matrix()
+    elif obj.rotation_mode == 'AXIS_ANGLE':
+        delta_rotation = Matrix.Identity(3)
+    else:
+        delta_rotation = obj.delta_rotation_euler.to_matrix()
+    scale = [obj.scale[i] * obj.delta_scale[i] for i in range(3)]
+
+    bounds_min, bounds_max = local_bounds(obj)
+    center = delta_rotation * Vector([(bounds_min[i] + bounds_max[i]) / 2.0 * scale[i] for i in range(3)])
+    req_space = [abs(bounds_max[i] - bounds_min[i]) * abs(scale[i]) / 2.0 for i in range(3)]
+
+    x = - pixels_to_printed_m(rendersettings.resolution_x, ps) / 2.0 + offset_left_m + req_space[0] * ps.scale_factor
+    y = pixels_to_printed_m(rendersettings.resolution_y, ps) / 2.0 - offset_top_m - req_space[1] * ps.scale_factor
+    #print("x: %s y: %s scale_factor: %s " % (x, y, ps.scale_factor))
     x /= ps.scale_factor
     y /= ps.scale_factor
-    #elif ps.scale_factor < 1.0:
-    #    x /= ps.scale_factor * 4
-    #    y /= ps.scale_factor
     #TODO debug scale length. x = x / context.scene.unit_settings.scale_length
-    #y = y / context.scene.unit_settings.scale_length
     # Because the camera's z axis points in the direction of the incoming rays, parenting and offsetting in negative Z direction is enough:
-    z = -.1 - req_space_z # Along the camera's normal (Z) axis. (To move it out of the clipping minimum distance.)
-    #z = z / context.scene.unit_settings.scale_length / ps.scale_factor
-    obj.delta_location = (x, y, z)
-    #print('Object.Delta Location: ' + str(obj.delta_location.x) + ', ' +  str(obj.delta_location.y) + ', ' + str(obj.delta_location.z) )
-
-
-    # Restore the original origin, maintaining the overall location:
-    #origin_new = obj.location + obj.delta_location #TODO Rotation.
-    ##if obj.parent: # should have a parent object (camera).
-    #origin_new = origin_new + obj.parent.location
-    #origin_old_relative = origin_old - origin_new # tip - foot
-    #context.scene.cursor_location = origin_old
-    #context.scene.cursor_location += origin_delta
-    #context.scene.cursor_location = origin_new - origin_delta # valid, because the parent object was cleared.
-    delta_location_delta = obj.delta_location - delta_location_old
-    cursor_location_old = context.scene.cursor_location.copy()
-    context.scene.cursor_location = origin_old + delta_location_delta # valid, because the parent object was cleared
-    #raise Error
-    bpy.ops.object.origin_set(type='ORIGIN_CURSOR')#, center='BOUNDS')
-    context.scene.cursor_location = cursor_location_old
-
-    # Adapt the delta location to take the origin offset into account:
-    # Remove the LOCAL_WITH_PARENT transform first, remember the old:
-    # TODO Simply calculate the rotation matrix Rot(axis, angle) manually from obj.rotation_angles.
-    #matrix_world_old = obj.matrix_world.copy()
-    #matrix_world_without_parent = obj.convert_space(matrix=obj.matrix_world, from_space='LOCAL_WITH_PARENT', to_space='LOCAL')
-    #obj.matrix_world = matrix_world_without_parent
-    # With the transform removed, the object is effectively in world/most global space, hence the delta can be applied:
-    # Possible because the origin delta is linear to the object's dimensions!
-    obj.delta_location += origin_delta
-
-    #print('origin_delta:   ', origin_delta)
-    #print('delta_location: ', obj.delta_location)
-    #th_i, h_i, w_i = get_smallest_central_and_largest(origin_delta)
-    #if obj.delta_location[largest_index] < 0:
-    #    obj.delta_location[largest_index] += abs(origin_delta[w_i])
-    #else:
-    #    obj.delta_location[largest_index] -= abs(origin_delta[w_i])
-    #
-    #if obj.delta_location[second_largest_index] < 0:
-    #    obj.delta_location[second_largest_index] += abs(origin_delta[h_i])
-    #else:
-    #    obj.delta_location[second_largest_index] -= abs(origin_delta[h_i])
-
-    #obj.delta_location[smallest_index] -= origin_delta[th_i]
-
-    #obj.matrix_world = matrix_world_old * Matrix([1,0,0],[0,1,0],[0,0,1], origin_delta)
-    #obj.rotation = rotation_old
+    z = -.1 - req_space[2] # Along the camera's normal (Z) axis. (To move it out of the clipping minimum distance.)
 
     # Set camera as parent if necessary:
     if not obj.parent:
-       set_parent(context, to_be_child_objects=[obj], parent_object=context.scene.camera)
+        obj.parent = camera
     elif obj.parent.type != 'CAMERA':
         print("obj: ", obj, " shall be positioned within render area, but does have another object assigned as parent: ", obj.parent)
-    # TODO Remove once the delta position in combination with parenting isn't buggy anymore. This works around random object position (sometimes at least, which is weird too):
+    if obj.parent == camera:
+        # Local coordinates are camera coordinates:
+        obj.matrix_parent_inverse.identity()
     obj.parent_type = 'OBJECT'
-    bpy.ops.object.select_all(action='DESELECT')
-    context.scene.objects.active = obj
-    context.scene.objects.active.select = True
-    #bpy.ops.object.transform_apply(rotation=True)#, location=False, scale=False)
-    bpy.ops.object.rotation_clear()
-
-    #context.scene.cursor_location = obj.parent.location + obj.parent.delta_location + (origin_old + delta_location_delta) * obj.matrix_parent_inverse # valid, because the parent object was cleared.
 
-    if active_old:
-        context.scene.objects.active = active_old
+    # The bounds' center ends up at (x, y, z):
+    obj.location = (0.0, 0.0, 0.0)
+    obj.delta_location = Vector((x, y, z)) - center
+    #print('Object.Delta Location: ' + str(obj.delta_location.x) + ', ' +  str(obj.delta_location.y) + ', ' + str(obj.delta_location.z) )
 
     return {'FINISHED'}
 
 
 
-def get_smallest_central_and_largest(vector_3d):
-    x = vector_3d[0]
-    y = vector_3d[1]
-    z = vector_3d[2]
-    #print("get_smallest_central_and_largest(): vector_3d: ", vector_3d)
-    # By default it is assumed that the text is looked onto directly from positive Z axis towards negative Z axis.
-    second_largest_index = 0
-    largest_index = 2
-    smallest_index = 1
-    if x > y and x <= z or x > z and x <= y:
-        second_largest_index = 0
-        largest_index = 1
-        smallest_index = 2
-        if z > y:
-            largest_index = 2
-            smallest_index = 1
-    elif y > x and y <= z or y > z and y <= x:
-        second_largest_index = 1
-        largest_index = 0
-        smallest_index = 2
-        if z > x:
-            largest_index = 2
-            smallest_index = 0
-    elif z > x and z <= y or z > y and z <= x:
-        second_largest_index = 2
-        largest_index = 0
-        smallest_index = 1
-        if y > x:
-            largest_index = 1
-            smallest_index = 0
-
-    #else: # All are equal length, just stick to x.
-    # There had been a bug if two are equal and one differs. Then the wrong one is picked as second longest. While the transition from the < to the <= operator works around this bug, sorting a list instead might still be useful for performance (because random access in a list is constant).
-    return smallest_index, second_largest_index, largest_index
-
-
-
 #
 # Changes the text of a text object.
 # By default clears the text to an empty string.
 #
+# The text curve's body is written directly, which neither touches the selection nor switches modes
+# and hence works for hidden objects too.
+#
+@stats.timed('change_text')
 def change_text(context, text_object, text=""):
     if not text_object:
         print('No text object: ', text_object)
+        return {'CANCELLED'}
     if not context:
         print('No context: ', context)
 
-    # Make sure nothing is selected:
-    #if len(context.selected_objects) > 0: complains about context.
-    bpy.ops.object.select_all(action='DESELECT')
+    if (text_object.type != 'FONT'):
+        print('Notice: Could not set scale ratio text representation because object appears to be no text/font object: ' + str(text_object))
+        return {'CANCELLED'}
 
-    context.scene.objects.active = text_object
-    context.scene.objects.active.select = True
+    # While in edit mode the edit buffer would overwrite the body when leaving edit mode:
+    if context and context.mode == 'EDIT_TEXT' and context.scene.objects.active == text_object:
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
-    # Enter edit mode:
-    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-    if (not text_object.is_visible):
-        print("Notice: Could not change text of text object because the object isn't visible currently.")
-    elif (text_object.type == 'FONT'):
-        bpy.ops.font.select_all()
-        bpy.ops.font.text_cut()
+    if text_object.data.body != text:
         print('setting text: ' + text)
-        bpy.ops.font.text_insert(text=text)
-    else:
-        print('Notice: Could not set scale ratio text representation because object appears to be no text/font object: ' + text_object)
-
-    # Leave editmode to objectmode:
-    #bpy.ops.object.editmode_toggle()
-    bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+        text_object.data.body = text
     return {'FINISHED'}
 
 
@@ -941,6 +919,7 @@ def add_text(context, text="", object_name="", print_settings=None):
 # If no desired height is given, then constants are resolved.
 # If none are found, the print settings are evaluated for a text height.
 # If still no desired height could be determined, it defaults to .01 meter resulting height.
+@stats.timed('ensure_height')
 def ensure_height(obj, print_settings, resulting_height=0.0):
     # Reset scale for the case the value was set to zero earlier (which leads to division by zero):
     #obj.scale.x = 1.0
@@ -969,93 +948,138 @@ def ensure_height(obj, print_settings, resulting_height=0.0):
         print("Desired resulting height (as printed) is invalid: %s => Defaulting to 0, i.e. invisible." % resulting_height)
 
     # Assumption: text object's width is largest. Height is 2nd longest. Depth/thickness comes third.
-    # TODO Figuring text height directly possible?
-    smallest_index, second_largest_index, largest_index = get_smallest_central_and_largest(obj.dimensions)
-    #print("object dimensions: ", obj.dimensions, " smallest: ", smallest_index, " central: ", second_largest_index, " largest: ", largest_index)
-    object_height = obj.dimensions[second_largest_index]
+    # The local bounds don't depend on the object's scale, so the new scale can be set in one step
+    # without waiting for the scene to be evaluated (no more EDIT/OBJECT mode toggling).
+    bounds_min, bounds_max = local_bounds(obj)
+    dimensions = [(bounds_max[i] - bounds_min[i]) * abs(obj.scale[i]) for i in range(3)]
+    smallest_index, second_largest_index, largest_index = get_smallest_central_and_largest(dimensions)
+    #print("object dimensions: ", dimensions, " smallest: ", smallest_index, " central: ", second_largest_index, " largest: ", largest_index)
+    object_height = dimensions[second_largest_index]
     #print(object_height, ' target height: ', target_height)
+    if not object_height:
+        print("Notice: Could not ensure height of object %s because it has no height." % obj)
+        return {'CANCELLED'}
     # The height determines the scale factor, the other dimensions are scaled with the same factor to avoid distortion:
     scale_factor = target_height / object_height
-    #target_dim = obj.dimensions * scale_factor # Vector times scalar.
-    #scale_object_to_target_dimensions(target_dim=target_dim)
-    obj.scale.x *= scale_factor
-    obj.scale.y *= scale_factor
-    obj.scale.z *= scale_factor
-    # Workaround scale not taking effect until mode was toggled:
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    obj.scale = [obj.scale[i] * scale_factor for i in range(3)]
 
     return {'FINISHED'}
 
 
 
-def convertScaleFactorToRatioString(scale_factor, precision=2):
-    text = None
-    if (scale_factor < 1):
-        num = scale_factor
-        #while str(num).find('.') != -1:
-        #denominator = 1
-        #while round(num * denominator, 0) != num * denominator:
-        #    denominator = denominator * 10
-        if (num != 0):
-            rounded = round(1 / num, precision)
-            rounded_to_integer = round(rounded, 0)
-            if rounded_to_integer == rounded:
-                rounded = int(rounded_to_integer)
-            text = ' 1:' + str(rounded)
+#
+# Local bounds of text objects, cached per fonts and body and everything else shaping the glyphs.
+#
+text_bounds_cache = {}
+TEXT_BOUNDS_CACHE_SIZE = 4096
+
+
+
+def text_bounds_key(text_curve):
+    return (
+            tuple(f.name if f else '' for f in (text_curve.font, text_curve.font_bold, text_curve.font_italic, text_curve.font_bold_italic)),
+            text_curve.body,
+            tuple((c.use_bold, c.use_italic, c.use_underline, getattr(c, 'use_small_caps', False)) for c in text_curve.body_format),
+            text_curve.size, text_curve.shear, text_curve.small_caps_scale,
+            text_curve.space_line, text_curve.space_word, text_curve.space_character,
+            text_curve.offset_x, text_curve.offset_y,
+            text_curve.underline_position, text_curve.underline_height,
+            getattr(text_curve, 'align_x', getattr(text_curve, 'align', '')), getattr(text_curve, 'align_y', ''),
+            tuple((b.x, b.y, b.width, b.height) for b in text_curve.text_boxes),
+            text_curve.family, text_curve.follow_curve.name if text_curve.follow_curve else '',
+            text_curve.resolution_u, text_curve.render_resolution_u,
+            text_curve.extrude, text_curve.bevel_depth, text_curve.bevel_resolution, text_curve.offset
+            )
+
+
+
+#
+# The bounds of the text object's glyphs, evaluated for this object only (no scene update).
+#
+def measure_text_bounds(obj):
+    mesh = obj.to_mesh(bpy.context.scene, False, 'PREVIEW')
+    try:
+        if not mesh.vertices:
+            return [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+        coordinates = array.array('f', [0.0]) * (len(mesh.vertices) * 3)
+        mesh.vertices.foreach_get('co', coordinates)
+        return ([min(coordinates[i::3]) for i in range(3)], [max(coordinates[i::3]) for i in range(3)])
+    finally:
+        bpy.data.meshes.remove(mesh)
 
-    else:
-        rounded = round(scale_factor, precision)
-        rounded_to_integer = round(rounded, 0)
-        if rounded_to_integer == rounded:
-            rounded = int(rounded_to_integer)
-        text = str(rounded) + ':1'
 
-    return text
 
+#
+# Returns the bounding box corners (min, max) of the object in its local space, i.e. unscaled.
+#
+# A text object's bound box lags behind until the scene is evaluated. Instead of evaluating the
+# whole scene, text not seen before is measured by evaluating the text object alone and cached.
+#
+def local_bounds(obj):
+    if obj.type != 'FONT':
+        bounds_min = [min(corner[i] for corner in obj.bound_box) for i in range(3)]
+        bounds_max = [max(corner[i] for corner in obj.bound_box) for i in range(3)]
+        return bounds_min, bounds_max
 
-in_TO_cm = 2.54 # conversion factor
+    key = text_bounds_key(obj.data)
+    bounds = text_bounds_cache.get(key)
+    if bounds:
+        return bounds
+    bounds = measure_text_bounds(obj)
+    if len(text_bounds_cache) >= TEXT_BOUNDS_CACHE_SIZE:
+        text_bounds_cache.clear()
+    text_bounds_cache[key] = bounds
+    return bounds
 
 
 
 #def printed_distance_to_pixel(resulting_distance_m):
 def printed_m_to_pixels(m, ps): # inline function
-    return round(m * m_TO_cm / in_TO_cm * float(ps.dpi))
+    return geometry.printed_m_to_pixels(m, ps.dpi)
 
 
 
 def derive_width_pixels(context, ps):
-    m = ps.width_cm / m_TO_cm
-    if ps.use_margins:
-        m = m - rel_to_abs_m(ps.margin_left, pixels_to_printed_m(context.scene.render.resolution_x, ps)) - rel_to_abs_m(ps.margin_right, pixels_to_printed_m(context.scene.render.resolution_x, ps))
-    ps.width_px = max(printed_m_to_pixels(m, ps), 4)
+    ps.width_px = geometry.printable_pixels(
+            ps.width_cm, ps.dpi,
+            ps.margin_left, ps.margin_right,
+            pixels_to_printed_m(context.scene.render.resolution_x, ps),
+            use_margins=ps.use_margins
+            )
 
 
 
 def derive_height_pixels(context, ps):
-    m = ps.height_cm / m_TO_cm
-    if ps.use_margins:
-        m = m - rel_to_abs_m(ps.margin_top, pixels_to_printed_m(context.scene.render.resolution_y, ps)) - rel_to_abs_m(ps.margin_bottom, pixels_to_printed_m(context.scene.render.resolution_y, ps))
-    ps.height_px = max(printed_m_to_pixels(m, ps), 4)
+    ps.height_px = geometry.printable_pixels(
+            ps.height_cm, ps.dpi,
+            ps.margin_top, ps.margin_bottom,
+            pixels_to_printed_m(context.scene.render.resolution_y, ps),
+            use_margins=ps.use_margins
+            )
 
 
 
 def pixels_to_printed_m(pixel, ps):
-    return float(pixel) / float(ps.dpi) * in_TO_cm / m_TO_cm
+    return geometry.pixels_to_printed_m(pixel, ps.dpi)
 
 
 
+@stats.timed('pixels_from_print')
 def pixels_from_print(context, ps):
     tipo, dim_w, dim_h = paper_presets_data[ps.preset]
 
-    if tipo != "custom":
-        # (Re)load all parameters from the preset:
+    if tipo == "roll":
+        # The roll's width is fixed, the length is up to the user (height, or width in landscape):
         if ps.orientation == "Landscape":
-            ps.width_cm = dim_h
             ps.height_cm = dim_w
-        elif ps.orientation == "Portrait":
+        else:
             ps.width_cm = dim_w
-            ps.height_cm = dim_h
+        derive_width_pixels(context, ps)
+        derive_height_pixels(context, ps)
+
+    elif tipo != "custom":
+        # (Re)load all parameters from the preset:
+        ps.width_cm, ps.height_cm = geometry.sheet_size_cm(dim_w, dim_h, ps.orientation)
         # Update potentially outdated pixel values:
         derive_width_pixels(context, ps)
         derive_height_pixels(context, ps)
@@ -1095,6 +1119,203 @@ def pixels_from_print(context, ps):
 
 
 
+#
+# BOUNDS
+#
+# World space bounding box corners of all objects of a scene, cached per scene. The boxes and
+# world matrices are read in bulk (foreach_get) and transformed in one NumPy pass.
+# bounds_cache_update_cb counts the object updates reported after scene updates. While that count
+# and the objects of the scene don't change the cached bounds are returned as they are, otherwise
+# the bulk read is compared to the cached one and only changed objects are transformed again
+# (their change counter increases).
+#
+def world_bounds(scene):
+    cached = world_bounds.cache.get(scene.name)
+    names = scene.objects.keys()
+    if cached and cached['generation'] == world_bounds.generation and cached['names'] == names:
+        return cached
+
+    boxes, matrices = read_bounds_and_matrices(scene.objects)
+    if cached and cached['names'] == names:
+        changed = (boxes != cached['boxes']).any(axis=(1, 2)) | (matrices != cached['matrices']).any(axis=(1, 2))
+        corners = cached['corners'].copy()
+        counters = cached['counters'] + changed
+    else:
+        changed = numpy.ones(len(names), dtype=bool)
+        corners = numpy.empty((len(names), 8, 3), dtype=numpy.float64)
+        counters = numpy.zeros(len(names), dtype=numpy.int64)
+    if changed.any():
+        m = matrices[changed]
+        corners[changed] = numpy.einsum('nij,nkj->nki', m[:, :3, :3], boxes[changed]) + m[:, numpy.newaxis, :3, 3]
+
+    cached = {
+            'generation': world_bounds.generation,
+            'names': names,
+            'index': {name: i for i, name in enumerate(names)},
+            'boxes': boxes, 'matrices': matrices,
+            'corners': corners,
+            'counters': counters
+            }
+    world_bounds.cache[scene.name] = cached
+    return cached
+
+# Maps the scene name to its cached bounds.
+world_bounds.cache = {}
+# Increased by bounds_cache_update_cb whenever objects were updated.
+world_bounds.generation = 0
+
+
+
+#
+# Local bounding boxes (n, 8, 3) and world matrices (n, 4, 4) of all objects of the collection.
+#
+def read_bounds_and_matrices(collection):
+    count = len(collection)
+    boxes = numpy.empty(count * 24, dtype=numpy.float32)
+    matrices = numpy.empty(count * 16, dtype=numpy.float32)
+    try:
+        collection.foreach_get('bound_box', boxes)
+        collection.foreach_get('matrix_world', matrices)
+        # The matrices are stored column by column:
+        matrices = matrices.reshape(count, 4, 4).transpose(0, 2, 1)
+    except (TypeError, RuntimeError):
+        boxes = numpy.array([[tuple(c) for c in o.bound_box] for o in collection], dtype=numpy.float32)
+        matrices = numpy.array([[tuple(row) for row in o.matrix_world] for o in collection], dtype=numpy.float32)
+    return boxes.reshape(count, 8, 3), matrices.reshape(count, 4, 4)
+
+
+
+#
+# The bounds (min, max) of the objects' bounding boxes in the camera's local space
+# (x to the right, y upwards, looking along negative z), as arrays of shape (n, 3).
+#
+def camera_space_bounds(scene, camera, objects):
+    camera_inverse = camera.matrix_world.inverted()
+    if numpy is None:
+        bounds_min, bounds_max = [], []
+        for o in objects:
+            matrix = camera_inverse * o.matrix_world
+            corners = [matrix * Vector(corner) for corner in o.bound_box]
+            bounds_min.append([min(c[i] for c in corners) for i in range(3)])
+            bounds_max.append([max(c[i] for c in corners) for i in range(3)])
+        return bounds_min, bounds_max
+
+    bounds = world_bounds(scene)
+    rows = [bounds['index'][o.name] for o in objects]
+    matrix = numpy.array([tuple(row) for row in camera_inverse], dtype=numpy.float64)
+    corners = bounds['corners'][rows].dot(matrix[:3, :3].T) + matrix[:3, 3]
+    return corners.min(axis=1), corners.max(axis=1)
+
+
+
+#
+# Runs after every scene update, hence checks the collection's flag only. Which objects changed is
+# found by world_bounds comparing the bulk read, objects linked or unlinked change the names.
+#
+@persistent
+def bounds_cache_update_cb(scene):
+    if bpy.data.objects.is_updated:
+        world_bounds.generation += 1
+
+
+
+@persistent
+def bounds_cache_load_cb(dummy):
+    world_bounds.cache.clear()
+
+
+
+#
+# FIT SCALE
+#
+# The extent of the objects in the camera's frame (x to the right, y upwards), read in bulk:
+# mesh vertices via foreach_get, everything else (and meshes with modifiers) via the bounding boxes
+# (see world_bounds).
+# Returns (min_x, min_y, max_x, max_y) in blender units or None if there is nothing to frame.
+#
+def camera_space_extent(scene, objects, camera):
+    bounds = []
+    boxed = objects
+    if numpy is not None:
+        camera_inverse = camera.matrix_world.inverted()
+        mesh_coordinates = {}
+        boxed = []
+        for o in objects:
+            if o.type != 'MESH' or o.modifiers or not len(o.data.vertices):
+                boxed.append(o)
+                continue
+            coordinates = mesh_coordinates.get(o.data.name)
+            if coordinates is None:
+                coordinates = numpy.empty(len(o.data.vertices) * 3, dtype=numpy.float32)
+                o.data.vertices.foreach_get('co', coordinates)
+                coordinates = mesh_coordinates[o.data.name] = coordinates.reshape(-1, 3)
+            # Only x and y in the camera frame are of interest:
+            matrix = numpy.array([tuple(row) for row in camera_inverse * o.matrix_world][:2], dtype=numpy.float64)
+            projected = coordinates.dot(matrix[:, :3].T) + matrix[:, 3]
+            bounds.append(tuple(projected.min(axis=0)) + tuple(projected.max(axis=0)))
+
+    # The others by their (cached) bounding boxes:
+    if boxed:
+        for bounds_min, bounds_max in zip(*camera_space_bounds(scene, camera, boxed)):
+            bounds.append((bounds_min[0], bounds_min[1], bounds_max[0], bounds_max[1]))
+
+    if not bounds:
+        return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+
+#
+# Objects the scale is fitted to: the selected or else all visible renderable objects,
+# except the camera and the scale ratio text which follow the camera.
+#
+def fit_scale_objects(context):
+    scene = context.scene
+    objects = [o for o in context.selected_objects if o.type in RENDERABLE_TYPES]
+    if not objects:
+        objects = [o for o in scene.objects if o.type in RENDERABLE_TYPES and not o.hide_render and o.is_visible(scene)]
+    return [o for o in objects if not is_scale_ratio_text_object(o) and o.parent != scene.camera]
+
+
+
+#
+# Picks the largest standard scale (see geometry.STANDARD_SCALES) at which the objects fit the
+# printable area and sets it as the scale factor, which updates and applies like changing it by hand.
+# With center_camera the camera is moved (within its view plane) onto the objects' center first,
+# otherwise the objects have to fit around the current camera center.
+# Returns the scale factor or None if the objects don't fit at any scale.
+#
+def fit_scale(context, objects, center_camera=True, scales=geometry.STANDARD_SCALES):
+    ps = context.scene.print_settings
+    find_or_create_camera_and_assign(context)
+    camera = context.scene.camera
+    extent = camera_space_extent(context.scene, objects, camera)
+    if extent is None:
+        return None
+    min_x, min_y, max_x, max_y = extent
+
+    if center_camera:
+        center = Vector(((min_x + max_x) / 2.0, (min_y + max_y) / 2.0, 0.0))
+        matrix = camera.matrix_world.copy()
+        matrix.translation = matrix * center
+        camera.matrix_world = matrix
+        width, height = max_x - min_x, max_y - min_y
+    else:
+        width, height = 2 * max(abs(min_x), abs(max_x)), 2 * max(abs(min_y), abs(max_y))
+
+    # The printable area, i.e. the render size (margins are not rendered):
+    pixels_from_print(context, ps)
+    scale_factor = geometry.largest_fitting_scale(
+            width, height,
+            pixels_to_printed_m(ps.width_px, ps), pixels_to_printed_m(ps.height_px, ps),
+            scale_length=context.scene.unit_settings.scale_length, scales=scales
+            )
+    if scale_factor is not None and scale_factor != ps.scale_factor:
+        ps.scale_factor = scale_factor
+    return scale_factor
+
+
+
 class RENDER_PT_print(Panel):
     bl_label = "Render to Print"
     bl_space_type = 'PROPERTIES'
@@ -1118,6 +1339,7 @@ class RENDER_PT_print(Panel):
         row = layout.row(align=True)
         row.active = ps.print_to_scale
         row.prop(ps, "scale_factor", text="Scale factor")
+        row.operator("render.fit_scale", text="", icon="VIEWZOOM")
 
         row = layout.row(align=True)
         row.active = ps.print_to_scale
@@ -1127,10 +1349,17 @@ class RENDER_PT_print(Panel):
         row.active = ps.print_to_scale
         row.prop(ps, "text_height", text="Text height")
 
+        row = layout.row(align=True)
+        row.active = ps.print_to_scale
+        row.prop(ps, "annotation_mode", expand=True)
+        if ps.annotation_mode == 'OVERLAY':
+            row.prop(ps, "annotation_color", text="")
+
         row = layout.row(align=True)
         row.active = ps.print_to_scale
         #row.label("Positioning margins:")
         row.operator("object.position_within_render")#, icon="",
+        row.operator("object.position_selected_within_render", text="", icon="GROUP")
         row.prop(ps, "margin_left_right", text="Margin left, right.")
         row.prop(ps, "margin_top_bottom", text="Margin top, bottom.")
         #PRINT2SCALE -END
@@ -1180,6 +1409,8 @@ class RENDER_PT_print(Panel):
         row71 = row7
         row71.active = True
         row71.prop(ps, "update_manually")
+        if not ps.update_manually:
+            row71.prop(ps, "live_update_delay")
         #row = split.row()
         if ps.update_manually:
         #    row.active = True
@@ -1187,6 +1418,30 @@ class RENDER_PT_print(Panel):
         #    row.active = False
             row71.operator("render.apply_print_settings", icon="RENDER_STILL")
 
+        row8 = layout.row(align=True)
+        row8.prop(ps, "use_tiles")
+        row8.prop(ps, "tile_size")
+        row8.prop(ps, "tile_overlap")
+        row8.prop(ps, "tile_workers")
+        row8.operator("render.render_print_tiles", text="", icon="RENDER_REGION")
+
+        row9 = layout.row(align=True)
+        estimate = render_memory_estimate(context, ps.width_px, ps.height_px, tiled=ps.use_tiles)
+        row9.label("Render memory: ~%.0f MB%s" % (estimate['total'] / MB, " per tile" if ps.use_tiles else ""))
+        row9.prop(ps, "memory_budget")
+        row9.prop(ps, "memory_budget_action", text="")
+
+        row10 = layout.row(align=True)
+        row10.prop(ps, "use_profile")
+        row10.prop(ps, "profile_output", text="")
+        row10.active = ps.use_profile
+
+        row11 = layout.row(align=True)
+        row11.prop(ps, "use_render_cache")
+        row11.prop(ps, "render_cache_directory", text="")
+        row11.prop(ps, "render_cache_size")
+        row11.active = ps.use_render_cache
+
         # Hide UI elements when logic demands it:
         tipo = paper_presets_data[ps.preset][0]
 
@@ -1195,6 +1450,14 @@ class RENDER_PT_print(Panel):
             row.active = False
             row.enabled = False
 
+        if tipo == "roll":
+            # The length of the roll is set by hand:
+            row3.active = True
+            row3.enabled = True
+            row5.active = False
+            row5.enabled = False
+            return
+
         if ps.unit_from == "CM_TO_PIXELS":
             row5.active = False
             row5.enabled = False
@@ -1233,8 +1496,6 @@ class RENDER_PT_print(Panel):
                 row5.enabled = False
 
 
-m_TO_cm = 100.0
-
 class OBJECT_OT_text_change(Operator):
     bl_idname = "object.text_change"
     bl_label = "Change text."
@@ -1260,6 +1521,50 @@ class OBJECT_OT_position_within_render(Operator):
 
 
 
+class OBJECT_OT_position_selected_within_render(Operator):
+    '''Position all selected objects within render in one pass, stacked in a corner, along an edge or in a grid within the positioning margins.'''
+    bl_idname = "object.position_selected_within_render"
+    bl_label = "Position selected within render"
+    bl_description = "Position all selected objects within render in one pass, stacked in a corner, along an edge or in a grid within the positioning margins."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    layout = EnumProperty(
+            name="Layout",
+            items=(
+                ('CORNER', "Corner", "Stack the objects in a corner"),
+                ('EDGE', "Edge", "Flow the objects along the top or bottom edge"),
+                ('GRID', "Grid", "Lay out the objects in a grid")
+            ),
+            default='GRID',
+            )
+    corner = EnumProperty(
+            name="Corner",
+            items=(
+                ('TOP_LEFT', "Top left", ""),
+                ('TOP_RIGHT', "Top right", ""),
+                ('BOTTOM_LEFT', "Bottom left", ""),
+                ('BOTTOM_RIGHT', "Bottom right", "")
+            ),
+            default='TOP_LEFT',
+            )
+    columns = IntProperty(
+            name="Columns"
+            ,description="Number of grid columns, 0 for a square grid."
+            ,default=0
+            ,min=0
+    )
+    spacing = FloatProperty(
+            name="Spacing"
+            ,description="Blank space between the objects as printed (m)."
+            ,default=.005
+            ,min=0.0
+    )
+
+    def execute(self, context):
+        return position_many_within_render(context, list(context.selected_objects), layout=self.layout, corner=self.corner, columns=self.columns, spacing=self.spacing)
+
+
+
 class OBJECT_OT_position_in_top_left_corner(Operator):
     bl_idname = "object.position_in_top_left_corner"
     bl_label = "Position in top left corner."
@@ -1304,6 +1609,29 @@ class OBJECT_OT_position_in_bottom_left_corner(Operator):
 
 
 
+class RENDER_OT_fit_scale(Operator):
+    '''Choose the largest standard scale at which the selected objects fit the print.'''
+    bl_idname = "render.fit_scale"
+    bl_label = "Fit scale"
+    bl_description = "Choose the largest standard scale (1:1, 1:2, 1:5, 1:10, ...) at which the selected (or else all visible) objects fit the printable area."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    center_camera = BoolProperty(
+            name="Center camera",
+            description="Move the camera within its view plane onto the center of the objects",
+            default=True
+            )
+
+    def execute(self, context):
+        scale_factor = fit_scale(context, fit_scale_objects(context), center_camera=self.center_camera)
+        if scale_factor is None:
+            self.report({'ERROR'}, "The objects don't fit the print at any standard scale.")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Scale %s" % convertScaleFactorToRatioString(scale_factor).strip())
+        return {'FINISHED'}
+
+
+
 class RENDER_OT_ensure_height(Operator):
     bl_idname = "render.ensure_height"
     bl_label = "Ensure a certain printed height."
@@ -1325,6 +1653,13 @@ class RenderPrintSettings(PropertyGroup):
             ,default=False
             ,update=update_settings_cb
     )
+    live_update_delay = FloatProperty(
+            name="Apply delay"
+            ,description="Seconds the settings must stay unchanged before they are applied in realtime update, 0 applies on every change."
+            ,default=0.3
+            ,min=0.0
+            ,max=5.0
+    )
 
     unit_from = EnumProperty(
             name="Set from",
@@ -1377,14 +1712,14 @@ class RenderPrintSettings(PropertyGroup):
             name="Pixel Width",
             description="Pixel Width",
             default=900,
-            min=4, max=10000,
+            min=4, max=65536, soft_max=10000, # Beyond 10000 pixels rather render tiles (use_tiles).
             update=update_settings_cb,
             )
     height_px = IntProperty(
             name="Pixel Height",
             description="Pixel Height",
             default=600,
-            min=4, max=10000,
+            min=4, max=65536, soft_max=10000, # Beyond 10000 pixels rather render tiles (use_tiles).
             update=update_settings_cb,
             )
     #PRINT TO SCALE
@@ -1431,12 +1766,17 @@ class RenderPrintSettings(PropertyGroup):
             ,max=10000
             ,update=print2scale_recalculate_camera_focal_length_or_orthographic_scale
     )
-    #cache_scale_ratio_text_object = None # ObjectProperty or ReferenceProperty
+    # Name of the scale ratio text object, see find_scale_ratio_text_object.
+    scale_ratio_text_object = StringProperty(
+            name="Scale ratio text object"
+            ,description="The text object showing the scale ratio."
+            ,default=""
+    )
     add_scale_ratio_text = BoolProperty(
             name="Add scale ratio text."
             ,description="Whether to add a text representation of the scale factor (as ratio) or not."
             ,default=True
-            ,update=print2scale#_reset_camera_focal_length_or_orthographic_scale
+            ,update=add_scale_ratio_text_cb#_reset_camera_focal_length_or_orthographic_scale
     )
     # Remapping probably will lead to much confusion. e.g. model 10 -> 1 on the plan means the output will be a model copy 10 times smaller.
     # Many architects will accidentally fill in 1:10 instead because they forget that here the ratio is (model:plan) and not (plan:model) like printed
@@ -1449,6 +1789,25 @@ class RenderPrintSettings(PropertyGroup):
             #,update=ensure_height <- if text object is selected and active.
             ,update=update_settings_cb
     )
+    annotation_mode = EnumProperty(
+            name="Annotations"
+            ,description="How the scale ratio text (and the labels of sheets) get onto the print."
+            ,items=(
+                ('OBJECT', "Text objects", "Text objects in front of the camera, rendered with the scene."),
+                ('OVERLAY', "Overlay", "Composited onto the written render at their exact printed size, the scene is left untouched.")
+            )
+            ,default='OBJECT'
+            ,update=add_scale_ratio_text_cb
+    )
+    annotation_color = FloatVectorProperty(
+            name="Annotation color"
+            ,description="Color of the overlay annotations."
+            ,subtype='COLOR'
+            ,size=4
+            ,default=(0.0, 0.0, 0.0, 1.0)
+            ,min=0.0
+            ,max=1.0
+    )
 
     # Margins for printers that require a blank border (due to technical or visual reasons):
     use_margins = BoolProperty(
@@ -1509,30 +1868,1772 @@ class RenderPrintSettings(PropertyGroup):
     )
 
 
+    # Tiled rendering of large sheets, see expand_tiled_sheet:
+    use_tiles = BoolProperty(
+            name="Render tiles"
+            ,description="Render large sheets in tiles by several background blender processes and stitch them together."
+            ,default=False
+    )
+    tile_size = IntProperty(
+            name="Tile size"
+            ,description="Maximum width and height of a tile in pixels."
+            ,default=4096
+            ,min=256
+            ,max=16384
+    )
+    tile_overlap = IntProperty(
+            name="Tile overlap"
+            ,description="Pixels rendered beyond the tile edges to avoid seams."
+            ,default=16
+            ,min=0
+            ,max=512
+    )
+    tile_workers = IntProperty(
+            name="Workers"
+            ,description="Number of blender processes rendering tiles in parallel."
+            ,default=4
+            ,min=1
+            ,max=256
+    )
 
+    # Render memory preflight, see apply_print_settings:
+    memory_budget = FloatProperty(
+            name="Memory budget"
+            ,description="Render memory available in MB. Sheets estimated to need more are refused or rendered in tiles. 0 for no limit."
+            ,default=0.0
+            ,min=0.0
+    )
+    memory_budget_action = EnumProperty(
+            name="Exceeding budget",
+            description="What to do if a sheet exceeds the memory budget",
+            items=(
+                ('TILES', "Render tiles", "Switch to rendering tiles"),
+                ('REFUSE', "Refuse", "Refuse to apply the print settings")
+            ),
+            default='TILES',
+            )
 
-
-class RENDER_OT_apply_print_settings(Operator):
+    # Render cache, see render_keys:
+    use_render_cache = BoolProperty(
+            name="Render cache"
+            ,description="Reuse earlier renders of sheets whose print settings, camera, render settings, world, lamps, visible objects and their materials and textures hash the same. Changes the hash misses (e.g. drivers, particles, linked libraries) are not noticed, disable the cache or clear it then."
+            ,default=False
+    )
+    render_cache_directory = StringProperty(
+            name="Cache directory"
+            ,description="Directory the renders are cached in (RENDER_TO_PRINT_CACHE overrides it)."
+            ,default="//render_cache/"
+            ,subtype='DIR_PATH'
+    )
+    render_cache_size = FloatProperty(
+            name="Cache size"
+            ,description="Size of the render cache in MB, the least recently used renders are removed beyond."
+            ,default=10240.0
+            ,min=0.0
+    )
+
+    # Stage timings are always gathered (see render_to_print_stats), profiling is optional:
+    use_profile = BoolProperty(
+            name="Profile"
+            ,description="Profile applying the print settings with cProfile and dump the profile to the given file."
+            ,default=False
+    )
+    profile_output = StringProperty(
+            name="Profile output"
+            ,description="File the cProfile profile is dumped to."
+            ,default="//render_to_print.prof"
+            ,subtype='FILE_PATH'
+    )
+
+
+
+#
+# Copies the definitions of the named print settings (see RenderPrintSettings) to the decorated
+# class, without their update callbacks and with the given defaults, so settings that other
+# classes share with the print settings are defined once only.
+#
+def print_settings_properties(names, **defaults):
+    def decorate(cls):
+        for name in names:
+            # Until registered, the class holds the (function, keywords) the property was defined by:
+            function, keywords = RenderPrintSettings.__dict__[name]
+            keywords = dict(keywords)
+            keywords.pop('update', None)
+            if name in defaults:
+                keywords['default'] = defaults[name]
+            setattr(cls, name, function(**keywords))
+        return cls
+    return decorate
+
+
+
+# Only properties explicitly passed to the operator are copied to the print settings:
+BATCH_PROPERTIES = (
+        'preset', 'orientation', 'dpi', 'width_cm', 'height_cm',
+        'use_margins', 'margin_top', 'margin_right', 'margin_bottom', 'margin_left',
+        'scale_factor', 'add_scale_ratio_text', 'text_height', 'annotation_mode'
+        )
+
+
+
+@print_settings_properties(BATCH_PROPERTIES)
+class RENDER_OT_print_settings_batch(Operator):
+    '''Change several print settings at once, updating and applying only once.'''
+    bl_idname = "render.print_settings_batch"
+    bl_label = "Change print settings."
+    bl_description = "Change several print settings at once. Only the given settings are changed and the settings are applied once at the end."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        with print_settings_batch(context) as ps:
+            for name in BATCH_PROPERTIES:
+                if self.properties.is_property_set(name):
+                    setattr(ps, name, getattr(self, name))
+        return {'FINISHED'}
+
+
+
+class RENDER_OT_apply_print_settings(Operator):
     bl_idname = "render.apply_print_settings"
     bl_label = "Apply print settings."
     bl_description = "Set the render dimension."
 
     def execute(self, context):
+        ps = context.scene.print_settings
+        with stats.profiled(bpy.path.abspath(ps.profile_output) if ps.use_profile else None):
+            result = apply_print_settings(context)
+        if result == {'CANCELLED'}:
+            self.report({'ERROR'}, "Rendering the sheet exceeds the memory budget.")
+        return result
+
+
+
+MB = 1024 * 1024
+
+# Float channels per render pass, passes not listed here are assumed to be colors (3).
+PASS_CHANNELS = {
+        'use_pass_combined': 4,
+        'use_pass_z': 1,
+        'use_pass_mist': 1,
+        'use_pass_vector': 4,
+        'use_pass_object_index': 1,
+        'use_pass_material_index': 1,
+        }
+
+
+
+#
+# Estimated peak render memory (see geometry.estimate_render_memory) for the scene's render settings.
+# Tiled renders only need the memory of one tile.
+#
+def render_memory_estimate(context, width_px, height_px, tiled=False):
+    scene = context.scene
+    render = scene.render
+    ps = scene.print_settings
+    if tiled:
+        width_px = min(width_px, ps.tile_size + 2 * ps.tile_overlap)
+        height_px = min(height_px, ps.tile_size + 2 * ps.tile_overlap)
+
+    pass_channels = []
+    for layer in render.layers:
+        if not layer.use:
+            continue
+        pass_channels.append(4) # Combined
+        for prop in layer.bl_rna.properties:
+            name = prop.identifier
+            if name.startswith('use_pass_') and name != 'use_pass_combined' and getattr(layer, name):
+                pass_channels.append(PASS_CHANNELS.get(name, 3))
+    if not pass_channels:
+        pass_channels = [4]
+
+    samples = render.antialiasing_samples if getattr(render, 'use_full_sample', False) and render.use_antialiasing else 1
+    bytes_per_channel = {'8': 1, '10': 2, '12': 2, '16': 2, '32': 4}.get(render.image_settings.color_depth, 1)
+    return geometry.estimate_render_memory(
+            width_px, height_px, pass_channels,
+            samples=int(samples),
+            compositing=render.use_compositing and scene.use_nodes,
+            output_bytes_per_channel=bytes_per_channel
+            )
+
+
+
+#
+# Preflight and setting the render resolution: Don't set a resolution the render can't afford.
+# Tiled sheets are checked per tile, tiles too large for the budget are refused.
+#
+def apply_render_resolution(context, ps):
+    if ps.memory_budget and not ps.use_tiles:
+        estimate = render_memory_estimate(context, ps.width_px, ps.height_px)
+        if estimate['total'] > ps.memory_budget * MB:
+            if ps.memory_budget_action == 'REFUSE':
+                print("Refusing %s x %s pixels, rendering needs about %.0f MB of memory, the budget is %.0f MB."
+                        % (ps.width_px, ps.height_px, estimate['total'] / MB, ps.memory_budget))
+                return {'CANCELLED'}
+            print("Rendering %s x %s pixels needs about %.0f MB of memory, switching to tiles."
+                    % (ps.width_px, ps.height_px, estimate['total'] / MB))
+            ps.use_tiles = True
+    if ps.memory_budget and ps.use_tiles:
+        estimate = render_memory_estimate(context, ps.width_px, ps.height_px, tiled=True)
+        if estimate['total'] > ps.memory_budget * MB:
+            print("Refusing tiles of %s pixels, rendering one needs about %.0f MB of memory, the budget is %.0f MB."
+                    " Reduce the tile size." % (ps.tile_size, estimate['total'] / MB, ps.memory_budget))
+            return {'CANCELLED'}
+
+    render = context.scene.render
+    render.resolution_x = max(ps.width_px, 4)
+    render.resolution_y = max(ps.height_px, 4)
+    return {'FINISHED'}
+
+
+
+#
+# The margins relate to the printed frame of the derived pixels, the render resolution is only
+# set from them when applying (see apply_render_resolution).
+#
+def clamp_margins(context, ps):
+    if not ps.use_margins:
+        return
+    render_x_m = pixels_to_printed_m(ps.width_px, ps)
+    render_y_m = pixels_to_printed_m(ps.height_px, ps)
+
+    # HORIZONTAL
+    margin_left_m = rel_to_abs_m(ps.margin_left, render_x_m)
+    margin_right_m = rel_to_abs_m(ps.margin_right, render_x_m)
+
+    length_available = render_x_m - margin_right_m
+    # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
+    if margin_left_m > length_available:
+        ps.margin_left = length_available
+
+    length_available = render_x_m - margin_left_m
+    # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
+    if margin_right_m > length_available:
+        ps.margin_right = length_available
+
+
+    # VERTICAL
+    margin_top_m = rel_to_abs_m(ps.margin_top, render_y_m)
+    margin_bottom_m = rel_to_abs_m(ps.margin_bottom, render_y_m)
+
+    length_available = render_y_m - margin_bottom_m
+    # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
+    if margin_top_m > length_available:
+        ps.margin_top = length_available
+
+    length_available = render_y_m - margin_top_m
+    # May be considered a bug because it changes relative percentage to an absolute value (does no harm though).
+    if margin_bottom_m > length_available:
+        ps.margin_bottom = length_available
+
+
+
+def limit_text_height(context, ps):
+    if ps.add_scale_ratio_text:
+        height_max = ps.width_cm / m_TO_cm
+        if ps.text_height > height_max:
+            ps.text_height = height_max
+        #elif ps.text_height < height_min:
+        #    ps.text_height = height_min
+
+
+
+#
+# DERIVED SETTINGS
+#
+# Every quantity derived from the print settings, the inputs it depends on and how it is derived,
+# in the order of derivation. A change derives again only what depends on it, e.g. changing the
+# text height neither touches the render resolution nor the camera's delta location.
+# Quantities marked apply are only derived when applying (i.e. not when updating manually).
+# Besides the print settings the inputs may be the render resolution, the unit scale, the camera
+# and the scale ratio text object. Quantities derived before the render resolution is applied
+# depend on the derived pixels (PRINT_FRAME) instead.
+#
+MARGINS = ('use_margins', 'margin_top', 'margin_right', 'margin_bottom', 'margin_left')
+RENDER_FRAME = ('dpi', 'resolution_x', 'resolution_y')
+PRINT_FRAME = ('dpi', 'width_px', 'height_px')
+
+DERIVED_SETTINGS = (
+        # (name, inputs, derive(context, ps), apply)
+        ('pixels',
+                ('preset', 'orientation', 'unit_from', 'width_cm', 'height_cm', 'width_px', 'height_px') + MARGINS + RENDER_FRAME,
+                pixels_from_print, False),
+        ('text_height_limit',
+                ('add_scale_ratio_text', 'text_height', 'width_cm'),
+                limit_text_height, False),
+        ('margins',
+                MARGINS + PRINT_FRAME,
+                clamp_margins, False),
+        ('camera_offset',
+                MARGINS + PRINT_FRAME + ('camera',),
+                lambda context, ps: offset_camera(context), False),
+        ('render_resolution',
+                ('width_px', 'height_px', 'use_tiles', 'tile_size', 'tile_overlap', 'memory_budget', 'memory_budget_action'),
+                apply_render_resolution, True),
+        ('ortho_scale',
+                ('print_to_scale', 'width_cm', 'height_cm', 'scale_factor', 'scale_length', 'camera') + MARGINS + RENDER_FRAME,
+                lambda context, ps: print2scale__calculate_camera_paramaters(ps, context), True),
+        ('scale_ratio_text',
+                ('print_to_scale', 'add_scale_ratio_text', 'annotation_mode', 'scale_factor', 'text_height',
+                 'margin_left_right', 'margin_top_bottom', 'scale_length', 'camera', 'text_object') + RENDER_FRAME,
+                lambda context, ps: print2scale_add_update_text(ps, context), True),
+        )
+
+
+
+def print_settings_input(context, ps, name):
+    if name == 'resolution_x':
+        return context.scene.render.resolution_x
+    if name == 'resolution_y':
+        return context.scene.render.resolution_y
+    if name == 'scale_length':
+        return context.scene.unit_settings.scale_length
+    if name == 'camera':
+        return context.scene.camera.name if context.scene.camera else ''
+    if name == 'text_object':
+        # A deleted text is created again:
+        o = context.scene.objects.get(ps.scale_ratio_text_object) if ps.scale_ratio_text_object else None
+        return o.name if o and o.type == 'FONT' else ''
+    return getattr(ps, name)
+
+
+
+#
+# Derives the quantities whose inputs changed since they were last derived (all if forced).
+# Applies unless updating manually. Returns {'CANCELLED'} if the render resolution was refused.
+#
+def update_print_settings(context, apply=None, force=False):
+    # Deriving changes settings, which calls back here:
+    if update_print_settings.running:
+        return {'FINISHED'}
+    ps = context.scene.print_settings
+    if apply is None:
+        apply = not ps.update_manually
+    derived = update_print_settings.derived.setdefault(context.scene.name, {})
+
+    update_print_settings.running = True
+    try:
+        for name, inputs, derive, on_apply in DERIVED_SETTINGS:
+            if on_apply and not apply:
+                continue # Stays outdated until applied.
+            values = tuple(print_settings_input(context, ps, i) for i in inputs)
+            if not force and derived.get(name) == values:
+                continue
+            with stats.timed('derive_' + name):
+                result = derive(context, ps)
+            if result == {'CANCELLED'} and name == 'render_resolution':
+                derived.pop(name, None)
+                return result
+            # Deriving may adjust its own inputs (e.g. clamping), hence they are read again:
+            derived[name] = tuple(print_settings_input(context, ps, i) for i in inputs)
+    finally:
+        update_print_settings.running = False
+    return {'FINISHED'}
+
+update_print_settings.running = False
+# Maps the scene name to the inputs every quantity was last derived from.
+update_print_settings.derived = {}
+
+
+
+#
+# Live update while settings are changed interactively, e.g. dragging a slider:
+# The cheap quantities are derived right away, applying (the heavy part) waits until the settings
+# haven't changed for live_update_delay seconds (see WM_OT_apply_print_settings_when_idle).
+# Without delay or without a window to receive timer events the settings are applied right away.
+#
+def update_print_settings_live(context):
+    ps = context.scene.print_settings
+    # Scripts in background mode expect the settings applied immediately (and timers don't run there):
+    if ps.update_manually or not ps.live_update_delay or bpy.app.background or getattr(context, 'window', None) is None:
+        return update_print_settings(context)
+
+    result = update_print_settings(context, apply=False)
+    apply_when_idle.scene = context.scene.name
+    apply_when_idle.deadline = time.time() + ps.live_update_delay
+    if not apply_when_idle.waiting:
+        try:
+            bpy.ops.wm.apply_print_settings_when_idle('INVOKE_DEFAULT')
+        except RuntimeError as e:
+            print("Applying the print settings when idle failed, applying now: %s" % e)
+            return update_print_settings(context)
+    return result
+
+
+
+#
+# Applies the print settings once input has been idle until the deadline.
+# Returns False while still waiting.
+#
+def apply_when_idle(context):
+    if time.time() < apply_when_idle.deadline:
+        return False # Changed again meanwhile, wait some more.
+    if context.scene and context.scene.name == apply_when_idle.scene:
+        update_print_settings(context, apply=True)
+    return True
+
+apply_when_idle.scene = ""
+apply_when_idle.deadline = 0.0
+# Whether WM_OT_apply_print_settings_when_idle is running.
+apply_when_idle.waiting = False
+# Seconds between checking the deadline.
+apply_when_idle.tick = 0.05
+
+
+
+class WM_OT_apply_print_settings_when_idle(Operator):
+    '''Apply the print settings once they stayed unchanged for the apply delay.'''
+    bl_idname = "wm.apply_print_settings_when_idle"
+    bl_label = "Apply print settings when idle."
+    bl_options = {'INTERNAL'}
+
+    def invoke(self, context, event):
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(apply_when_idle.tick, context.window)
+        wm.modal_handler_add(self)
+        apply_when_idle.waiting = True
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        try:
+            if not apply_when_idle.waiting or apply_when_idle(context):
+                return self.finish(context)
+        except Exception:
+            self.finish(context)
+            raise
+        return {'PASS_THROUGH'}
+
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        apply_when_idle.waiting = False
+        return {'FINISHED'}
+
+
+
+@persistent
+def derived_settings_load_cb(dummy):
+    update_print_settings.derived.clear()
+    # Loading ends running modal operators:
+    apply_when_idle.waiting = False
+
+
+
+#
+# Derives and applies all print settings (see DERIVED_SETTINGS).
+#
+@stats.timed('apply_print_settings')
+def apply_print_settings(context):
+    return update_print_settings(context, apply=True, force=True)
+
+
+
+#
+# SHEETS
+#
+# A sheet is a dict of print settings plus where to render it to, e.g.
+#   {"preset": "A1_59.4_84.1", "orientation": "Landscape", "dpi": 300, "scale_factor": 0.01,
+#    "margins": [0.015, 0.015, 0.015, 0.015], "camera": "Camera.plan", "output": "//plan.png"}
+# Margins are given top, right, bottom, left (or as dict with these keys).
+# With "preset": "FIT" and "content": [width, height] (blender units as seen by the camera) the
+# smallest registered sheet the content fits on is chosen (see geometry.smallest_fitting_preset).
+# With "annotation_mode": "OVERLAY" the sheet may carry "labels" (see ANNOTATION OVERLAY).
+#
+SHEET_SETTINGS = (
+        'preset', 'orientation', 'dpi', 'width_cm', 'height_cm', 'use_margins',
+        'scale_factor', 'add_scale_ratio_text', 'text_height', 'annotation_mode',
+        'margin_top', 'margin_right', 'margin_bottom', 'margin_left',
+        'margin_top_bottom', 'margin_left_right'
+        )
+SHEET_MARGINS = ('top', 'right', 'bottom', 'left')
+
+
+
+#
+# Applies the sheet's print settings to the scene, updating and applying them once.
+#
+@stats.timed('apply_sheet')
+def apply_sheet(context, sheet):
+    scene = context.scene
+    camera_changed = False
+    if sheet.get('camera'):
+        camera = scene.objects.get(sheet['camera'])
+        if not camera or camera.type != 'CAMERA':
+            raise ValueError("No camera %r in scene %r." % (sheet['camera'], scene.name))
+        camera_changed = scene.camera != camera
+        scene.camera = camera
+
+    margins = sheet.get('margins')
+    if isinstance(margins, (list, tuple)):
+        margins = dict(zip(SHEET_MARGINS, margins))
+
+    if sheet.get('preset') == 'FIT':
+        sheet = fit_sheet(context, sheet, margins)
+
+    with print_settings_batch(context) as ps:
+        for name in SHEET_SETTINGS:
+            if name in sheet:
+                setattr(ps, name, sheet[name])
+        if margins:
+            for side in SHEET_MARGINS:
+                if side in margins:
+                    setattr(ps, 'margin_' + side, margins[side])
+        ps.use_tiles = bool(sheet.get('tiles')) or 'tile' in sheet
+
+    # The edit session applied already unless updating manually. A new camera doesn't change any
+    # print setting, so nothing may be pending, yet it needs its ortho scale, offset and text:
+    if ps.update_manually or camera_changed:
+        apply_print_settings(context)
+    render = scene.render
+    if render.resolution_x != ps.width_px or render.resolution_y != ps.height_px:
+        raise ValueError("Print settings could not be applied (%s x %s pixels exceed the memory budget?)." % (ps.width_px, ps.height_px))
+
+
+
+#
+# The print settings, camera and render resolution applying sheets changes, to restore them
+# afterwards (see render_camera_sheets).
+#
+def print_settings_snapshot(context):
+    scene = context.scene
+    ps = scene.print_settings
+    return {
+            'settings': [(name, getattr(ps, name)) for name in SHEET_SETTINGS + ('use_tiles',)],
+            'camera': scene.camera,
+            'resolution': (scene.render.resolution_x, scene.render.resolution_y),
+            }
+
+
+
+def restore_print_settings(context, snapshot):
+    scene = context.scene
+    scene.camera = snapshot['camera']
+    with print_settings_batch(context) as ps:
+        for name, value in snapshot['settings']:
+            setattr(ps, name, value)
+    scene.render.resolution_x, scene.render.resolution_y = snapshot['resolution']
+
+
+
+#
+# Replaces the preset "FIT" of the sheet by the smallest sheet its content fits on.
+#
+def fit_sheet(context, sheet, margins=None):
+    ps = context.scene.print_settings
+    if 'content' not in sheet:
+        raise ValueError("Fitting the preset requires the content size.")
+    margins = margins or {}
+    use_margins = sheet.get('use_margins', ps.use_margins)
+    fit = geometry.smallest_fitting_preset(
+            sheet['content'][0], sheet['content'][1],
+            scale_factor=sheet.get('scale_factor', ps.scale_factor),
+            margins=[margins.get(side, sheet.get('margin_' + side, getattr(ps, 'margin_' + side))) if use_margins else 0.0
+                    for side in SHEET_MARGINS],
+            scale_length=context.scene.unit_settings.scale_length
+            )
+    if not fit:
+        raise ValueError("No paper preset is large enough for content of %s x %s." % tuple(sheet['content'][:2]))
+    print("Sheet %s: fits on %s (%s)." % (sheet.get('output'), fit['preset'], fit['orientation']))
+    return dict(sheet, preset=fit['preset'], orientation=fit['orientation'], width_cm=fit['width_cm'], height_cm=fit['height_cm'])
+
+
+
+#
+# The current print settings as a sheet.
+#
+def sheet_from_print_settings(context, output):
+    ps = context.scene.print_settings
+    sheet = {name: getattr(ps, name) for name in SHEET_SETTINGS}
+    sheet['output'] = output
+    if context.scene.camera:
+        sheet['camera'] = context.scene.camera.name
+    if ps.use_tiles:
+        sheet['tiles'] = {'size': ps.tile_size, 'overlap': ps.tile_overlap}
+    return sheet
+
+
+
+#
+# TILES
+#
+# Sheets with "tiles" (true or {"size": 4096, "overlap": 16}) are rendered as render border tiles,
+# which lifts the limit the render memory puts on the sheet size. The tiles and an index file
+# (tiles.json) describing them are written to <output without extension>_tiles/.
+#
+RENDERABLE_TYPES = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}
+
+
+
+def tiles_directory(output):
+    return os.path.splitext(bpy.path.abspath(output))[0] + "_tiles"
+
+
+
+#
+# Pixel rectangles of the render covered by the renderable objects' bounding boxes.
+# Returns None if unknown, i.e. for non orthographic cameras.
+#
+def projected_pixel_rects(context, camera):
+    scene = context.scene
+    if camera.data.type != 'ORTHO':
+        return None
+    render = scene.render
+    objects = [o for o in scene.objects if o.type in RENDERABLE_TYPES and not o.hide_render and o.is_visible(scene)]
+    rects = []
+    for local_min, local_max in zip(*camera_space_bounds(scene, camera, objects)):
+        rect = geometry.ortho_pixel_rect(local_min, local_max, camera.data.ortho_scale, render.resolution_x, render.resolution_y,
+                camera.data.shift_x, camera.data.shift_y)
+        if rect:
+            rects.append(rect)
+    return rects
+
+
+
+#
+# Splits a sheet into tile jobs. Tiles no object projects into are not rendered.
+# Returns the tile jobs (sheets) and the tile index.
+#
+def expand_tiled_sheet(context, sheet):
+    apply_sheet(context, sheet)
+    ps = context.scene.print_settings
+    options = sheet['tiles'] if isinstance(sheet['tiles'], dict) else {}
+    width, height = context.scene.render.resolution_x, context.scene.render.resolution_y
+    rects = projected_pixel_rects(context, context.scene.camera)
+
+    directory = tiles_directory(sheet['output'])
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    index = {
+            'output': bpy.path.abspath(sheet['output']),
+            'width': width, 'height': height, 'dpi': ps.dpi,
+            'labels': annotation_labels(context, sheet), # Composited once stitched.
+            'tiles': []
+            }
+    jobs = []
+    for tile in geometry.tile_grid(width, height, options.get('size', ps.tile_size), options.get('overlap', ps.tile_overlap)):
+        tile['path'] = os.path.join(directory, "tile_%03d_%03d%s" % (tile['row'], tile['column'], tile_extension(context.scene)))
+        tile['empty'] = rects is not None and not any(geometry.rects_overlap(tile['rect'], r) for r in rects)
+        index['tiles'].append(tile)
+        if tile['empty']:
+            continue
+        job = dict(sheet)
+        del job['tiles']
+        job['output'] = tile['path']
+        job['tile'] = list(tile['rect'])
+        jobs.append(job)
+
+    with open(os.path.join(directory, "tiles.json"), 'w') as f:
+        json.dump(index, f, indent=2)
+    print("Sheet %s: %s of %s tiles to render." % (sheet['output'], len(jobs), len(index['tiles'])))
+    return jobs, index
+
+
+
+#
+# Replaces tiled sheets by their tile jobs. Returns the jobs and the tile indices to stitch afterwards.
+#
+def expand_sheets(context, sheets):
+    jobs = []
+    indices = []
+    for sheet in sheets:
+        if context.scene.print_settings.memory_budget and not sheet.get('tiles') and 'tile' not in sheet:
+            # Sheets exceeding the memory budget may switch to tiles when applied:
+            try:
+                apply_sheet(context, sheet)
+                if context.scene.print_settings.use_tiles:
+                    sheet = dict(sheet, tiles=True)
+            except Exception as e:
+                print("Preflight of sheet %s failed: %s" % (sheet.get('output'), e))
+        if sheet.get('tiles'):
+            tile_jobs, index = expand_tiled_sheet(context, sheet)
+            jobs.extend(tile_jobs)
+            indices.append(index)
+        else:
+            jobs.append(sheet)
+    return jobs, indices
+
+
+
+#
+# Stitches the rendered tiles of the indices into their sheets' outputs (see render_to_print_stitch).
+# Returns a result per sheet.
+#
+def stitch_sheets(indices, results):
+    failed = set(r['output'] for r in results if r['status'] != 'done')
+    stitched = []
+    for index in indices:
+        result = {'output': index['output'], 'status': 'done'}
+        missing = [t['path'] for t in index['tiles'] if t['path'] in failed]
+        try:
+            if missing:
+                raise ValueError("%s tiles failed to render." % len(missing))
+            stitch.stitch(index)
+        except Exception as e:
+            print("Stitching %s failed: %s" % (index['output'], e))
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        stitched.append(result)
+    return stitched
+
+
+
+#
+# ANNOTATION OVERLAY
+#
+# With annotation_mode 'OVERLAY' the scale ratio and the labels of a sheet, e.g.
+#   "labels": [{"text": "Ground floor", "left": 0.02, "top": 0.02, "height": 0.008}]
+# (meters as printed, from the top left of the render, the height defaults to text_height)
+# aren't text objects in front of the camera but composited onto the written render at their exact
+# printed size (see render_to_print_overlay). Renders are cached without them, so changing a label
+# costs compositing, not rendering.
+#
+def is_streamable_format(image_settings):
+    return image_settings.color_depth == '8' and (image_settings.file_format == 'PNG' or
+            (image_settings.file_format == 'TIFF' and getattr(image_settings, 'tiff_codec', 'NONE') == 'NONE'))
+
+
+
+#
+# The outline of the text as blender lays it out in the font (by name, the built-in font by
+# default), see render_to_print_overlay: the contour edges of the filled glyphs in units of the
+# text's height from the top left of its bounding box, y downwards. Cached per font and text.
+#
+def text_outline(context, text, font_name=''):
+    font = bpy.data.fonts.get(font_name) if font_name else None
+    key = (font.filepath if font else '', text)
+    outline = text_outline.cache.get(key)
+    if outline is not None:
+        return outline
+
+    curve = bpy.data.curves.new("render_to_print_outline", 'FONT')
+    obj = None
+    mesh = None
+    try:
+        curve.body = text
+        if font:
+            curve.font = font
+        obj = bpy.data.objects.new("render_to_print_outline", curve)
+        mesh = obj.to_mesh(context.scene, False, 'PREVIEW')
+        coordinates = array.array('f', [0.0]) * (len(mesh.vertices) * 3)
+        mesh.vertices.foreach_get('co', coordinates)
+        # Edges of one face only are on the contours:
+        faces = {}
+        for polygon in mesh.polygons:
+            for edge in polygon.edge_keys:
+                faces[edge] = faces.get(edge, 0) + 1
+        contours = [edge for edge, count in faces.items() if count == 1]
+    finally:
+        if mesh:
+            bpy.data.meshes.remove(mesh)
+        if obj:
+            bpy.data.objects.remove(obj)
+        bpy.data.curves.remove(curve)
+
+    outline = []
+    if contours:
+        xs, ys = coordinates[0::3], coordinates[1::3]
+        left, top = min(xs), max(ys)
+        height = top - min(ys)
+        if height > 0:
+            outline = [[round((xs[a] - left) / height, 5), round((top - ys[a]) / height, 5),
+                    round((xs[b] - left) / height, 5), round((top - ys[b]) / height, 5)] for a, b in contours]
+    if len(text_outline.cache) >= TEXT_BOUNDS_CACHE_SIZE:
+        text_outline.cache.clear()
+    text_outline.cache[key] = outline
+    return outline
+
+# Maps (font file path, text) to the outline.
+text_outline.cache = {}
+
+
+
+#
+# The overlay labels of the applied print settings and the sheet, in pixels. Sheet labels may name
+# the font (see text_outline).
+#
+def annotation_labels(context, sheet=None):
+    ps = context.scene.print_settings
+    if ps.annotation_mode != 'OVERLAY':
+        return []
+    labels = []
+    if ps.print_to_scale and ps.add_scale_ratio_text:
+        left, top = positioning_margins_m(context, ps)
+        labels.append({'text': convertScaleFactorToRatioString(scale_factor=ps.scale_factor), 'left': left, 'top': top})
+    if sheet:
+        labels.extend(sheet.get('labels', []))
+    color = list(ps.annotation_color)
+    return [{
+            'text': label['text'],
+            'x': printed_m_to_pixels(label.get('left', 0.0), ps),
+            'y': printed_m_to_pixels(label.get('top', 0.0), ps),
+            # Like ensure_height, 1cm if no text height is set:
+            'height': printed_m_to_pixels(label.get('height') or ps.text_height or .010, ps),
+            'color': label.get('color', color),
+            'outline': text_outline(context, label['text'], label.get('font', ''))
+            } for label in labels]
+
+
+
+#
+# Composites the overlay labels onto the render written to path.
+# Returns whether there was anything to composite.
+#
+def composite_annotations(context, path, sheet=None):
+    labels = annotation_labels(context, sheet)
+    if not labels:
+        return False
+    if not is_streamable_format(context.scene.render.image_settings):
+        raise ValueError("Annotation overlays require 8 bit PNG or uncompressed TIFF output.")
+    with stats.timed('composite_annotations'):
+        overlay.composite(path, labels, dpi=context.scene.print_settings.dpi)
+    return True
+
+
+
+#
+# Composites the overlay annotations onto renders written otherwise, e.g. animation frames.
+# Suspended while render_sheets renders, which composites by itself.
+#
+@persistent
+def annotation_overlay_write_cb(scene):
+    if annotation_overlay_write_cb.suspended or scene.print_settings.annotation_mode != 'OVERLAY':
+        return
+    if bpy.context.scene != scene:
+        return
+    path = scene.render.frame_path(frame=scene.frame_current)
+    if not os.path.isfile(path):
+        return
+    try:
+        composite_annotations(bpy.context, path)
+    except ValueError as e:
+        print("Compositing the annotations onto %s failed: %s" % (path, e))
+
+annotation_overlay_write_cb.suspended = False
+
+
+
+#
+# RENDER CACHE
+#
+# Renders are cached by a key hashing everything their pixels depend on (see render_to_print_cache
+# and render_keys): the print settings, the camera, the render settings, the annotations (objects
+# parented to the camera) and a fingerprint of all other visible objects, their data and materials.
+# Enabled by use_render_cache or by setting RENDER_TO_PRINT_CACHE to the cache directory.
+# If only the annotations changed since the sheet was last rendered, only the region they cover
+# is rendered and pasted onto the cached render (see render_annotations_region).
+#
+RENDER_CACHE_ENVIRONMENT = 'RENDER_TO_PRINT_CACHE'
 
+# Render settings that don't change the pixels (and differ between farm workers):
+RENDER_KEY_EXCLUDED = {
+        'filepath', 'threads', 'threads_mode', 'tile_x', 'tile_y', 'display_mode', 'use_lock_interface',
+        'use_placeholder', 'use_overwrite', 'use_save_buffers', 'use_persistent_data'
+        }
+
+# Print settings that only change the annotations (their size and placement):
+ANNOTATION_SETTINGS = ('add_scale_ratio_text', 'text_height', 'annotation_mode', 'margin_top_bottom', 'margin_left_right')
+
+# Regions larger than this share of the render are rendered in full:
+REGION_AREA_MAX = 0.25
+
+
+
+def render_cache_directory(context):
+    directory = os.environ.get(RENDER_CACHE_ENVIRONMENT)
+    if directory:
+        return directory
+    ps = context.scene.print_settings
+    if not ps.use_render_cache:
+        return None
+    return bpy.path.abspath(ps.render_cache_directory)
+
+
+
+#
+# The values of all plain (neither pointer nor collection) properties of a blender struct.
+# Bookkeeping of datablocks (users, update tags) is left out.
+#
+RNA_FINGERPRINT_EXCLUDED = {'rna_type', 'users', 'use_fake_user', 'tag', 'is_updated', 'is_updated_data',
+        'is_library_indirect', 'is_editmode'}
+
+
+
+def rna_fingerprint(struct, exclude=()):
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.type in {'POINTER', 'COLLECTION'} or prop.identifier in RNA_FINGERPRINT_EXCLUDED or prop.identifier in exclude:
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if hasattr(value, '__len__') and not isinstance(value, str):
+            value = tuple(value)
+        values.append((prop.identifier, value))
+    return repr(values).encode()
+
+
+
+#
+# Images by their file (path, modification time and size) or, if packed or generated, their size.
+#
+def image_fingerprint(image, fingerprint):
+    fingerprint.update(repr((image.name, image.source, image.filepath)).encode())
+    if image.packed_file:
+        fingerprint.update(repr(image.packed_file.size).encode())
+    elif image.source in {'FILE', 'SEQUENCE', 'MOVIE'}:
+        path = bpy.path.abspath(image.filepath, library=image.library)
+        if os.path.exists(path):
+            st = os.stat(path)
+            fingerprint.update(repr((st.st_mtime, st.st_size)).encode())
+    else:
+        fingerprint.update(repr((image.generated_type, image.generated_width, image.generated_height,
+                tuple(image.generated_color))).encode())
+
+
+
+def texture_fingerprint(texture, fingerprint):
+    fingerprint.update(rna_fingerprint(texture))
+    if getattr(texture, 'image', None):
+        image_fingerprint(texture.image, fingerprint)
+    node_tree_fingerprint(getattr(texture, 'node_tree', None), fingerprint)
+
+
+
+#
+# The texture slots of materials, lamps and worlds (blender internal).
+#
+def texture_slots_fingerprint(struct, fingerprint):
+    for slot in getattr(struct, 'texture_slots', ()):
+        if slot and slot.texture:
+            fingerprint.update(rna_fingerprint(slot))
+            texture_fingerprint(slot.texture, fingerprint)
+
+
+
+def node_tree_fingerprint(node_tree, fingerprint):
+    if not node_tree:
+        return
+    for node in node_tree.nodes:
+        fingerprint.update(rna_fingerprint(node, exclude={'location', 'width', 'height', 'select', 'hide'}))
+        for socket in node.inputs:
+            if hasattr(socket, 'default_value'):
+                value = socket.default_value
+                fingerprint.update(repr(tuple(value) if hasattr(value, '__len__') else value).encode())
+        # Pointers aren't part of the rna fingerprint:
+        if getattr(node, 'image', None):
+            image_fingerprint(node.image, fingerprint)
+        if getattr(node, 'texture', None):
+            texture_fingerprint(node.texture, fingerprint)
+        if node.type == 'GROUP':
+            node_tree_fingerprint(node.node_tree, fingerprint)
+    fingerprint.update(repr(sorted((l.from_node.name, l.from_socket.identifier, l.to_node.name, l.to_socket.identifier)
+            for l in node_tree.links)).encode())
+
+
+
+#
+# Annotations are placed per sheet in front of the camera (scale ratio text, labels positioned within render).
+#
+def is_annotation(o):
+    return is_scale_ratio_text_object(o) or (o.parent is not None and o.parent.type == 'CAMERA')
+
+
+
+#
+# Coordinates, faces, shading, material indices and UVs of the mesh, read in bulk.
+#
+def mesh_fingerprint(mesh, fingerprint):
+    coordinates = array.array('f', [0.0]) * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', coordinates)
+    fingerprint.update(coordinates.tobytes())
+    loops = array.array('i', [0]) * len(mesh.loops)
+    mesh.loops.foreach_get('vertex_index', loops)
+    fingerprint.update(loops.tobytes())
+    smooth = array.array('b', [0]) * len(mesh.polygons)
+    mesh.polygons.foreach_get('use_smooth', smooth)
+    fingerprint.update(smooth.tobytes())
+    material_indices = array.array('h', [0]) * len(mesh.polygons)
+    mesh.polygons.foreach_get('material_index', material_indices)
+    fingerprint.update(material_indices.tobytes())
+    for uv_layer in mesh.uv_layers:
+        fingerprint.update(uv_layer.name.encode())
+        uvs = array.array('f', [0.0]) * (len(uv_layer.data) * 2)
+        uv_layer.data.foreach_get('uv', uvs)
+        fingerprint.update(uvs.tobytes())
+
+
+
+#
+# The objects the struct (a modifier or constraint) points to, e.g. a boolean's cutter or a curve
+# deforming the mesh. They are often hidden from render, hence not hashed with the scene.
+#
+def target_objects(struct):
+    targets = []
+    for prop in struct.bl_rna.properties:
+        if prop.type == 'POINTER' and prop.identifier != 'rna_type':
+            value = getattr(struct, prop.identifier, None)
+            if isinstance(value, Object):
+                targets.append(value)
+    return targets
+
+
+
+#
+# Adds the object, its (evaluated) data, materials, modifier and constraint targets and instanced
+# groups to the fingerprint. Data, materials, targets and groups shared by several objects are
+# hashed once (seen).
+#
+def object_fingerprint(scene, o, fingerprint, seen):
+    fingerprint.update(o.name.encode())
+    fingerprint.update(array.array('d', [v for row in o.matrix_world for v in row]).tobytes())
+    fingerprint.update(repr([(m.type, m.show_render) for m in o.modifiers]).encode())
+    for struct in list(o.modifiers) + list(o.constraints):
+        fingerprint.update(rna_fingerprint(struct))
+        if getattr(struct, 'texture', None):
+            texture_fingerprint(struct.texture, fingerprint)
+        for target in target_objects(struct):
+            fingerprint.update(target.name.encode())
+            if ('OBJECT', target.name) not in seen and target != o:
+                seen.add(('OBJECT', target.name))
+                object_fingerprint(scene, target, fingerprint, seen)
+
+    data = o.data
+    if data is not None:
+        fingerprint.update(data.name.encode())
+        # Modifiers, shape keys and curves make the rendered geometry differ from the data:
+        evaluated = o.type in {'CURVE', 'SURFACE', 'META', 'FONT'} or (o.type == 'MESH' and (o.modifiers or data.shape_keys))
+        if evaluated or ('DATA', data.name) not in seen:
+            seen.add(('DATA', data.name))
+            fingerprint.update(rna_fingerprint(data))
+            if o.type == 'FONT':
+                fingerprint.update(data.body.encode())
+            if o.type == 'LAMP':
+                node_tree_fingerprint(data.node_tree, fingerprint)
+                texture_slots_fingerprint(data, fingerprint)
+            if evaluated:
+                mesh = o.to_mesh(scene, True, 'RENDER')
+                if mesh is not None:
+                    try:
+                        mesh_fingerprint(mesh, fingerprint)
+                    finally:
+                        bpy.data.meshes.remove(mesh)
+            elif o.type == 'MESH':
+                mesh_fingerprint(data, fingerprint)
+
+    for slot in o.material_slots:
+        material = slot.material
+        if not material:
+            continue
+        fingerprint.update(material.name.encode())
+        if ('MATERIAL', material.name) not in seen:
+            seen.add(('MATERIAL', material.name))
+            fingerprint.update(rna_fingerprint(material))
+            node_tree_fingerprint(material.node_tree, fingerprint)
+            texture_slots_fingerprint(material, fingerprint)
+
+    group = o.dupli_group if o.dupli_type == 'GROUP' else None
+    if group:
+        fingerprint.update(group.name.encode())
+        if ('GROUP', group.name) not in seen:
+            seen.add(('GROUP', group.name))
+            for member in sorted(group.objects, key=lambda member: member.name):
+                if not member.hide_render:
+                    object_fingerprint(scene, member, fingerprint, seen)
+
+
+
+#
+# Whether the object shows in renders of the scene: geometry, lamps and instanced groups.
+#
+def is_fingerprinted(scene, o):
+    if o.hide_render or not o.is_visible(scene):
+        return False
+    return o.type in RENDERABLE_TYPES or o.type == 'LAMP' or (o.dupli_type == 'GROUP' and o.dupli_group is not None)
+
+
+
+#
+# Fingerprint of what the renders of all sheets have in common: the world, the lamps and the
+# visible objects except the annotations, which are part of every sheet.
+#
+def scene_fingerprint(scene):
+    fingerprint = hashlib.sha1()
+    if scene.world:
+        fingerprint.update(rna_fingerprint(scene.world))
+        node_tree_fingerprint(scene.world.node_tree, fingerprint)
+        texture_slots_fingerprint(scene.world, fingerprint)
+    seen = set()
+    for o in sorted(scene.objects, key=lambda o: o.name):
+        if not is_fingerprinted(scene, o) or is_annotation(o):
+            continue
+        object_fingerprint(scene, o, fingerprint, seen)
+    return fingerprint.hexdigest()
+
+
+
+#
+# The rendered annotations in front of the camera, ordered by name.
+#
+def camera_annotations(scene, camera):
+    return [o for o in sorted(scene.objects, key=lambda o: o.name)
+            if o.type in RENDERABLE_TYPES and not o.hide_render and o.is_visible(scene) and is_annotation(o) and o.parent == camera]
+
+
+
+#
+# Fingerprint of the camera and (unless not wanted) the annotations in front of it.
+#
+def camera_fingerprint(scene, camera, annotations=True):
+    fingerprint = hashlib.sha1(camera.name.encode())
+    fingerprint.update(array.array('d', [v for row in camera.matrix_world for v in row]).tobytes())
+    fingerprint.update(rna_fingerprint(camera.data))
+    if annotations:
+        seen = set()
+        for o in camera_annotations(scene, camera):
+            object_fingerprint(scene, o, fingerprint, seen)
+    return fingerprint.hexdigest()
+
+
+
+#
+# The annotations in front of the camera by name: [fingerprint, pixel rectangle covered in the render].
+# The rectangle is None if unknown (non orthographic cameras) or outside of the render.
+#
+def annotation_regions(scene, camera):
+    # Text bounding boxes are only updated with the scene:
+    scene.update()
+    render = scene.render
+    camera_inverse = camera.matrix_world.inverted()
+    regions = {}
+    for o in camera_annotations(scene, camera):
+        fingerprint = hashlib.sha1()
+        object_fingerprint(scene, o, fingerprint, set())
+        rect = None
+        if camera.data.type == 'ORTHO':
+            # Few objects, transformed directly instead of through the bounds cache which may be stale here:
+            matrix = camera_inverse * o.matrix_world
+            corners = [matrix * Vector(corner) for corner in o.bound_box]
+            rect = geometry.ortho_pixel_rect(
+                    [min(c[i] for c in corners) for i in range(3)], [max(c[i] for c in corners) for i in range(3)],
+                    camera.data.ortho_scale, render.resolution_x, render.resolution_y,
+                    camera.data.shift_x, camera.data.shift_y)
+        # Lists, to compare equal to the regions read back from the cache info (JSON):
+        regions[o.name] = [fingerprint.hexdigest(), list(rect) if rect else None]
+    return regions
+
+
+
+#
+# Keys of the render of the currently applied print settings and render settings:
+#   'base'         everything but the annotations,
+#   'key'          the whole render,
+#   'annotations'  the annotation regions (see annotation_regions).
+#
+def render_keys(context, fingerprint_scene):
+    scene = context.scene
+    ps = scene.print_settings
+    settings = [name for name in SHEET_SETTINGS if name not in ANNOTATION_SETTINGS] + ['width_px', 'height_px']
+    fingerprint = hashlib.sha1(fingerprint_scene.encode())
+    fingerprint.update(repr([(name, getattr(ps, name)) for name in settings]).encode())
+    fingerprint.update(camera_fingerprint(scene, scene.camera, annotations=False).encode())
+    fingerprint.update(rna_fingerprint(scene.render, exclude=RENDER_KEY_EXCLUDED))
+    fingerprint.update(rna_fingerprint(scene.render.image_settings))
+    for layer in scene.render.layers:
+        fingerprint.update(rna_fingerprint(layer))
+    if getattr(scene, 'cycles', None):
+        fingerprint.update(rna_fingerprint(scene.cycles))
+    if scene.use_nodes:
+        node_tree_fingerprint(scene.node_tree, fingerprint)
+    fingerprint.update(repr(tuple(scene.layers)).encode())
+    base = fingerprint.hexdigest()
+
+    annotations = annotation_regions(scene, scene.camera)
+    fingerprint = hashlib.sha1(base.encode())
+    if ps.annotation_mode == 'OBJECT': # Overlays are composited after caching.
+        fingerprint.update(repr([(name, getattr(ps, name)) for name in ANNOTATION_SETTINGS]).encode())
+    fingerprint.update(repr(sorted((name, region[0]) for name, region in annotations.items())).encode())
+    return {'base': base, 'key': fingerprint.hexdigest(), 'annotations': annotations}
+
+
+
+#
+# The file a still render is written to (the extension is added unless given).
+#
+def written_still_path(render):
+    path = bpy.path.abspath(render.filepath)
+    if render.use_file_extension and not path.lower().endswith(render.file_extension.lower()):
+        path += render.file_extension
+    return path
+
+
+
+#
+# Whether the annotations in front of the camera only show themselves, i.e. neither cast shadows
+# onto nor are reflected or refracted by other objects: In cycles they must be visible to camera
+# rays only, in blender internal their materials must neither be traceable nor cast shadows.
+#
+def annotations_isolated(scene, camera):
+    for o in camera_annotations(scene, camera):
+        if scene.render.engine == 'CYCLES':
+            visibility = o.cycles_visibility
+            if visibility.shadow or visibility.diffuse or visibility.glossy or visibility.transmission or visibility.scatter:
+                return False
+        elif scene.render.engine == 'BLENDER_RENDER':
+            materials = [slot.material for slot in o.material_slots]
+            if not materials or None in materials:
+                return False # The default material casts shadows.
+            for material in materials:
+                if material.use_raytrace or material.use_cast_shadows or material.use_cast_buffer_shadows:
+                    return False
+        else:
+            return False
+    return True
+
+
+
+#
+# Renders only the region of the annotations that changed since the render last cached under the
+# same base key (see render_keys) and pastes it onto a copy of that render written to output.
+# The region is rendered grown by the tile overlap, so the pixels at its edges match a full render.
+# Returns False if that isn't possible: No such render, no orthographic camera, annotations that
+# show elsewhere (see annotations_isolated), a format that can't be streamed (see
+# render_to_print_stitch) or a region too large to be worth it.
+#
+def render_annotations_region(context, cache_directory, keys, output):
+    scene = context.scene
+    render = scene.render
+    image_settings = render.image_settings
+    if scene.camera.data.type != 'ORTHO' or render.use_border or not is_streamable_format(image_settings):
+        return False
+    if not annotations_isolated(scene, scene.camera):
+        return False
+    previous_key = render_cache.read_alias(cache_directory, keys['base'])
+    previous = previous_key and render_cache.lookup(cache_directory, previous_key, os.path.splitext(output)[1])
+    info = previous and render_cache.read_info(cache_directory, previous_key)
+    if not info or 'annotations' not in info:
+        return False
+
+    rects = []
+    for name in set(info['annotations']) | set(keys['annotations']):
+        old = info['annotations'].get(name)
+        new = keys['annotations'].get(name)
+        if old != new:
+            rects.extend(region[1] for region in (old, new) if region and region[1])
+
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    if not rects:
+        # Only changes that don't show, e.g. of annotations outside of the render:
+        shutil.copyfile(previous, output)
+        return True
+    width, height = render.resolution_x, render.resolution_y
+    rect = geometry.union_rect(rects)
+    if (rect[2] - rect[0]) * (rect[3] - rect[1]) > REGION_AREA_MAX * width * height:
+        return False
+    patch_rect = geometry.grow_rect(rect, scene.print_settings.tile_overlap, width, height)
+
+    settings = (render.filepath, render.use_crop_to_border,
+            image_settings.file_format, image_settings.color_mode, getattr(image_settings, 'tiff_codec', None))
+    patch = None
+    try:
+        render.use_border = True
+        render.use_crop_to_border = True
+        render.border_min_x, render.border_max_x, render.border_min_y, render.border_max_y = \
+                geometry.pixel_rect_to_border(patch_rect, width, height)
+        # Streamed like the tiles, see tile_extension:
+        extension = tile_extension(scene)
+        image_settings.file_format = 'TIFF' if extension == ".tif" else 'PNG'
+        image_settings.color_mode = 'RGBA'
+        if hasattr(image_settings, 'tiff_codec'):
+            image_settings.tiff_codec = 'NONE'
+        render.filepath = os.path.join(cache_directory, "region_%s%s" % (os.getpid(), extension))
+        patch = written_still_path(render)
+        with stats.timed('render_region'):
+            bpy.ops.render.render(write_still=True)
+        stitch.paste(previous, patch, patch_rect, rect, output, scene.print_settings.dpi)
+    finally:
+        render.use_border = False
+        render.filepath, render.use_crop_to_border, image_settings.file_format, image_settings.color_mode, tiff_codec = settings
+        if tiff_codec is not None:
+            image_settings.tiff_codec = tiff_codec
+        if patch and os.path.isfile(patch):
+            os.remove(patch)
+    return True
+
+
+
+#
+# The render settings render_sheets changes, restored once done.
+# The file format comes first as it limits the color modes and depths.
+#
+RENDER_SETTINGS = ('resolution_percentage', 'use_border', 'use_crop_to_border',
+        'border_min_x', 'border_max_x', 'border_min_y', 'border_max_y', 'filepath', 'alpha_mode')
+IMAGE_SETTINGS = ('file_format', 'color_mode', 'color_depth', 'tiff_codec')
+
+
+
+def render_settings_snapshot(scene):
+    render = scene.render
+    snapshot = {
+            'render': [(name, getattr(render, name)) for name in RENDER_SETTINGS],
+            'image': [(name, getattr(render.image_settings, name))
+                    for name in IMAGE_SETTINGS if hasattr(render.image_settings, name)]
+            }
+    if hasattr(scene, 'cycles'):
+        snapshot['film_transparent'] = scene.cycles.film_transparent
+    return snapshot
+
+
+
+def restore_render_settings(scene, snapshot):
+    render = scene.render
+    for name, value in snapshot['render']:
+        setattr(render, name, value)
+    for name, value in snapshot['image']:
+        setattr(render.image_settings, name, value)
+    if 'film_transparent' in snapshot:
+        scene.cycles.film_transparent = snapshot['film_transparent']
+
+
+
+#
+# Tiles are stitched from 8 bit RGBA images which can be streamed without decoding all of it:
+# uncompressed TIFF if this blender can write it, otherwise PNG. The extension of the tile
+# path (see expand_tiled_sheet) selects the format.
+#
+def tile_extension(scene):
+    return ".tif" if hasattr(scene.render.image_settings, 'tiff_codec') else ".png"
+
+
+
+def apply_tile_format(scene, path):
+    image_settings = scene.render.image_settings
+    if os.path.splitext(path)[1].lower() in ('.tif', '.tiff'):
+        image_settings.file_format = 'TIFF'
+        image_settings.tiff_codec = 'NONE'
+    else:
+        image_settings.file_format = 'PNG'
+    image_settings.color_mode = 'RGBA'
+    image_settings.color_depth = '8'
+    # Skipped tiles are stitched transparent, so must be the background of the rendered ones:
+    scene.render.alpha_mode = 'TRANSPARENT'
+    if hasattr(scene, 'cycles'):
+        scene.cycles.film_transparent = True
+
+
+
+#
+# Applies and renders the sheets one after another, writing each to its output path.
+# Failing sheets are reported and skipped. Returns a list of results, one per sheet.
+# The render settings of the scene are restored afterwards.
+#
+def render_sheets(context, sheets):
+    results = []
+    render = context.scene.render
+    cache_directory = render_cache_directory(context)
+    fingerprint_scene = scene_fingerprint(context.scene) if cache_directory else None
+    snapshot = render_settings_snapshot(context.scene)
+    annotation_overlay_write_cb.suspended = True
+    try:
+        for index, sheet in enumerate(sheets):
+            result = {'sheet': index, 'output': sheet.get('output', ''), 'status': 'done'}
+            time_start = time.time()
+            try:
+                if not sheet.get('output'):
+                    raise ValueError("Sheet has no output path.")
+                apply_sheet(context, sheet)
+                # The pixels must match the print exactly:
+                render.resolution_percentage = 100
+                render.use_border = 'tile' in sheet
+                if render.use_border:
+                    render.use_crop_to_border = True
+                    render.border_min_x, render.border_max_x, render.border_min_y, render.border_max_y = \
+                            geometry.pixel_rect_to_border(sheet['tile'], render.resolution_x, render.resolution_y)
+                    apply_tile_format(context.scene, sheet['output'])
+                render.filepath = bpy.path.abspath(sheet['output'])
+                output = written_still_path(render)
+
+                keys = render_keys(context, fingerprint_scene) if cache_directory else None
+                cached = keys and render_cache.lookup(cache_directory, keys['key'], os.path.splitext(output)[1])
+                if cached:
+                    stats.count('render_cache_hit')
+                    if not os.path.isdir(os.path.dirname(output)):
+                        os.makedirs(os.path.dirname(output))
+                    shutil.copyfile(cached, output)
+                    result['cached'] = True
+                else:
+                    region = False
+                    if keys:
+                        try:
+                            region = render_annotations_region(context, cache_directory, keys, output)
+                        except Exception as e:
+                            print("Rendering the annotations region of sheet %s failed, rendering in full: %s" % (index, e))
+                    if region:
+                        stats.count('render_region')
+                        result['region'] = True
+                    else:
+                        with stats.timed('render'):
+                            bpy.ops.render.render(write_still=True)
+                    if keys:
+                        render_cache.store(cache_directory, keys['key'], output,
+                                info={'sheet': sheet, 'output': output, 'base': keys['base'], 'annotations': keys['annotations']})
+                        # The latest render of the sheet whatever its annotations, see render_annotations_region:
+                        render_cache.store_alias(cache_directory, keys['base'], keys['key'])
+                        render_cache.evict(cache_directory, context.scene.print_settings.render_cache_size * MB)
+                # Tiles get the annotations once stitched:
+                if 'tile' not in sheet and composite_annotations(context, output, sheet):
+                    result['annotations'] = True
+            except Exception as e:
+                print("Rendering sheet %s failed: %s" % (index, e))
+                result['status'] = 'failed'
+                result['error'] = str(e)
+            result['seconds'] = time.time() - time_start
+            results.append(result)
+            print("Sheet %s/%s %s: %s" % (index + 1, len(sheets), result['status'], result['output']))
+    finally:
+        annotation_overlay_write_cb.suspended = False
+        restore_render_settings(context.scene, snapshot)
+    return results
+
+
+
+#
+# The farm rendering the tiles runs in the background, the operator waits for it by a timer and
+# reports its result (see report.json written by render_to_print_farm).
+#
+class RENDER_OT_render_print_tiles(Operator):
+    '''Render the sheet in tiles by several background blender processes.'''
+    bl_idname = "render.render_print_tiles"
+    bl_label = "Render print tiles."
+    bl_description = "Render the sheet in tiles by several background blender processes. The tiles are written next to the render output path."
+
+    # Seconds between checking whether the farm is done.
+    tick = 0.5
+
+    def execute(self, context):
         ps = context.scene.print_settings
+        output = context.scene.render.filepath
+        if not output or output.endswith(('/', '\\')):
+            self.report({'ERROR'}, "Set a render output file path first.")
+            return {'CANCELLED'}
+
+        sheet = sheet_from_print_settings(context, output)
+        sheet['tiles'] = {'size': ps.tile_size, 'overlap': ps.tile_overlap}
+        jobs, index = expand_tiled_sheet(context, sheet)
+        directory = tiles_directory(output)
+
+        # The workers load a copy of the current state:
+        blend_file = os.path.join(directory, "sheet.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=blend_file, copy=True)
+        manifest = os.path.join(directory, "jobs.json")
+        with open(manifest, 'w') as f:
+            json.dump({'sheets': jobs}, f, indent=2)
+        self.report_path = os.path.join(directory, "report.json")
+        if os.path.isfile(self.report_path):
+            os.remove(self.report_path) # Of an earlier run.
+        self.output = index['output']
+        command = [
+                getattr(bpy.app, 'binary_path_python', sys.executable), farm.__file__, blend_file, manifest,
+                "--workers", str(ps.tile_workers), "--blender", bpy.app.binary_path,
+                "--report", self.report_path,
+                "--stitch", os.path.join(directory, "tiles.json")
+                ]
+        self.process = subprocess.Popen(command)
+        if context.window is None:
+            # No events to wait for (e.g. run from a script in the background):
+            self.process.wait()
+            return self.finish(context)
+        self.report({'INFO'}, "Rendering %s of %s tiles in the background." % (len(jobs), len(index['tiles'])))
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(self.tick, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type != 'TIMER' or self.process.poll() is None:
+            return {'PASS_THROUGH'}
+        context.window_manager.event_timer_remove(self.timer)
+        return self.finish(context)
+
+    # Reaps the farm and reports its result.
+    def finish(self, context):
+        returncode = self.process.wait()
+        report = None
+        if os.path.isfile(self.report_path):
+            with open(self.report_path) as f:
+                report = json.load(f)
+        # The report is written once the tiles are stitched:
+        if report is None:
+            self.report({'ERROR'}, "Rendering or stitching the tiles failed (exit code %s), see the console." % returncode)
+            return {'CANCELLED'}
+        if report['failed']:
+            errors = [r.get('error') for r in report['sheets'] if r.get('status') != 'done']
+            self.report({'ERROR'}, "%s of %s tiles failed, nothing stitched: %s" % (report['failed'], len(report['sheets']), errors[0]))
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Rendered %s tiles in %.1f s, written %s." % (report['done'], report['seconds'], self.output))
+        return {'FINISHED'}
 
-        pixels_from_print(context, ps)
 
-        render = context.scene.render
-        render.resolution_x = max(ps.width_px, 4)
-        render.resolution_y = max(ps.height_px, 4)
 
-        print2scale(ps, context)
+#
+# CAMERA SHEETS
+#
+# Cameras may carry their own print settings (Object.sheet_settings), e.g. a plan, an elevation and
+# a section camera each with their own preset and scale. All cameras with a sheet are rendered in one
+# pass, each applied once. Sheets whose inputs didn't change since they were last rendered are
+# skipped: A fingerprint of the inputs is stored next to the output (<output>.sheet).
+#
+CAMERA_SHEET_SETTINGS = (
+        'preset', 'orientation', 'dpi', 'width_cm', 'height_cm', 'scale_factor',
+        'use_margins', 'margin_top', 'margin_right', 'margin_bottom', 'margin_left'
+        )
+SHEET_FINGERPRINT_EXTENSION = ".sheet"
 
+
+
+@print_settings_properties(CAMERA_SHEET_SETTINGS, preset="A4_21.0_29.7", orientation="Landscape")
+class CameraSheetSettings(PropertyGroup):
+    # No update callbacks, the settings only take effect when the sheet is applied (see apply_sheet).
+    use_sheet = BoolProperty(
+            name="Print sheet"
+            ,description="Render a print sheet with these settings from this camera (see Render Camera Sheets)."
+            ,default=False
+    )
+    output = StringProperty(
+            name="Output"
+            ,description="File the sheet is rendered to, defaults to the camera name next to the blend file."
+            ,default=""
+            ,subtype='FILE_PATH'
+    )
+
+
+
+def sheet_from_camera(camera):
+    ss = camera.sheet_settings
+    sheet = {name: getattr(ss, name) for name in CAMERA_SHEET_SETTINGS}
+    sheet['camera'] = camera.name
+    sheet['output'] = ss.output or "//%s.png" % bpy.path.clean_name(camera.name)
+    return sheet
+
+
+
+#
+# The sheets of all cameras in the scene that have one, ordered by camera name.
+#
+def camera_sheets(context):
+    cameras = [o for o in context.scene.objects if o.type == 'CAMERA' and o.sheet_settings.use_sheet]
+    return [sheet_from_camera(c) for c in sorted(cameras, key=lambda c: c.name)]
+
+
+
+#
+# Fingerprint of everything the sheet's render depends on.
+#
+def sheet_fingerprint(scene, sheet, scene_fingerprint):
+    fingerprint = hashlib.sha1(scene_fingerprint.encode())
+    fingerprint.update(json.dumps(sheet, sort_keys=True).encode())
+    fingerprint.update(camera_fingerprint(scene, scene.objects[sheet['camera']]).encode())
+    fingerprint.update(scene.render.engine.encode())
+    return fingerprint.hexdigest()
+
+
+
+def read_sheet_fingerprint(output):
+    output = bpy.path.abspath(output)
+    if not os.path.isfile(output) or not os.path.isfile(output + SHEET_FINGERPRINT_EXTENSION):
+        return None
+    with open(output + SHEET_FINGERPRINT_EXTENSION) as f:
+        return f.read().strip()
+
+
+
+def write_sheet_fingerprint(output, fingerprint):
+    with open(bpy.path.abspath(output) + SHEET_FINGERPRINT_EXTENSION, 'w') as f:
+        f.write(fingerprint)
+
+
+
+#
+# Renders the sheets of all cameras in one pass (see camera_sheets), skipping unchanged sheets
+# unless forced. Returns a result per sheet, skipped sheets have the status 'skipped'.
+#
+def render_camera_sheets(context, skip_unchanged=True):
+    scene = context.scene
+    fingerprint_scene = scene_fingerprint(scene)
+    results = []
+    sheets = []
+    fingerprints = {}
+    for sheet in camera_sheets(context):
+        fingerprint = sheet_fingerprint(scene, sheet, fingerprint_scene)
+        if skip_unchanged and read_sheet_fingerprint(sheet['output']) == fingerprint:
+            print("Sheet %s of camera %s is unchanged, skipping." % (sheet['output'], sheet['camera']))
+            results.append({'output': sheet['output'], 'camera': sheet['camera'], 'status': 'skipped'})
+            continue
+        fingerprints[bpy.path.abspath(sheet['output'])] = fingerprint
+        sheets.append(sheet)
+
+    snapshot = print_settings_snapshot(context)
+    try:
+        jobs, indices = expand_sheets(context, sheets)
+        rendered = render_sheets(context, jobs)
+        rendered += stitch_sheets(indices, rendered)
+    finally:
+        restore_print_settings(context, snapshot)
+    for result in rendered:
+        output = bpy.path.abspath(result['output'])
+        if output not in fingerprints:
+            continue # A tile.
+        if result['status'] == 'done':
+            write_sheet_fingerprint(output, fingerprints[output])
+        results.append(result)
+    return results
+
+
+
+class RENDER_OT_render_camera_sheets(Operator):
+    '''Render the print sheets of all cameras that have one.'''
+    bl_idname = "render.render_camera_sheets"
+    bl_label = "Render Camera Sheets"
+    bl_description = "Render the print sheets of all cameras that have one, skipping sheets whose inputs didn't change since they were rendered."
+
+    skip_unchanged = BoolProperty(name="Skip unchanged", default=True)
+
+    def execute(self, context):
+        results = render_camera_sheets(context, skip_unchanged=self.skip_unchanged)
+        failed = [r for r in results if r['status'] == 'failed']
+        skipped = [r for r in results if r['status'] == 'skipped']
+        if failed:
+            self.report({'ERROR'}, "%s of %s sheets failed: %s" % (len(failed), len(results), failed[0].get('error', '')))
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Rendered %s sheets, %s unchanged." % (len(results) - len(skipped), len(skipped)))
         return {'FINISHED'}
 
 
 
+class DATA_PT_print_sheet(Panel):
+    bl_label = "Print Sheet"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'data'
+
+    @classmethod
+    def poll(cls, context):
+        return context.object is not None and context.object.type == 'CAMERA'
+
+    def draw_header(self, context):
+        self.layout.prop(context.object.sheet_settings, "use_sheet", text="")
+
+    def draw(self, context):
+        layout = self.layout
+        ss = context.object.sheet_settings
+        layout.active = ss.use_sheet
+
+        layout.prop(ss, "output")
+        row = layout.row(align=True)
+        row.prop(ss, "preset")
+        row.prop(ss, "orientation", text="")
+        row = layout.row(align=True)
+        row.prop(ss, "width_cm")
+        row.prop(ss, "height_cm")
+        row.active = paper_presets_data[ss.preset][0] == "custom"
+        row = layout.row(align=True)
+        row.prop(ss, "dpi")
+        row.prop(ss, "scale_factor")
+        row = layout.row(align=True)
+        row.prop(ss, "use_margins", text="")
+        row.prop(ss, "margin_top", text="Top")
+        row.prop(ss, "margin_right", text="Right")
+        row.prop(ss, "margin_bottom", text="Bottom")
+        row.prop(ss, "margin_left", text="Left")
+        layout.operator("render.render_camera_sheets", icon="RENDER_STILL")
+
+
+
+#
+# Renders the jobs of a farm queue (see render_to_print_farm) until none is pending anymore.
+#
+def work_queue(context, queue_dir, worker):
+    while True:
+        claimed = farm.claim_job(queue_dir, worker)
+        if not claimed:
+            break
+        claimed_path, job = claimed
+        stats.reset_stats()
+        result = render_sheets(context, [job['sheet']])[0]
+        result['sheet'] = job['id']
+        result['worker'] = worker
+        result['stats'] = stats.get_stats()
+        farm.finish_job(queue_dir, claimed_path, job, result)
+
+
+
+#
+# Command line:
+#   blender -b file.blend -P render_to_print.py -- jobs.json [--report report.json] [--stats stats.json] [--profile file.prof]
+# or the sheets of all cameras that have one (see camera_sheets):
+#   blender -b file.blend -P render_to_print.py -- --cameras [--force]
+# or as a worker of render_to_print_farm:
+#   blender -b file.blend -P render_to_print.py -- --queue queue_dir --worker 1
+#
+def main(argv):
+    parser = argparse.ArgumentParser(prog="render_to_print.py", description="Render print sheets to scale.")
+    parser.add_argument('manifest', nargs='?', help="JSON list of sheets to render.")
+    parser.add_argument('--report', help="Write the results as JSON to this file.")
+    parser.add_argument('--queue', help="Render the jobs of this farm queue directory.")
+    parser.add_argument('--worker', default="1", help="Name of this worker within the farm.")
+    parser.add_argument('--workers', type=int, default=0, help="Render with this many blender processes (see render_to_print_farm).")
+    parser.add_argument('--cameras', action='store_true', help="Render the sheets of all cameras that have one (see camera_sheets).")
+    parser.add_argument('--force', action='store_true', help="Render camera sheets even if they are unchanged.")
+    parser.add_argument('--stats', help="Write the stage timings and counters as JSON to this file.")
+    parser.add_argument('--profile', help="Profile with cProfile and dump the profile to this file.")
+    args = parser.parse_args(argv)
+
+    with stats.profiled(args.profile):
+        exit_code = render_from_args(args)
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(stats.get_stats(), f, indent=2)
+    return exit_code
+
+
+
+def render_from_args(args):
+    if args.queue:
+        work_queue(bpy.context, args.queue, args.worker)
+        return 0
+
+    if args.cameras:
+        results = render_camera_sheets(bpy.context, skip_unchanged=not args.force)
+    elif not args.manifest:
+        return 0
+    else:
+        results = render_manifest_sheets(bpy.context, args)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'sheets': results}, f, indent=2)
+    failed = [r for r in results if r['status'] == 'failed']
+    print(stats.format_stats())
+    print("Rendered %s of %s sheets." % (len(results) - len(failed), len(results)))
+    return 1 if failed else 0
+
+
+
+def render_manifest_sheets(context, args):
+    jobs, indices = expand_sheets(context, farm.read_manifest(args.manifest))
+    if args.workers:
+        queue_dir = os.path.splitext(args.manifest)[0] + ".queue"
+        # Jobs left over from an earlier run would be rendered again:
+        if os.path.isdir(queue_dir):
+            shutil.rmtree(queue_dir)
+        report = farm.run_farm(bpy.data.filepath, jobs, queue_dir,
+                workers=args.workers, blender=bpy.app.binary_path)
+        results = report['sheets']
+        stats.add_stats(report['stats'])
+    else:
+        results = render_sheets(context, jobs)
+    return results + stitch_sheets(indices, results)
+
+
+
 
 
 
@@ -1544,32 +3645,71 @@ def getLastObjectInSelection(context):
 
 def register():
     bpy.utils.register_class(RENDER_OT_apply_print_settings)
+    bpy.utils.register_class(WM_OT_apply_print_settings_when_idle)
+    bpy.utils.register_class(RENDER_OT_print_settings_batch)
+    bpy.utils.register_class(RENDER_OT_render_print_tiles)
     bpy.utils.register_class(RENDER_OT_ensure_height)
+    bpy.utils.register_class(RENDER_OT_fit_scale)
     bpy.utils.register_class(OBJECT_OT_text_change)
     bpy.utils.register_class(OBJECT_OT_position_within_render)
+    bpy.utils.register_class(OBJECT_OT_position_selected_within_render)
     bpy.utils.register_class(OBJECT_OT_position_in_top_left_corner)
     bpy.utils.register_class(OBJECT_OT_position_in_top_right_corner)
     bpy.utils.register_class(OBJECT_OT_position_in_bottom_right_corner)
     bpy.utils.register_class(OBJECT_OT_position_in_bottom_left_corner)
     bpy.utils.register_class(RENDER_PT_print)
     bpy.utils.register_class(RenderPrintSettings)
+    bpy.utils.register_class(CameraSheetSettings)
+    bpy.utils.register_class(RENDER_OT_render_camera_sheets)
+    bpy.utils.register_class(DATA_PT_print_sheet)
 
     Scene.print_settings = PointerProperty(type=RenderPrintSettings)
+    Object.sheet_settings = PointerProperty(type=CameraSheetSettings)
+
+    bpy.app.handlers.scene_update_post.append(bounds_cache_update_cb)
+    bpy.app.handlers.load_post.append(bounds_cache_load_cb)
+    bpy.app.handlers.load_post.append(derived_settings_load_cb)
+    if hasattr(bpy.app.handlers, 'render_write'):
+        bpy.app.handlers.render_write.append(annotation_overlay_write_cb)
 
 
 def unregister():
     bpy.utils.unregister_class(RENDER_OT_apply_print_settings)
+    bpy.utils.unregister_class(WM_OT_apply_print_settings_when_idle)
+    bpy.utils.unregister_class(RENDER_OT_print_settings_batch)
+    bpy.utils.unregister_class(RENDER_OT_render_print_tiles)
     bpy.utils.unregister_class(RENDER_OT_ensure_height)
+    bpy.utils.unregister_class(RENDER_OT_fit_scale)
     bpy.utils.unregister_class(OBJECT_OT_text_change)
     bpy.utils.unregister_class(OBJECT_OT_position_within_render)
+    bpy.utils.unregister_class(OBJECT_OT_position_selected_within_render)
     bpy.utils.unregister_class(OBJECT_OT_position_in_top_left_corner)
     bpy.utils.unregister_class(OBJECT_OT_position_in_top_right_corner)
     bpy.utils.unregister_class(OBJECT_OT_position_in_bottom_right_corner)
     bpy.utils.unregister_class(OBJECT_OT_position_in_bottom_left_corner)
     bpy.utils.unregister_class(RENDER_PT_print)
     bpy.utils.unregister_class(RenderPrintSettings)
+    bpy.utils.unregister_class(CameraSheetSettings)
+    bpy.utils.unregister_class(RENDER_OT_render_camera_sheets)
+    bpy.utils.unregister_class(DATA_PT_print_sheet)
     del Scene.print_settings
+    del Object.sheet_settings
+
+    if bounds_cache_update_cb in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(bounds_cache_update_cb)
+    if bounds_cache_load_cb in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(bounds_cache_load_cb)
+    if derived_settings_load_cb in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(derived_settings_load_cb)
+    if annotation_overlay_write_cb in getattr(bpy.app.handlers, 'render_write', ()):
+        bpy.app.handlers.render_write.remove(annotation_overlay_write_cb)
+    apply_when_idle.waiting = False
 
 
 if __name__ == "__main__":
     register()
+    # Arguments after '--' are meant for this script, blender ignores them:
+    if '--' in sys.argv:
+        exit_code = main(sys.argv[sys.argv.index('--') + 1:])
+        if exit_code and bpy.app.background:
+            sys.exit(exit_code)
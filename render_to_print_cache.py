@@ -0,0 +1,162 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Content addressed render cache: renders are stored under a key hashing everything their pixels
+# depend on (see render_key in render_to_print.py), so unchanged sheets are copied from the cache
+# instead of rendered again. Layout of the cache directory:
+#
+#   <key[:2]>/<key><extension>    the render,
+#   <key[:2]>/<key>.json          what is known about it (e.g. the sheet and its annotations),
+#   <name[:2]>/<name>.alias       the key of the render last stored under another name (alias).
+#
+# A cache hit touches the file, eviction removes the least recently used renders until the cache
+# fits its size. Doesn't import bpy.
+#
+
+import json
+import os
+import shutil
+
+
+INFO_EXTENSION = ".json"
+ALIAS_EXTENSION = ".alias"
+
+
+
+def cache_file(directory, key, extension):
+    return os.path.join(directory, key[:2], key + extension)
+
+
+
+#
+# Returns the path of the cached render or None.
+#
+def lookup(directory, key, extension):
+    path = cache_file(directory, key, extension)
+    if not os.path.isfile(path):
+        return None
+    try:
+        os.utime(path, None) # Recently used.
+    except OSError:
+        pass
+    return path
+
+
+
+#
+# Copies the render at path into the cache, with optional info (JSON serializable).
+#
+def store(directory, key, path, info=None):
+    extension = os.path.splitext(path)[1]
+    target = cache_file(directory, key, extension)
+    if not os.path.isdir(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    # Other processes (farm workers) may look up the same key, the rename makes it appear atomically:
+    target_tmp = "%s.%s.tmp" % (target, os.getpid())
+    shutil.copyfile(path, target_tmp)
+    os.replace(target_tmp, target)
+    if info is not None:
+        info_tmp = "%s.%s.tmp" % (cache_file(directory, key, INFO_EXTENSION), os.getpid())
+        with open(info_tmp, 'w') as f:
+            json.dump(info, f, indent=2)
+        os.replace(info_tmp, cache_file(directory, key, INFO_EXTENSION))
+    return target
+
+
+
+#
+# Remembers key under another name, e.g. the latest render of a sheet whatever its annotations.
+# Aliases aren't evicted, an alias of an evicted render simply isn't found by lookup anymore.
+#
+def store_alias(directory, alias, key):
+    path = cache_file(directory, alias, ALIAS_EXTENSION)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    path_tmp = "%s.%s.tmp" % (path, os.getpid())
+    with open(path_tmp, 'w') as f:
+        f.write(key)
+    os.replace(path_tmp, path)
+
+
+
+def read_alias(directory, alias):
+    path = cache_file(directory, alias, ALIAS_EXTENSION)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+
+def read_info(directory, key):
+    path = cache_file(directory, key, INFO_EXTENSION)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+
+def _entries(directory):
+    entries = []
+    if not os.path.isdir(directory):
+        return entries
+    for sub in os.listdir(directory):
+        sub_directory = os.path.join(directory, sub)
+        if not os.path.isdir(sub_directory):
+            continue
+        for name in os.listdir(sub_directory):
+            if name.endswith((".tmp", INFO_EXTENSION, ALIAS_EXTENSION)):
+                continue
+            path = os.path.join(sub_directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # Evicted by another process meanwhile.
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+
+def cache_size(directory):
+    return sum(size for mtime, size, path in _entries(directory))
+
+
+
+#
+# Removes the least recently used renders (and their info) until the cache holds at most max_bytes.
+# Returns the number of bytes freed.
+#
+def evict(directory, max_bytes):
+    entries = sorted(_entries(directory))
+    total = sum(size for mtime, size, path in entries)
+    freed = 0
+    for mtime, size, path in entries:
+        if total - freed <= max_bytes:
+            break
+        info = os.path.splitext(path)[0] + INFO_EXTENSION
+        for p in (path, info):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        freed += size
+    return freed
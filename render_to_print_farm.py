@@ -0,0 +1,362 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Render farm for print sheets: spreads the sheets of a job manifest over several background
+# blender processes on this machine. Runs with plain python (no bpy), e.g.
+#
+#   python render_to_print_farm.py file.blend jobs.json --workers 16 --report report.json
+#
+# The work queue is a directory, each job is a JSON file that moves through
+#   pending/            waiting to be rendered,
+#   claimed/<worker>/   being rendered by a worker (claiming is an atomic rename),
+#   done/, failed/      finished, including the worker's result.
+# Failed jobs and the jobs of crashed workers are put back to pending until they have been
+# attempted max_attempts times. Workers holding a job longer than the job timeout are killed.
+# If workers keep exiting without finishing any job (e.g. the blend file doesn't load), the
+# pending jobs are failed and the farm gives up.
+#
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import render_to_print_stats as stats
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_to_print.py")
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+
+
+def _write_json(path, data):
+    # Write to a temporary file first, the rename makes the job appear atomically:
+    path_tmp = path + ".tmp"
+    with open(path_tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.rename(path_tmp, path)
+
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+
+def _job_files(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(n for n in os.listdir(directory) if n.endswith(".json"))
+
+
+
+#
+# Reads a job manifest, either a list of sheets or {"defaults": {...}, "sheets": [...]}
+# where the defaults apply to every sheet that doesn't override them.
+#
+def read_manifest(path):
+    manifest = _read_json(path)
+    if isinstance(manifest, list):
+        manifest = {'sheets': manifest}
+    defaults = manifest.get('defaults', {})
+    sheets = []
+    for sheet in manifest.get('sheets', []):
+        merged = dict(defaults)
+        merged.update(sheet)
+        sheets.append(merged)
+    return sheets
+
+
+
+#
+# Creates the queue directory with one pending job per sheet.
+#
+def create_queue(queue_dir, sheets):
+    for d in (PENDING, CLAIMED, DONE, FAILED):
+        path = os.path.join(queue_dir, d)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    for index, sheet in enumerate(sheets):
+        job = {'id': index, 'attempts': 0, 'sheet': sheet}
+        _write_json(os.path.join(queue_dir, PENDING, "%06d.json" % index), job)
+
+
+
+#
+# Claims the next pending job for the worker.
+# Returns (claimed path, job) or None if nothing is pending anymore.
+#
+def claim_job(queue_dir, worker):
+    claimed_dir = os.path.join(queue_dir, CLAIMED, str(worker))
+    if not os.path.isdir(claimed_dir):
+        os.makedirs(claimed_dir)
+    for name in _job_files(os.path.join(queue_dir, PENDING)):
+        path = os.path.join(claimed_dir, name)
+        try:
+            os.rename(os.path.join(queue_dir, PENDING, name), path)
+        except OSError:
+            continue # Another worker was quicker.
+        os.utime(path, None) # The claim time, see claimed_since.
+        return path, _read_json(path)
+    return None
+
+
+
+#
+# Records the result of a claimed job, moving it to done or failed.
+#
+def finish_job(queue_dir, claimed_path, job, result):
+    job['attempts'] = job.get('attempts', 0) + 1
+    job['result'] = result
+    state = DONE if result.get('status') == 'done' else FAILED
+    _write_json(os.path.join(queue_dir, state, os.path.basename(claimed_path)), job)
+    os.remove(claimed_path)
+
+
+
+#
+# Puts the jobs left over by a worker that exited back to pending (or to failed if attempted too often).
+#
+def release_claimed(queue_dir, worker, max_attempts, error=None):
+    claimed_dir = os.path.join(queue_dir, CLAIMED, str(worker))
+    for name in _job_files(claimed_dir):
+        path = os.path.join(claimed_dir, name)
+        job = _read_json(path)
+        job['attempts'] = job.get('attempts', 0) + 1
+        if job['attempts'] < max_attempts:
+            _write_json(os.path.join(queue_dir, PENDING, name), job)
+        else:
+            job['result'] = {'sheet': job['id'], 'status': 'failed', 'error': error or "Worker %s exited while rendering." % worker}
+            _write_json(os.path.join(queue_dir, FAILED, name), job)
+        os.remove(path)
+
+
+
+#
+# Since when (time stamp) the worker holds its oldest claimed job, None if it holds none.
+#
+def claimed_since(queue_dir, worker):
+    claimed_dir = os.path.join(queue_dir, CLAIMED, str(worker))
+    times = []
+    for name in _job_files(claimed_dir):
+        try:
+            times.append(os.path.getmtime(os.path.join(claimed_dir, name)))
+        except OSError:
+            pass # Finished meanwhile.
+    return min(times) if times else None
+
+
+
+#
+# Moves all pending jobs to failed with the given error. Returns how many.
+#
+def fail_pending(queue_dir, error):
+    names = _job_files(os.path.join(queue_dir, PENDING))
+    for name in names:
+        path = os.path.join(queue_dir, PENDING, name)
+        job = _read_json(path)
+        job['result'] = {'sheet': job['id'], 'status': 'failed', 'error': error}
+        _write_json(os.path.join(queue_dir, FAILED, name), job)
+        os.remove(path)
+    return len(names)
+
+
+
+#
+# How many jobs are done or failed for good, failed jobs to be attempted again aren't finished.
+#
+def _finished_count(queue_dir, max_attempts):
+    failed = 0
+    for name in _job_files(os.path.join(queue_dir, FAILED)):
+        job = _read_json(os.path.join(queue_dir, FAILED, name))
+        if job.get('attempts', 0) >= max_attempts:
+            failed += 1
+    return len(_job_files(os.path.join(queue_dir, DONE))) + failed
+
+
+
+#
+# Moves failed jobs that may be attempted again back to pending. Returns how many.
+#
+def retry_failed(queue_dir, max_attempts):
+    count = 0
+    for name in _job_files(os.path.join(queue_dir, FAILED)):
+        path = os.path.join(queue_dir, FAILED, name)
+        job = _read_json(path)
+        if job.get('attempts', 0) < max_attempts:
+            os.rename(path, os.path.join(queue_dir, PENDING, name))
+            count += 1
+    return count
+
+
+
+#
+# Merges the results of all finished jobs into one report, ordered like the manifest.
+# The stage timings of the jobs are summed up in 'stats'.
+#
+def merge_report(queue_dir):
+    sheets = []
+    for state in (DONE, FAILED):
+        for name in _job_files(os.path.join(queue_dir, state)):
+            job = _read_json(os.path.join(queue_dir, state, name))
+            result = dict(job.get('result', {}))
+            result['sheet'] = job['id']
+            result['attempts'] = job.get('attempts', 0)
+            result.setdefault('output', job['sheet'].get('output', ''))
+            sheets.append(result)
+    sheets.sort(key=lambda r: r['sheet'])
+    failed = len([r for r in sheets if r.get('status') != 'done'])
+    merged = {}
+    for result in sheets:
+        stats.merge_stats(merged, result.get('stats', {}))
+    return {'sheets': sheets, 'done': len(sheets) - failed, 'failed': failed, 'stats': merged}
+
+
+
+def worker_command(blender, blend_file, queue_dir, worker, threads=0):
+    command = [blender, "-b", blend_file]
+    if threads:
+        command += ["-t", str(threads)]
+    return command + ["-P", SCRIPT, "--", "--queue", queue_dir, "--worker", str(worker)]
+
+
+
+#
+# Renders the sheets with the given number of background blender workers fed by the queue.
+#   job_timeout        Seconds a worker may spend on one job before it is killed, 0 for no limit.
+#   max_idle_exits     How many workers in a row may exit without any job finishing meanwhile
+#                      while jobs are pending, before the pending jobs are failed. Jobs failed
+#                      to be attempted again don't count as finished.
+# Returns the merged report.
+#
+def run_farm(blend_file, sheets, queue_dir, workers=4, max_attempts=2, blender="blender", threads=0, poll_interval=0.5,
+        job_timeout=0, max_idle_exits=3):
+    create_queue(queue_dir, sheets)
+    running = {}
+    timed_out = set()
+    worker_count = 0
+    idle_exits = 0
+    finished = 0
+    time_start = time.time()
+    while True:
+        # Kill workers hanging on a job, they are reaped below:
+        if job_timeout:
+            for worker, process in running.items():
+                since = claimed_since(queue_dir, worker)
+                if since is not None and time.time() - since > job_timeout and worker not in timed_out:
+                    print("Worker %s exceeded the job timeout of %s s, killing it." % (worker, job_timeout))
+                    timed_out.add(worker)
+                    process.kill()
+
+        # Reap exited workers, their unfinished jobs go back to the queue:
+        for worker, process in list(running.items()):
+            if process.poll() is not None:
+                del running[worker]
+                error = "Job timeout (%s s) exceeded by worker %s." % (job_timeout, worker) if worker in timed_out else None
+                release_claimed(queue_dir, worker, max_attempts, error)
+                finished_now = _finished_count(queue_dir, max_attempts)
+                pending = len(_job_files(os.path.join(queue_dir, PENDING)))
+                # Workers exit by themselves once nothing is pending, otherwise only if something is wrong:
+                if finished_now == finished and pending:
+                    idle_exits += 1
+                else:
+                    idle_exits = 0
+                finished = finished_now
+        retry_failed(queue_dir, max_attempts)
+
+        if idle_exits >= max_idle_exits:
+            error = "%s workers in a row exited without finishing a job, giving up (does the blend file load?)." % idle_exits
+            print(error)
+            fail_pending(queue_dir, error)
+            for process in running.values():
+                process.kill()
+                process.wait()
+            for worker in running:
+                release_claimed(queue_dir, worker, 0, error)
+            running.clear()
+
+        pending = len(_job_files(os.path.join(queue_dir, PENDING)))
+        if not pending and not running:
+            break
+
+        # Workers exit when the queue runs dry, start new ones while there is work left:
+        while pending > len(running) and len(running) < workers:
+            worker_count += 1
+            command = worker_command(blender, blend_file, queue_dir, worker_count, threads)
+            print("Starting worker %s: %s" % (worker_count, " ".join(command)))
+            running[worker_count] = subprocess.Popen(command)
+
+        time.sleep(poll_interval)
+
+    report = merge_report(queue_dir)
+    report['seconds'] = time.time() - time_start
+    report['workers'] = workers
+    return report
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the print sheets of a job manifest with several blender processes.")
+    parser.add_argument('blend_file')
+    parser.add_argument('manifest')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--threads', type=int, default=0, help="Render threads per worker, 0 lets blender decide.")
+    parser.add_argument('--attempts', type=int, default=2, help="How often a sheet is attempted before it is given up.")
+    parser.add_argument('--job-timeout', type=float, default=0, help="Seconds a worker may render one sheet before it is killed, 0 for no limit.")
+    parser.add_argument('--max-idle-exits', type=int, default=3,
+            help="Give up after this many workers in a row exited without finishing a sheet.")
+    parser.add_argument('--blender', default="blender")
+    parser.add_argument('--queue', help="Queue directory, defaults to <manifest>.queue (recreated).")
+    parser.add_argument('--report')
+    parser.add_argument('--stitch', action='append', default=[], help="Tile index (tiles.json) to stitch once all sheets are rendered.")
+    args = parser.parse_args(argv)
+
+    queue_dir = args.queue or os.path.splitext(args.manifest)[0] + ".queue"
+    if os.path.isdir(queue_dir):
+        shutil.rmtree(queue_dir)
+
+    report = run_farm(args.blend_file, read_manifest(args.manifest), queue_dir,
+            workers=args.workers, max_attempts=args.attempts, blender=args.blender, threads=args.threads,
+            job_timeout=args.job_timeout, max_idle_exits=args.max_idle_exits)
+    if args.stitch and not report['failed']:
+        import render_to_print_stitch
+        for index in args.stitch:
+            print("Written %s" % render_to_print_stitch.stitch(index))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['stats']:
+        print(stats.format_stats(report['stats']))
+    print("Rendered %s of %s sheets in %.1f s." % (report['done'], len(report['sheets']), report['seconds']))
+    return 1 if report['failed'] else 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
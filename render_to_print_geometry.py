@@ -0,0 +1,565 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Print geometry of the render to print addon.
+#
+# Everything in here is plain math on numbers (or NumPy arrays), it must not import bpy.
+# That way sheet variants can be solved outside of blender, e.g. thousands at once
+# using solve_print_geometry(), while the addon uses the scalar functions for the
+# currently active print settings.
+#
+
+import math
+
+# The paper presets are kept by the preset registry, re-exported here for the print math:
+from render_to_print_presets import (paper_presets,
+                                     paper_enum_parse,
+                                     paper_presets_data,
+                                     presets_covering,
+                                     rolls_covering
+                                     )
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # Only required by the vectorized solver.
+
+
+in_TO_cm = 2.54 # conversion factor
+m_TO_cm = 100.0
+
+# Blender refuses smaller render resolutions.
+PIXELS_MIN = 4
+
+
+
+#
+# First parameter 'rel_or_abs' may be either relative or absolute.
+# If the value is already absolute then it itself is returned.
+#
+def rel_to_abs_m(rel_or_abs, ref_size):
+    margin_m = rel_or_abs
+    if rel_or_abs >= 1:
+        # relative
+        margin_m = ref_size * rel_or_abs / 100.0
+    return margin_m
+
+
+
+def printed_m_to_pixels(m, dpi):
+    return round(m * m_TO_cm / in_TO_cm * float(dpi))
+
+
+
+def pixels_to_printed_m(pixel, dpi):
+    return float(pixel) / float(dpi) * in_TO_cm / m_TO_cm
+
+
+
+#
+# Width and height in cm of a (non custom) paper preset in the given orientation.
+#
+def sheet_size_cm(dim_w, dim_h, orientation):
+    if orientation == "Landscape":
+        return dim_h, dim_w
+    return dim_w, dim_h
+
+
+
+#
+# Pixels required to print the given length minus the margins at both ends.
+# The reference size (m) is what relative margins (>= 1, i.e. percent) refer to.
+#
+def printable_pixels(length_cm, dpi, margin_a=0.0, margin_b=0.0, ref_size_m=0.0, use_margins=False):
+    m = length_cm / m_TO_cm
+    if use_margins:
+        m = m - rel_to_abs_m(margin_a, ref_size_m) - rel_to_abs_m(margin_b, ref_size_m)
+    return max(printed_m_to_pixels(m, dpi), PIXELS_MIN)
+
+
+
+#
+# The camera's delta location that centers the printable area within the sheet,
+# i.e. shifts the render by the difference of the opposite margins.
+#
+def camera_delta_offset(margins, ref_size_x_m, ref_size_y_m):
+    margin_top, margin_right, margin_bottom, margin_left = margins
+    delta_x = rel_to_abs_m(margin_left, ref_size_x_m) - rel_to_abs_m(margin_right, ref_size_x_m)
+    delta_y = rel_to_abs_m(margin_bottom, ref_size_y_m) - rel_to_abs_m(margin_top, ref_size_y_m)
+    return delta_x, delta_y
+
+
+
+#
+# The longer printable side of the sheet in meters (margins subtracted if used).
+#
+def longer_printable_side_m(width_cm, height_cm, margins, ref_size_x_m, ref_size_y_m, use_margins=True):
+    margin_top, margin_right, margin_bottom, margin_left = margins
+    if width_cm > height_cm:
+        longer_side = width_cm / m_TO_cm
+        if use_margins:
+            longer_side = longer_side - rel_to_abs_m(margin_left, ref_size_x_m) - rel_to_abs_m(margin_right, ref_size_x_m)
+    else:
+        longer_side = height_cm / m_TO_cm
+        if use_margins:
+            longer_side = longer_side - rel_to_abs_m(margin_top, ref_size_y_m) - rel_to_abs_m(margin_bottom, ref_size_y_m)
+    return longer_side
+
+
+
+#
+# Orthographic_scale * scale_factor = H_format_real / unit_settings_scale_length
+# (see print2scale__calculate_camera_paramaters for the derivation).
+#
+def ortho_scale(longer_side_m, scale_factor, scale_length=1.0):
+    return (longer_side_m / scale_length) / scale_factor
+
+
+
+def get_smallest_central_and_largest(vector_3d):
+    x = vector_3d[0]
+    y = vector_3d[1]
+    z = vector_3d[2]
+    #print("get_smallest_central_and_largest(): vector_3d: ", vector_3d)
+    # By default it is assumed that the text is looked onto directly from positive Z axis towards negative Z axis.
+    second_largest_index = 0
+    largest_index = 2
+    smallest_index = 1
+    if x > y and x <= z or x > z and x <= y:
+        second_largest_index = 0
+        largest_index = 1
+        smallest_index = 2
+        if z > y:
+            largest_index = 2
+            smallest_index = 1
+    elif y > x and y <= z or y > z and y <= x:
+        second_largest_index = 1
+        largest_index = 0
+        smallest_index = 2
+        if z > x:
+            largest_index = 2
+            smallest_index = 0
+    elif z > x and z <= y or z > y and z <= x:
+        second_largest_index = 2
+        largest_index = 0
+        smallest_index = 1
+        if y > x:
+            largest_index = 1
+            smallest_index = 0
+
+    #else: # All are equal length, just stick to x.
+    # There had been a bug if two are equal and one differs. Then the wrong one is picked as second longest. While the transition from the < to the <= operator works around this bug, sorting a list instead might still be useful for performance (because random access in a list is constant).
+    return smallest_index, second_largest_index, largest_index
+
+
+
+def convertScaleFactorToRatioString(scale_factor, precision=2):
+    text = None
+    if (scale_factor < 1):
+        num = scale_factor
+        #while str(num).find('.') != -1:
+        #denominator = 1
+        #while round(num * denominator, 0) != num * denominator:
+        #    denominator = denominator * 10
+        if (num != 0):
+            rounded = round(1 / num, precision)
+            rounded_to_integer = round(rounded, 0)
+            if rounded_to_integer == rounded:
+                rounded = int(rounded_to_integer)
+            text = ' 1:' + str(rounded)
+
+    else:
+        rounded = round(scale_factor, precision)
+        rounded_to_integer = round(rounded, 0)
+        if rounded_to_integer == rounded:
+            rounded = int(rounded_to_integer)
+        text = str(rounded) + ':1'
+
+    return text
+
+
+
+#
+# Standard drawing scales (as scale factors), the 1, 2, 5 series from 10:1 down to 1:100000.
+#
+STANDARD_SCALES = (10.0, 5.0, 2.0) + tuple(
+        1.0 / (m * 10 ** e) for e in range(6) for m in (1, 2, 5) if m * 10 ** e <= 100000
+        )
+
+
+
+#
+# The largest of the scales at which content of the given size (blender units as seen by the camera)
+# fits into the printable area (m). Returns None if it doesn't fit even at the smallest scale.
+#
+def largest_fitting_scale(content_width, content_height, printable_width_m, printable_height_m,
+        scale_length=1.0, scales=STANDARD_SCALES):
+    limits = []
+    if content_width > 0:
+        limits.append(printable_width_m / (content_width * scale_length))
+    if content_height > 0:
+        limits.append(printable_height_m / (content_height * scale_length))
+    if not limits:
+        return max(scales)
+    scale_max = min(limits) * (1 + 1e-9) # Exactly fitting content is fine.
+    fitting = [s for s in scales if s <= scale_max]
+    return max(fitting) if fitting else None
+
+
+
+#
+# Vectorized counterpart of rel_to_abs_m.
+#
+def _rel_to_abs_m_array(rel_or_abs, ref_size):
+    return numpy.where(rel_or_abs >= 1, ref_size * rel_or_abs / 100.0, rel_or_abs)
+
+
+
+#
+# The printable side (m) of a sheet side between two margins when percent margins refer to the
+# printable side itself (as they do in the addon, which takes them of the render resolution):
+#   printable = side - absolute - percent / 100 * printable
+#
+def _printable_side_m_array(side_m, margin_a, margin_b):
+    absolute = numpy.where(margin_a < 1, margin_a, 0.0) + numpy.where(margin_b < 1, margin_b, 0.0)
+    percent = numpy.where(margin_a >= 1, margin_a, 0.0) + numpy.where(margin_b >= 1, margin_b, 0.0)
+    return (side_m - absolute) / (1.0 + percent / 100.0)
+
+
+
+#
+# Solves the print geometry of many sheet variants at once.
+#
+# All arguments are broadcast against each other, so scalars may be mixed with arrays:
+#   presets      idnames as in paper_presets, e.g. "A4_21.0_29.7". Custom presets take
+#                their size from width_cm and height_cm. Rolls only fix the width across the
+#                roll, the length is taken from height_cm (Portrait) or width_cm (Landscape)
+#                like pixels_from_print does.
+#   orientations "Portrait" or "Landscape" (ignored for custom presets).
+#   margins      margin_top, margin_right, margin_bottom, margin_left. As in the addon,
+#                values >= 1 are percent of the reference size, smaller ones are meters.
+#   resolution_x, resolution_y
+#                The render size (pixels) relative margins refer to. The addon uses the
+#                scene's current render resolution. If not given, the printable size the
+#                margins result in is used, i.e. the resolution the addon settles at.
+#
+# Returns a dict of arrays: width_cm, height_cm, width_px, height_px, delta_x, delta_y
+# (camera delta location) and ortho_scale.
+#
+def solve_print_geometry(presets, orientations="Portrait", dpi=300,
+        margin_top=0.0, margin_right=0.0, margin_bottom=0.0, margin_left=0.0,
+        scale_factor=1.0, scale_length=1.0, use_margins=True,
+        width_cm=None, height_cm=None, resolution_x=None, resolution_y=None):
+    if numpy is None:
+        raise ImportError("solve_print_geometry requires numpy.")
+
+    presets = numpy.asarray(presets)
+    orientations = numpy.asarray(orientations)
+    presets, orientations = numpy.broadcast_arrays(presets, orientations)
+
+    # Look up every distinct preset once only:
+    unique_presets, inverse = numpy.unique(presets, return_inverse=True)
+    inverse = inverse.reshape(presets.shape)
+    dims = numpy.array([paper_presets_data[p][1:] for p in unique_presets], dtype=float).reshape(-1, 2)
+    is_custom = numpy.array([paper_presets_data[p][0] == "custom" for p in unique_presets], dtype=bool)[inverse]
+    is_roll = numpy.array([paper_presets_data[p][0] == "roll" for p in unique_presets], dtype=bool)[inverse]
+    dim_w = dims[inverse, 0]
+    dim_h = dims[inverse, 1]
+
+    landscape = orientations == "Landscape"
+    sheet_w = numpy.where(landscape, dim_h, dim_w)
+    sheet_h = numpy.where(landscape, dim_w, dim_h)
+    if numpy.any(is_custom) or numpy.any(is_roll):
+        if width_cm is None or height_cm is None:
+            raise ValueError("Custom and roll presets require width_cm and height_cm.")
+        sheet_w = numpy.where(is_custom, width_cm, sheet_w)
+        sheet_h = numpy.where(is_custom, height_cm, sheet_h)
+        # The roll's width runs across, its length is up to the user:
+        sheet_w = numpy.where(is_roll, numpy.where(landscape, width_cm, dim_w), sheet_w)
+        sheet_h = numpy.where(is_roll, numpy.where(landscape, dim_w, height_cm), sheet_h)
+
+    dpi = numpy.asarray(dpi, dtype=float)
+    use_margins = numpy.asarray(use_margins, dtype=bool)
+    margin_top = numpy.asarray(margin_top, dtype=float)
+    margin_right = numpy.asarray(margin_right, dtype=float)
+    margin_bottom = numpy.asarray(margin_bottom, dtype=float)
+    margin_left = numpy.asarray(margin_left, dtype=float)
+
+    if resolution_x is None:
+        ref_x_m = _printable_side_m_array(sheet_w / m_TO_cm, margin_left, margin_right)
+    else:
+        ref_x_m = numpy.asarray(resolution_x, dtype=float) / dpi * in_TO_cm / m_TO_cm
+    if resolution_y is None:
+        ref_y_m = _printable_side_m_array(sheet_h / m_TO_cm, margin_top, margin_bottom)
+    else:
+        ref_y_m = numpy.asarray(resolution_y, dtype=float) / dpi * in_TO_cm / m_TO_cm
+
+    zero = numpy.zeros_like(sheet_w) # Results take the shape of the inputs.
+    margin_top_m = numpy.where(use_margins, _rel_to_abs_m_array(margin_top, ref_y_m), zero)
+    margin_bottom_m = numpy.where(use_margins, _rel_to_abs_m_array(margin_bottom, ref_y_m), zero)
+    margin_left_m = numpy.where(use_margins, _rel_to_abs_m_array(margin_left, ref_x_m), zero)
+    margin_right_m = numpy.where(use_margins, _rel_to_abs_m_array(margin_right, ref_x_m), zero)
+
+    printable_w_m = sheet_w / m_TO_cm - margin_left_m - margin_right_m
+    printable_h_m = sheet_h / m_TO_cm - margin_top_m - margin_bottom_m
+    # In the order printed_m_to_pixels computes, the pixels may round differently otherwise:
+    width_px = numpy.maximum(numpy.round(printable_w_m * m_TO_cm / in_TO_cm * dpi), PIXELS_MIN).astype(int)
+    height_px = numpy.maximum(numpy.round(printable_h_m * m_TO_cm / in_TO_cm * dpi), PIXELS_MIN).astype(int)
+
+    longer_side = numpy.where(sheet_w > sheet_h, printable_w_m, printable_h_m)
+    ortho = longer_side / numpy.asarray(scale_length, dtype=float) / numpy.asarray(scale_factor, dtype=float)
+
+    return {
+        'width_cm': sheet_w,
+        'height_cm': sheet_h,
+        'width_px': width_px,
+        'height_px': height_px,
+        'delta_x': margin_left_m - margin_right_m,
+        'delta_y': margin_bottom_m - margin_top_m,
+        'ortho_scale': ortho,
+        }
+
+
+
+#
+# The sheet side (m) required to print content_m between two margins, which are absolute (m) or
+# percent (>= 1) as for rel_to_abs_m. Like in the addon percent margins refer to the render,
+# i.e. the printable side, which is content_m here.
+#
+def required_side_m(content_m, margin_a=0.0, margin_b=0.0):
+    return content_m + rel_to_abs_m(margin_a, content_m) + rel_to_abs_m(margin_b, content_m)
+
+
+
+#
+# The smallest registered sheet (by area) the content fits on when printed to scale.
+#
+#   content_width, content_height
+#                The content's size as seen by the camera in blender units.
+#   margins      margin_top, margin_right, margin_bottom, margin_left as in the print settings.
+#   use_rolls    Rolls are considered too, cut to the required length.
+#
+# Returns a dict: preset, orientation, width_cm, height_cm (the roll length included) and the
+# area_cm2, or None if nothing is large enough.
+#
+def smallest_fitting_preset(content_width, content_height, scale_factor=1.0, margins=(0.0, 0.0, 0.0, 0.0),
+        scale_length=1.0, use_rolls=True):
+    margin_top, margin_right, margin_bottom, margin_left = margins
+    width_m = required_side_m(content_width * scale_length * scale_factor, margin_left, margin_right)
+    height_m = required_side_m(content_height * scale_length * scale_factor, margin_top, margin_bottom)
+    width_cm = width_m * m_TO_cm
+    height_cm = height_m * m_TO_cm
+
+    best = None
+    for idname in presets_covering(width_cm, height_cm):
+        tipo, dim_w, dim_h = paper_presets_data[idname]
+        orientation = "Portrait" if dim_w >= width_cm and dim_h >= height_cm else "Landscape"
+        sheet_w, sheet_h = sheet_size_cm(dim_w, dim_h, orientation)
+        best = {'preset': idname, 'orientation': orientation, 'width_cm': sheet_w, 'height_cm': sheet_h, 'area_cm2': sheet_w * sheet_h}
+        break # Smallest area first.
+
+    if use_rolls:
+        for roll_width, max_length, idname in rolls_covering(min(width_cm, height_cm)):
+            # Portrait: The roll runs vertically, its width is the sheet width.
+            for orientation, across, length in (("Portrait", width_cm, height_cm), ("Landscape", height_cm, width_cm)):
+                length = math.ceil(length * 10.0) / 10.0 # Cut in mm.
+                if roll_width < across or (max_length and length > max_length):
+                    continue
+                if best is None or roll_width * length < best['area_cm2']:
+                    sheet_w, sheet_h = sheet_size_cm(roll_width, length, orientation)
+                    best = {'preset': idname, 'orientation': orientation, 'width_cm': sheet_w, 'height_cm': sheet_h, 'area_cm2': roll_width * length}
+    return best
+
+
+
+#
+# Lays out boxes (width, height as printed, in meters) within a frame of the given size,
+# keeping margin_h, margin_v distance to its edges and spacing between the boxes.
+#
+#   layout  'CORNER' stacks the boxes vertically in the given corner,
+#           'EDGE' flows them along the top or bottom edge starting at the given corner,
+#                  wrapping to a new row when a row is full,
+#           'GRID' lays them out in equally sized cells starting at the given corner,
+#                  columns = 0 chooses a square grid.
+#   corner  'TOP_LEFT', 'TOP_RIGHT', 'BOTTOM_LEFT' or 'BOTTOM_RIGHT'.
+#
+# Returns the offsets (left, top) of every box from the frame's top left corner.
+#
+def layout_boxes(sizes, frame_w, frame_h, margin_h=0.0, margin_v=0.0,
+        layout='GRID', corner='TOP_LEFT', columns=0, spacing=0.0):
+    offsets = []
+    if not sizes:
+        return offsets
+
+    if layout == 'CORNER':
+        top = margin_v
+        for w, h in sizes:
+            offsets.append((margin_h, top))
+            top += h + spacing
+
+    elif layout == 'EDGE':
+        available = frame_w - 2 * margin_h
+        left = margin_h
+        top = margin_v
+        row_height = 0.0
+        for w, h in sizes:
+            if left > margin_h and left - margin_h + w > available:
+                # Row is full:
+                left = margin_h
+                top += row_height + spacing
+                row_height = 0.0
+            offsets.append((left, top))
+            left += w + spacing
+            row_height = max(row_height, h)
+
+    else: # GRID
+        if columns < 1:
+            columns = int(math.ceil(math.sqrt(len(sizes))))
+        cell_w = max(w for w, h in sizes)
+        cell_h = max(h for w, h in sizes)
+        for index in range(len(sizes)):
+            row, column = divmod(index, columns)
+            offsets.append((margin_h + column * (cell_w + spacing), margin_v + row * (cell_h + spacing)))
+
+    # All of the above start in the top left corner, mirror for the other corners:
+    if corner.endswith('RIGHT'):
+        offsets = [(frame_w - left - w, top) for (left, top), (w, h) in zip(offsets, sizes)]
+    if corner.startswith('BOTTOM'):
+        offsets = [(left, frame_h - top - h) for (left, top), (w, h) in zip(offsets, sizes)]
+    return offsets
+
+
+
+#
+# Splits a render of width_px x height_px into tiles of at most tile_px, extended by overlap_px
+# on every inner edge. Pixel rectangles are (x0, y0, x1, y1), exclusive end, from the top left.
+#
+# Returns a list of dicts with
+#   rect  the pixels to render, including the overlap,
+#   core  the pixels the tile contributes to the final image (the rects' cores don't overlap),
+#   row, column.
+#
+def tile_grid(width_px, height_px, tile_px, overlap_px=0):
+    tile_px = max(int(tile_px), PIXELS_MIN)
+    columns = int(math.ceil(width_px / float(tile_px)))
+    rows = int(math.ceil(height_px / float(tile_px)))
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            core = (
+                    column * tile_px, row * tile_px,
+                    min((column + 1) * tile_px, width_px), min((row + 1) * tile_px, height_px)
+                    )
+            rect = (
+                    max(core[0] - overlap_px, 0), max(core[1] - overlap_px, 0),
+                    min(core[2] + overlap_px, width_px), min(core[3] + overlap_px, height_px)
+                    )
+            tiles.append({'rect': rect, 'core': core, 'row': row, 'column': column})
+    return tiles
+
+
+
+#
+# The render border (min_x, max_x, min_y, max_y as fractions, y from the bottom like blender)
+# of a pixel rectangle.
+#
+def pixel_rect_to_border(rect, width_px, height_px):
+    x0, y0, x1, y1 = rect
+    return (
+            x0 / float(width_px), x1 / float(width_px),
+            1.0 - y1 / float(height_px), 1.0 - y0 / float(height_px)
+            )
+
+
+
+def rects_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+
+def union_rect(rects):
+    return (
+            min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects)
+            )
+
+
+
+#
+# The pixel rectangle grown by px on every side, clamped to the render.
+#
+def grow_rect(rect, px, width_px, height_px):
+    return (
+            max(rect[0] - px, 0), max(rect[1] - px, 0),
+            min(rect[2] + px, width_px), min(rect[3] + px, height_px)
+            )
+
+
+
+#
+# Pixel rectangle (x0, y0, x1, y1 from the top left, clamped to the render) covered by a box given
+# in orthographic camera space (x right, y up). The orthographic scale spans the longer side, the
+# camera shift moves the frame by fractions of it.
+# Returns None if the box is outside of the render.
+#
+def ortho_pixel_rect(local_min, local_max, ortho_scale, resolution_x, resolution_y, shift_x=0.0, shift_y=0.0):
+    if resolution_x >= resolution_y:
+        frame_w = ortho_scale
+        frame_h = ortho_scale * resolution_y / float(resolution_x)
+    else:
+        frame_h = ortho_scale
+        frame_w = ortho_scale * resolution_x / float(resolution_y)
+    center_x, center_y = shift_x * ortho_scale, shift_y * ortho_scale
+    x0 = int(math.floor(((local_min[0] - center_x) / frame_w + 0.5) * resolution_x))
+    x1 = int(math.ceil(((local_max[0] - center_x) / frame_w + 0.5) * resolution_x))
+    y0 = int(math.floor((0.5 - (local_max[1] - center_y) / frame_h) * resolution_y))
+    y1 = int(math.ceil((0.5 - (local_min[1] - center_y) / frame_h) * resolution_y))
+    x0, x1 = max(x0, 0), min(x1, resolution_x)
+    y0, y1 = max(y0, 0), min(y1, resolution_y)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+
+FLOAT_BYTES = 4
+
+
+
+#
+# Rough peak memory (bytes) of rendering width_px x height_px, split into its parts:
+#   render_result  float buffers of all passes (channels per pass given), times the number of
+#                  samples kept separately (full sample anti-aliasing),
+#   compositor     the composite output and viewer float buffers if compositing,
+#   output         the image written, in the output's bytes per channel.
+# Returns a dict of the parts and their 'total'.
+#
+def estimate_render_memory(width_px, height_px, pass_channels=(4,), samples=1,
+        compositing=False, output_bytes_per_channel=1, output_channels=4):
+    pixels = int(width_px) * int(height_px)
+    estimate = {
+            'render_result': pixels * sum(pass_channels) * FLOAT_BYTES * max(int(samples), 1),
+            'compositor': pixels * 4 * FLOAT_BYTES * 2 if compositing else 0,
+            'output': pixels * output_channels * output_bytes_per_channel,
+            }
+    estimate['total'] = sum(estimate.values())
+    return estimate
+
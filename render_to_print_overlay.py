@@ -0,0 +1,278 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+#
+# Annotation overlays: labels (e.g. the scale ratio) rasterized at their exact printed size and
+# composited onto a written render, row by row, instead of being rendered as text objects in front
+# of the camera. The glyphs are outlines of blender's own text (see render_to_print.text_outline),
+# filled and anti-aliased here, so the labels look like the text objects. Doesn't import bpy.
+# A label is a dict:
+#
+#   {"text": "1:50", "x": 59, "y": 59, "height": 59, "color": [0.0, 0.0, 0.0, 1.0],
+#    "outline": [[x0, y0, x1, y1], ...]}
+#
+# x and y are the top left corner in pixels from the top left of the image, height is the height of
+# the text's bounding box in pixels, the color is straight RGBA from 0 to 1 (black by default).
+# The outline are the edges of the glyphs' contours in units of the height, from the top left of the
+# bounding box with y downwards. The text itself is informative only.
+#
+
+import math
+import os
+import shutil
+
+import render_to_print_stitch as stitch
+
+
+# Scanlines sampled per pixel row, the horizontal coverage is exact:
+SCANLINES = 4
+
+
+
+def outline_size(outline, height_px):
+    height = int(round(height_px))
+    if not outline or not height:
+        return 0, 0
+    return int(math.ceil(max(max(s[0], s[2]) for s in outline) * height)), height
+
+
+
+#
+# Adds the coverage of the span from xa to xb (pixels) times weight to the line of pixels.
+#
+def _add_span(line, xa, xb, weight):
+    xa, xb = max(xa, 0.0), min(xb, float(len(line)))
+    if xa >= xb:
+        return
+    first, last = int(xa), int(math.ceil(xb)) - 1
+    if first == last:
+        line[first] += (xb - xa) * weight
+        return
+    line[first] += (first + 1 - xa) * weight
+    for x in range(first + 1, last):
+        line[x] += weight
+    line[last] += (xb - last) * weight
+
+
+
+#
+# Coverage (0 to 1) of every pixel of the outline filled (even-odd) at the given height: a list of
+# rows. Every row is sampled by SCANLINES scanlines, along which the coverage is exact.
+#
+def outline_coverage(outline, height_px):
+    width, height = outline_size(outline, height_px)
+    if not width or not height:
+        return []
+    scale = float(height)
+    # Only edges that cross scanlines, scaled to pixels with y0 < y1:
+    edges = []
+    for x0, y0, x1, y1 in outline:
+        if y0 == y1:
+            continue
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        edges.append((y0 * scale, y1 * scale, x0 * scale, (x1 - x0) / (y1 - y0)))
+    edges.sort()
+
+    coverage = []
+    weight = 1.0 / SCANLINES
+    first = 0 # Edges ending above the current row are skipped.
+    for y in range(height):
+        line = [0.0] * width
+        while first < len(edges) and edges[first][1] <= y:
+            first += 1
+        for s in range(SCANLINES):
+            v = y + (s + 0.5) * weight
+            crossings = []
+            for y0, y1, x0, slope in edges[first:]:
+                if y0 > v:
+                    break
+                if v < y1:
+                    crossings.append(x0 + (v - y0) * slope)
+            crossings.sort()
+            for i in range(0, len(crossings) - 1, 2):
+                _add_span(line, crossings[i], crossings[i + 1], weight)
+        coverage.append([min(value, 1.0) for value in line])
+    return coverage
+
+
+
+#
+# Blends the color over the row (bytearray of RGB or RGBA pixels) where covered, starting at pixel x.
+#
+def _blend_row(row, x, coverage, color, channels=stitch.CHANNELS):
+    red, green, blue, alpha = color
+    pixels = len(row) // channels
+    for i, value in enumerate(coverage):
+        if not value or not 0 <= x + i < pixels:
+            continue
+        o = (x + i) * channels
+        source_alpha = value * alpha
+        target_alpha = row[o + 3] / 255.0 if channels == 4 else 1.0
+        result_alpha = source_alpha + target_alpha * (1.0 - source_alpha)
+        if not result_alpha:
+            continue
+        for channel, source in enumerate((red, green, blue)):
+            target = row[o + channel] / 255.0
+            mixed = (source * source_alpha + target * target_alpha * (1.0 - source_alpha)) / result_alpha
+            row[o + channel] = int(round(mixed * 255.0))
+        if channels == 4:
+            row[o + 3] = int(round(result_alpha * 255.0))
+
+
+
+#
+# The labels' coverage: a list of (x, top, coverage rows, color), see blend_label_rows.
+#
+def rasterize(labels):
+    rasterized = []
+    for label in labels:
+        if 'outline' not in label:
+            raise ValueError("Label %r has no outline." % label.get('text'))
+        coverage = outline_coverage(label['outline'], label['height'])
+        if coverage:
+            color = tuple(label.get('color', (0.0, 0.0, 0.0, 1.0)))
+            rasterized.append((int(label['x']), int(label['y']), coverage, color))
+    return rasterized
+
+
+
+#
+# Returns the row y (RGB or RGBA bytes) with the rasterized labels blended onto it as a bytearray,
+# None if no label covers the row.
+#
+def blend_label_rows(row, y, rasterized, channels=stitch.CHANNELS):
+    blended = None
+    for x, top, coverage, color in rasterized:
+        if top <= y < top + len(coverage):
+            if blended is None:
+                blended = bytearray(row)
+            _blend_row(blended, x, coverage[y - top], color, channels)
+    return blended
+
+
+
+def _label_rows(rasterized, height):
+    rows = set()
+    for x, top, coverage, color in rasterized:
+        rows.update(range(max(top, 0), min(top + len(coverage), height)))
+    return sorted(rows)
+
+
+
+#
+# Uncompressed TIFF: Only the rows of the labels are read and written back, in place.
+#
+def _composite_tiff(path, rasterized, output):
+    layout = stitch.read_tiff_layout(path)
+    if output != path:
+        shutil.copyfile(path, output)
+    stride = layout['width'] * layout['channels']
+    with open(output, 'r+b') as f:
+        for y in _label_rows(rasterized, layout['height']):
+            f.seek(stitch.tiff_row_offset(layout, y))
+            row = blend_label_rows(f.read(stride), y, rasterized, layout['channels'])
+            f.seek(stitch.tiff_row_offset(layout, y))
+            f.write(row)
+
+
+
+#
+# PNG: Every row depends on the one above it, so the rows are unfiltered down to the last label
+# row only. All rows are written as they were filtered, except the label rows and the row below
+# each of them, which are written unfiltered. Ancillary chunks are kept.
+#
+def _composite_png(path, rasterized, output, dpi):
+    rows = stitch.iter_png_filtered_rows(path)
+    width, height, channels = next(rows)
+    label_rows = _label_rows(rasterized, height)
+    last = label_rows[-1] if label_rows else -1
+    # The image is read while written, hence written next to it first:
+    output_tmp = "%s.%s.tmp%s" % (output, os.getpid(), os.path.splitext(output)[1])
+    writer = stitch.PNGWriter(output_tmp, width, height, dpi, channels=channels, chunks=stitch.png_ancillary_chunks(path))
+    try:
+        previous = bytearray(width * channels)
+        previous_changed = False
+        for y in range(height):
+            filter_type, data = next(rows)
+            if y > last + 1:
+                writer.write_filtered_row(filter_type, data)
+                continue
+            line = stitch._unfilter(filter_type, bytearray(data), previous, channels)
+            blended = blend_label_rows(line, y, rasterized, channels)
+            if blended is not None:
+                writer.write_filtered_row(0, bytes(blended))
+            elif previous_changed and filter_type in (2, 3, 4): # Up, Average, Paeth
+                writer.write_filtered_row(0, bytes(line))
+            else:
+                writer.write_filtered_row(filter_type, data)
+            previous = line
+            previous_changed = blended is not None
+    finally:
+        writer.close()
+    os.replace(output_tmp, output)
+
+
+
+def _png_channels(path):
+    rows = stitch.iter_png_filtered_rows(path)
+    try:
+        return next(rows)[2]
+    finally:
+        rows.close()
+
+
+
+#
+# Any supported image to any format: Every row is decoded and written.
+#
+def _composite_rows(path, rasterized, output, dpi):
+    rows = stitch.iter_image_rows(path)
+    width, height = next(rows)
+    output_tmp = "%s.%s.tmp%s" % (output, os.getpid(), os.path.splitext(output)[1])
+    writer = stitch.open_writer(output_tmp, width, height, dpi)
+    try:
+        for y in range(height):
+            row = next(rows)
+            writer.write_row(bytes(blend_label_rows(row, y, rasterized) or row))
+    finally:
+        writer.close()
+    os.replace(output_tmp, output)
+
+
+
+#
+# Composites the labels onto the image at path (8 bit PNG or uncompressed TIFF, see
+# render_to_print_stitch) and writes the result to output, by default replacing the image.
+# Kept in its format, only the rows of the labels are rewritten: in place for uncompressed RGB(A)
+# TIFF, PNG is decoded down to the last label row (see _composite_png). The dpi applies to
+# rewritten PNG and converted images. Returns the output path.
+#
+def composite(path, labels, output=None, dpi=0):
+    output = output or path
+    rasterized = rasterize(labels)
+    image_format = stitch.image_format(path)
+    output_tiff = os.path.splitext(output)[1].lower() in ('.tif', '.tiff')
+    if image_format == 'TIFF' and output_tiff and stitch.read_tiff_layout(path)['channels'] in (3, 4):
+        _composite_tiff(path, rasterized, output)
+    elif image_format == 'PNG' and not output_tiff and _png_channels(path) >= 3:
+        _composite_png(path, rasterized, output, dpi)
+    else:
+        _composite_rows(path, rasterized, output, dpi)
+    return output
@@ -0,0 +1,235 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Paper preset registry of the render to print addon.
+#
+# Besides the built-in formats, user or site presets (plotter formats, roll widths) can be
+# loaded from JSON files:
+#
+#   {"presets": [
+#       {"name": "Plotter 36in", "width_cm": 91.4, "roll": true, "max_length_cm": 1500},
+#       {"name": "Site A2+", "width_cm": 45.0, "height_cm": 64.0}
+#   ]}
+#
+# Presets are indexed by their dimensions, presets_covering() and rolls_covering() look up
+# the sheets large enough for given dimensions (see geometry.smallest_fitting_preset).
+# Doesn't import bpy.
+#
+
+import bisect
+import json
+
+
+BUILTIN_PRESETS = (
+    ("A5_14.8_21.0", "default (A5)", ""),
+    ("custom_1_1", "custom", ""),
+    ("A0_84.1_118.9", "A0 (84.1x118.9 cm)", ""),
+    ("A1_59.4_84.1", "A1 (59.4x84.1 cm)", ""),
+    ("A2_42.0_59.4", "A2 (42.0x59.4 cm)", ""),
+    ("A3_29.7_42.0", "A3 (29.7 42.0 cm)", ""),
+    ("A4_21.0_29.7", "A4 (21.0x29.7 cm)", ""),
+    ("A5_14.8_21.0", "A5 (14.8x21.0 cm)", ""),
+    ("A6_10.5_14.8", "A6 (10.5x14.8 cm)", ""),
+    ("A7_7.4_10.5", "A7 (7.4x10.5 cm)", ""),
+    ("A8_5.2_7.4", "A8 (5.2x7.4 cm)", ""),
+    ("A9_3.7_5.2", "A9 (3.7x5.2 cm)", ""),
+    ("A10_2.6_3.7", "A10 (2.6x3.7 cm)", ""),
+
+    ("B0_100.0_141.4", "B0 (100.0x141.4 cm)", ""),
+    ("B1_70.7_100.0", "B1 (70.7x100.0 cm)", ""),
+    ("B2_50.0_70.7", "B2 (50.0x70.7 cm)", ""),
+    ("B3_35.3_50.0", "B3 (35.3x50.0 cm)", ""),
+    ("B4_25.0_35.3", "B4 (25.0x35.3 cm)", ""),
+    ("B5_17.6_25.0", "B5 (17.6x25.0 cm)", ""),
+    ("B6_12.5_17.6", "B6 (12.5x17.6 cm)", ""),
+    ("B7_8.8_12.5", "B7 (8.8x12.5 cm)", ""),
+    ("B8_6.2_8.8", "B8 (6.2x8.8 cm)", ""),
+    ("B9_4.4_6.2", "B9 (4.4x6.2 cm)", ""),
+    ("B10_3.1_4.4", "B10 (3.1x4.4 cm)", ""),
+
+    ("C0_91.7_129.7", "C0 (91.7x129.7 cm)", ""),
+    ("C1_64.8_91.7", "C1 (64.8x91.7 cm)", ""),
+    ("C2_45.8_64.8", "C2 (45.8x64.8 cm)", ""),
+    ("C3_32.4_45.8", "C3 (32.4x45.8 cm)", ""),
+    ("C4_22.9_32.4", "C4 (22.9x32.4 cm)", ""),
+    ("C5_16.2_22.9", "C5 (16.2x22.9 cm)", ""),
+    ("C6_11.4_16.2", "C6 (11.4x16.2 cm)", ""),
+    ("C7_8.1_11.4", "C7 (8.1x11.4 cm)", ""),
+    ("C8_5.7_8.1", "C8 (5.7x8.1 cm)", ""),
+    ("C9_4.0_5.7", "C9 (4.0x5.7 cm)", ""),
+    ("C10_2.8_4.0", "C10 (2.8x4.0 cm)", ""),
+
+    ("Letter_21.6_27.9", "Letter (21.6x27.9 cm)", ""),
+    ("Legal_21.6_35.6", "Legal (21.6x35.6 cm)", ""),
+    ("Legal junior_20.3_12.7", "Legal junior (20.3x12.7 cm)", ""),
+    ("Ledger_43.2_27.9", "Ledger (43.2x27.9 cm)", ""),
+    ("Tabloid_27.9_43.2", "Tabloid (27.9x43.2 cm)", ""),
+
+    ("ANSI C_43.2_55.9", "ANSI C (43.2x55.9 cm)", ""),
+    ("ANSI D_55.9_86.4", "ANSI D (55.9x86.4 cm)", ""),
+    ("ANSI E_86.4_111.8", "ANSI E (86.4x111.8 cm)", ""),
+
+    ("Arch A_22.9_30.5", "Arch A (22.9x30.5 cm)", ""),
+    ("Arch B_30.5_45.7", "Arch B (30.5x45.7 cm)", ""),
+    ("Arch C_45.7_61.0", "Arch C (45.7x61.0 cm)", ""),
+    ("Arch D_61.0_91.4", "Arch D (61.0x91.4 cm)", ""),
+    ("Arch E_91.4_121.9", "Arch E (91.4x121.9 cm)", ""),
+    ("Arch E1_76.2_106.7", "Arch E1 (76.2x106.7 cm)", ""),
+    ("Arch E2_66.0_96.5", "Arch E2 (66.0x96.5 cm)", ""),
+    ("Arch E3_68.6_99.1", "Arch E3 (68.6x99.1 cm)", ""),
+    )
+
+
+# Enum items (idname, name, description), the built-in presets first:
+paper_presets = []
+# Maps the idname to (type, width_cm, height_cm). For rolls the height is the default length.
+paper_presets_data = {}
+# Maps the idname to everything known about the preset (e.g. where it was loaded from).
+preset_info = {}
+
+# Indices by dimensions:
+#   fixed size sheets as (shorter side, longer side, idname) sorted by the shorter side,
+#   rolls as (width, max length, idname) sorted by width.
+_sheets_by_size = []
+_rolls_by_width = []
+
+
+
+#
+# Legacy parsing of the built-in idnames "<type>_<width>_<height>".
+#
+def paper_enum_parse(idname):
+    tipo, dim_w, dim_h = idname.split("_")
+    return tipo, float(dim_w), float(dim_h)
+
+
+
+#
+# Adds a preset to the registry (replacing one with the same idname) and returns its idname.
+#
+#   tipo           The type, "custom" presets take their size from the print settings,
+#                  "roll" presets have a fixed width and a free length (up to max_length_cm).
+#   height_cm      For rolls the default length.
+#
+def register_preset(idname, name, width_cm, height_cm, tipo=None, description="", max_length_cm=0.0, source="builtin"):
+    width_cm = float(width_cm)
+    height_cm = float(height_cm)
+    if width_cm <= 0 or height_cm <= 0:
+        raise ValueError("Preset %r has no size: %s x %s cm" % (idname, width_cm, height_cm))
+    if tipo is None:
+        tipo = idname.split("_")[0]
+    if idname in preset_info:
+        unregister_preset(idname)
+
+    paper_presets.append((idname, name, description))
+    paper_presets_data[idname] = (tipo, width_cm, height_cm)
+    preset_info[idname] = {
+            'idname': idname, 'name': name, 'type': tipo,
+            'width_cm': width_cm, 'height_cm': height_cm,
+            'max_length_cm': float(max_length_cm), 'source': source
+            }
+    if tipo == "roll":
+        bisect.insort(_rolls_by_width, (width_cm, float(max_length_cm), idname))
+    elif tipo != "custom":
+        bisect.insort(_sheets_by_size, (min(width_cm, height_cm), max(width_cm, height_cm), idname))
+    return idname
+
+
+
+def unregister_preset(idname):
+    info = preset_info.pop(idname)
+    del paper_presets_data[idname]
+    paper_presets[:] = [item for item in paper_presets if item[0] != idname]
+    _sheets_by_size[:] = [entry for entry in _sheets_by_size if entry[2] != idname]
+    _rolls_by_width[:] = [entry for entry in _rolls_by_width if entry[2] != idname]
+    return info
+
+
+
+#
+# Loads the presets of a JSON file (see above), either {"presets": [...]} or the list only.
+# Returns the idnames of the loaded presets.
+#
+def load_presets(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('presets', [])
+
+    idnames = []
+    for entry in data:
+        if 'name' not in entry or 'width_cm' not in entry:
+            raise ValueError("%s: Presets require a name and width_cm: %r" % (path, entry))
+        # Underscores separate the dimensions in the idname:
+        name = entry['name'].replace("_", " ")
+        if entry.get('roll'):
+            tipo = "roll"
+            max_length_cm = entry.get('max_length_cm', 0.0)
+            height_cm = entry.get('length_cm', max_length_cm or entry['width_cm'])
+            label = "%s (%.1f cm roll)" % (name, entry['width_cm'])
+        else:
+            if 'height_cm' not in entry:
+                raise ValueError("%s: Preset %r requires height_cm (or roll)." % (path, name))
+            tipo = name
+            max_length_cm = 0.0
+            height_cm = entry['height_cm']
+            label = "%s (%.1fx%.1f cm)" % (name, entry['width_cm'], height_cm)
+        idname = entry.get('idname', "%s_%.1f_%.1f" % (name, entry['width_cm'], height_cm))
+        idnames.append(register_preset(idname, label, entry['width_cm'], height_cm, tipo=tipo,
+                description=entry.get('description', ""), max_length_cm=max_length_cm, source=path))
+    return idnames
+
+
+
+#
+# Enum items of all registered presets.
+#
+def enum_items():
+    return tuple(paper_presets)
+
+
+
+#
+# The fixed size sheets whose sides are at least the given ones (in either orientation),
+# smallest area first.
+#
+def presets_covering(short_cm, long_cm):
+    short_cm, long_cm = min(short_cm, long_cm), max(short_cm, long_cm)
+    start = bisect.bisect_left(_sheets_by_size, (short_cm,))
+    found = [(short * long, idname) for short, long, idname in _sheets_by_size[start:] if long >= long_cm]
+    return [idname for area, idname in sorted(found)]
+
+
+
+#
+# The rolls at least width_cm wide, narrowest first, as (width, max length (0 = unlimited), idname).
+#
+def rolls_covering(width_cm):
+    return _rolls_by_width[bisect.bisect_left(_rolls_by_width, (width_cm,)):]
+
+
+
+for _idname, _name, _description in BUILTIN_PRESETS:
+    if _idname not in preset_info:
+        _tipo, _dim_w, _dim_h = paper_enum_parse(_idname)
+        register_preset(_idname, _name, _dim_w, _dim_h, tipo=_tipo, description=_description)
+    else:
+        paper_presets.append((_idname, _name, _description)) # "default (A5)" and "A5" share the idname.
@@ -0,0 +1,139 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Timings and counters of the render to print pipeline stages.
+#
+#   with stats.timed('ensure_height'):      # or as decorator: @stats.timed('ensure_height')
+#       ...
+#   stats.count('update_settings_cb')
+#   stats.get_stats()  =>  {'ensure_height': {'count': 3, 'seconds': 0.0021, 'max': 0.0009}, ...}
+#
+# The numbers are plain dicts so they can be written as JSON and summed up over many (farm)
+# jobs with merge_stats(). Doesn't import bpy.
+#
+
+import contextlib
+import cProfile
+import time
+
+
+# Maps the stage (or counter) name to {'count', 'seconds', 'max'}.
+_stats = {}
+
+
+
+def _entry(name):
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {'count': 0, 'seconds': 0.0, 'max': 0.0}
+    return entry
+
+
+
+#
+# Measures how long the stage takes, usable as context manager and as function decorator.
+#
+@contextlib.contextmanager
+def timed(stage):
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - time_start
+        entry = _entry(stage)
+        entry['count'] += 1
+        entry['seconds'] += seconds
+        if seconds > entry['max']:
+            entry['max'] = seconds
+
+
+
+#
+# Counts an event, e.g. a callback firing.
+#
+def count(name, n=1):
+    _entry(name)['count'] += n
+
+
+
+#
+# Returns a copy of the timings and counters gathered since the last reset.
+#
+def get_stats():
+    return {name: dict(entry) for name, entry in _stats.items()}
+
+
+
+def reset_stats():
+    _stats.clear()
+
+
+
+#
+# Sums up the stats b into a (e.g. of two farm jobs), returns a.
+#
+def merge_stats(a, b):
+    for name, entry in b.items():
+        merged = a.setdefault(name, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+        merged['count'] += entry.get('count', 0)
+        merged['seconds'] += entry.get('seconds', 0.0)
+        merged['max'] = max(merged['max'], entry.get('max', 0.0))
+    return a
+
+
+
+#
+# Adds stats gathered elsewhere (e.g. by farm workers) to the ones of this process.
+#
+def add_stats(stats):
+    merge_stats(_stats, stats)
+
+
+
+#
+# Human readable table of the stats, slowest stage first.
+#
+def format_stats(stats=None):
+    if stats is None:
+        stats = _stats
+    lines = ["%-32s %8s %12s %12s" % ("stage", "count", "total [ms]", "max [ms]")]
+    for name, entry in sorted(stats.items(), key=lambda item: -item[1]['seconds']):
+        lines.append("%-32s %8d %12.3f %12.3f" % (name, entry['count'], entry['seconds'] * 1000, entry['max'] * 1000))
+    return "\n".join(lines)
+
+
+
+#
+# Profiles the enclosed code with cProfile and dumps the profile to the given file
+# (to be inspected with pstats or snakeviz). Without file nothing is profiled.
+#
+@contextlib.contextmanager
+def profiled(path):
+    if not path:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,636 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+#
+# Stitches the tiles of a tiled sheet (see tiles.json written by render_to_print.expand_tiled_sheet)
+# into the final image, row by row. Only one row of every tile of the current tile row is held in
+# memory, never the whole image. Runs with plain python (no bpy):
+#
+#   python render_to_print_stitch.py poster_tiles/tiles.json [poster.tif]
+#
+# Reads 8 bit RGB(A) PNG and uncompressed TIFF tiles, writes 8 bit RGBA PNG or TIFF (by extension)
+# carrying the print resolution (dpi). Pasting a region (see paste) keeps the image's channels.
+#
+
+import json
+import os
+import shutil
+import struct
+import sys
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # Speeds up decoding PNG rows only.
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHANNELS = 4 # Everything is converted to RGBA.
+
+# Flush compressed PNG data in chunks of this size:
+PNG_CHUNK_SIZE = 1 << 20
+
+
+
+def _to_rgba(row, channels):
+    if channels == 4:
+        return bytes(row)
+    if channels == 3:
+        rgba = bytearray(len(row) // 3 * 4)
+        rgba[0::4] = row[0::3]
+        rgba[1::4] = row[1::3]
+        rgba[2::4] = row[2::3]
+        rgba[3::4] = b'\xff' * (len(row) // 3)
+        return bytes(rgba)
+    if channels == 2: # Gray, alpha.
+        rgba = bytearray(len(row) * 2)
+        rgba[0::4] = row[0::2]
+        rgba[1::4] = row[0::2]
+        rgba[2::4] = row[0::2]
+        rgba[3::4] = row[1::2]
+        return bytes(rgba)
+    # Gray.
+    rgba = bytearray(len(row) * 4)
+    rgba[0::4] = row
+    rgba[1::4] = row
+    rgba[2::4] = row
+    rgba[3::4] = b'\xff' * len(row)
+    return bytes(rgba)
+
+
+
+#
+# The channels (see _to_rgba) of an RGBA row, gray taken from red.
+#
+def _from_rgba(row, channels):
+    if channels == 4:
+        return bytes(row)
+    if channels == 3:
+        rgb = bytearray(len(row) // 4 * 3)
+        rgb[0::3] = row[0::4]
+        rgb[1::3] = row[1::4]
+        rgb[2::3] = row[2::4]
+        return bytes(rgb)
+    if channels == 2:
+        gray_alpha = bytearray(len(row) // 2)
+        gray_alpha[0::2] = row[0::4]
+        gray_alpha[1::2] = row[3::4]
+        return bytes(gray_alpha)
+    return bytes(row[0::4])
+
+
+
+#
+# PNG READING
+#
+# Rows are unfiltered in place, each filter by its definition. Sub and Up are vectorized if numpy
+# is available, Average and Paeth depend on the pixel to the left just reconstructed.
+#
+def _unfilter(filter_type, line, previous, bpp):
+    if filter_type == 0:
+        return line
+    if filter_type == 2: # Up
+        if numpy is not None:
+            return bytearray((numpy.frombuffer(bytes(line), numpy.uint8) + numpy.frombuffer(bytes(previous), numpy.uint8)).tobytes())
+        return bytearray((line[i] + previous[i]) & 0xff for i in range(len(line)))
+    if filter_type == 1: # Sub, a running sum per channel.
+        if numpy is not None:
+            channels = numpy.frombuffer(bytes(line), numpy.uint8).reshape(-1, bpp).astype(numpy.uint64)
+            return bytearray((numpy.cumsum(channels, axis=0) & 0xff).astype(numpy.uint8).tobytes())
+        for i in range(bpp, len(line)):
+            line[i] = (line[i] + line[i - bpp]) & 0xff
+        return line
+    if filter_type == 3: # Average
+        for i in range(bpp):
+            line[i] = (line[i] + (previous[i] >> 1)) & 0xff
+        for i in range(bpp, len(line)):
+            line[i] = (line[i] + ((line[i - bpp] + previous[i]) >> 1)) & 0xff
+        return line
+    if filter_type == 4: # Paeth, the predictor inlined.
+        for i in range(bpp):
+            line[i] = (line[i] + previous[i]) & 0xff
+        for i in range(bpp, len(line)):
+            a = line[i - bpp]
+            b = previous[i]
+            c = previous[i - bpp]
+            pa = abs(b - c)
+            pb = abs(a - c)
+            pc = abs(a + b - c - c)
+            if pa <= pb and pa <= pc:
+                line[i] = (line[i] + a) & 0xff
+            elif pb <= pc:
+                line[i] = (line[i] + b) & 0xff
+            else:
+                line[i] = (line[i] + c) & 0xff
+        return line
+    raise ValueError("Unknown PNG filter type %s." % filter_type)
+
+
+
+def _png_chunks(f):
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = f.read(length)
+        f.read(4) # CRC
+        yield chunk_type, data
+        if chunk_type == b'IEND':
+            return
+
+
+
+#
+# Yields (width, height, channels) first, then the image's rows top to bottom as they are stored:
+# (filter type, filtered bytes). See iter_png_rows for the pixels.
+#
+def iter_png_filtered_rows(path):
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("%s is no PNG file." % path)
+        chunks = _png_chunks(f)
+        chunk_type, data = next(chunks)
+        width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack('>IIBBBBB', data)
+        channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color_type)
+        if bit_depth != 8 or channels is None or interlace:
+            raise ValueError("%s: Only non interlaced 8 bit gray or RGB(A) PNG is supported." % path)
+        yield width, height, channels
+
+        stride = width * channels
+        decompressor = zlib.decompressobj()
+        pending = b''
+        rows = 0
+        for chunk_type, data in chunks:
+            if chunk_type != b'IDAT':
+                continue
+            pending += decompressor.decompress(data)
+            while len(pending) > stride and rows < height:
+                yield pending[0], pending[1:stride + 1]
+                pending = pending[stride + 1:]
+                rows += 1
+        pending += decompressor.flush()
+        while len(pending) > stride and rows < height:
+            yield pending[0], pending[1:stride + 1]
+            pending = pending[stride + 1:]
+            rows += 1
+
+
+
+PNG_KNOWN_ANCILLARY = (b'bKGD', b'cHRM', b'gAMA', b'iCCP', b'iTXt', b'pHYs', b'sBIT', b'sRGB',
+                       b'tEXt', b'tIME', b'tRNS', b'zTXt')
+
+
+
+#
+# The ancillary chunks (type, data) worth keeping when the pixels of the image at path are changed:
+# the known ones (color space, resolution, text) and those marked safe to copy.
+#
+def png_ancillary_chunks(path):
+    chunks = []
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("%s is no PNG file." % path)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IEND':
+                break
+            if chunk_type[0:1].islower() and (chunk_type in PNG_KNOWN_ANCILLARY or chunk_type[3:4].islower()):
+                chunks.append((chunk_type, f.read(length)))
+                f.seek(4, 1) # CRC
+            else:
+                f.seek(length + 4, 1) # The pixels are skipped, not read.
+    return chunks
+
+
+
+#
+# Yields (width, height) first, then the image's rows top to bottom as RGBA bytes.
+#
+def iter_png_rows(path):
+    rows = iter_png_filtered_rows(path)
+    width, height, channels = next(rows)
+    yield width, height
+    previous = bytearray(width * channels)
+    for filter_type, data in rows:
+        line = _unfilter(filter_type, bytearray(data), previous, channels)
+        previous = line
+        yield _to_rgba(line, channels)
+
+
+
+#
+# TIFF READING (uncompressed, strips)
+#
+TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I', 5: 'II'}
+
+
+
+def _tiff_tags(f, byte_order):
+    f.seek(4)
+    ifd_offset, = struct.unpack(byte_order + 'I', f.read(4))
+    f.seek(ifd_offset)
+    count, = struct.unpack(byte_order + 'H', f.read(2))
+    tags = {}
+    for i in range(count):
+        tag, value_type, value_count, value = struct.unpack(byte_order + 'HHI4s', f.read(12))
+        if value_type not in TIFF_TYPES:
+            continue
+        item = TIFF_TYPES[value_type]
+        size = struct.calcsize(byte_order + item) * value_count
+        if size > 4:
+            position = f.tell()
+            f.seek(struct.unpack(byte_order + 'I', value)[0])
+            value = f.read(size)
+            f.seek(position)
+        tags[tag] = struct.unpack(byte_order + item * value_count, value[:size])
+    return tags
+
+
+
+#
+# Where the rows of an uncompressed, interleaved 8 bit TIFF are stored:
+# {'width', 'height', 'channels', 'strip_offsets', 'rows_per_strip'}, see tiff_row_offset.
+#
+def read_tiff_layout(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if magic == b'II*\x00':
+            byte_order = '<'
+        elif magic == b'MM\x00*':
+            byte_order = '>'
+        else:
+            raise ValueError("%s is no TIFF file." % path)
+        tags = _tiff_tags(f, byte_order)
+    if tags.get(259, (1,))[0] != 1 or any(bits != 8 for bits in tags.get(258, (1,))) or tags.get(284, (1,))[0] != 1:
+        raise ValueError("%s: Only uncompressed, interleaved 8 bit TIFF is supported." % path)
+    height = tags[257][0]
+    return {
+            'width': tags[256][0], 'height': height,
+            'channels': tags.get(277, (1,))[0],
+            'strip_offsets': tags[273],
+            'rows_per_strip': tags.get(278, (height,))[0]
+            }
+
+
+
+def tiff_row_offset(layout, y):
+    strip, row = divmod(y, layout['rows_per_strip'])
+    return layout['strip_offsets'][strip] + row * layout['width'] * layout['channels']
+
+
+
+def iter_tiff_rows(path):
+    layout = read_tiff_layout(path)
+    width, height, channels = layout['width'], layout['height'], layout['channels']
+    yield width, height
+
+    stride = width * channels
+    rows = 0
+    with open(path, 'rb') as f:
+        for offset in layout['strip_offsets']:
+            f.seek(offset)
+            for i in range(min(layout['rows_per_strip'], height - rows)):
+                yield _to_rgba(f.read(stride), channels)
+                rows += 1
+
+
+
+def image_format(path):
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    return 'PNG' if magic == PNG_SIGNATURE else 'TIFF'
+
+
+
+def iter_image_rows(path):
+    if image_format(path) == 'PNG':
+        return iter_png_rows(path)
+    return iter_tiff_rows(path)
+
+
+
+#
+# WRITING
+#
+# chunks are ancillary chunks (type, data) written ahead of the pixels, e.g. those of the image
+# rewritten (see png_ancillary_chunks). The dpi replaces their resolution.
+#
+class PNGWriter:
+
+    def __init__(self, path, width, height, dpi=0, compression=6, channels=CHANNELS, chunks=()):
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(compression)
+        self.buffer = []
+        self.buffered = 0
+        self.file.write(PNG_SIGNATURE)
+        color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        if dpi:
+            pixels_per_m = int(round(dpi / 0.0254))
+            self._chunk(b'pHYs', struct.pack('>IIB', pixels_per_m, pixels_per_m, 1))
+        for chunk_type, data in chunks:
+            if not (dpi and chunk_type == b'pHYs'):
+                self._chunk(chunk_type, data)
+
+    def _chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def _compressed(self, data):
+        if data:
+            self.buffer.append(data)
+            self.buffered += len(data)
+        if self.buffered >= PNG_CHUNK_SIZE:
+            self._chunk(b'IDAT', b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def write_row(self, row):
+        self._compressed(self.compressor.compress(b'\x00' + row))
+
+    # A row as read by iter_png_filtered_rows, filtered against the row written before it.
+    def write_filtered_row(self, filter_type, data):
+        self._compressed(self.compressor.compress(bytes((filter_type,)) + data))
+
+    def close(self):
+        self.buffer.append(self.compressor.flush())
+        self._chunk(b'IDAT', b''.join(self.buffer))
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+
+
+#
+# Baseline, uncompressed RGBA TIFF in a single strip. The directory is written after the pixels,
+# so rows can be streamed. Limited to 4 GB (no BigTIFF).
+#
+class TIFFWriter:
+
+    def __init__(self, path, width, height, dpi=0):
+        if width * height * CHANNELS >= 1 << 32:
+            raise ValueError("Image too large for TIFF (4 GB), write PNG instead.")
+        self.file = open(path, 'wb')
+        self.width = width
+        self.height = height
+        self.dpi = dpi or 72
+        self.file.write(b'II*\x00' + struct.pack('<I', 0)) # Directory offset follows once known.
+
+    def write_row(self, row):
+        self.file.write(row)
+
+    def close(self):
+        data_size = self.width * self.height * CHANNELS
+        extra = 8 + data_size
+        # Values that don't fit into a directory entry: bits per sample and the resolutions.
+        bits_offset = extra
+        resolution_offset = bits_offset + 8
+        ifd_offset = resolution_offset + 16
+        self.file.write(struct.pack('<4H', 8, 8, 8, 8))
+        self.file.write(struct.pack('<4I', int(self.dpi * 1000), 1000, int(self.dpi * 1000), 1000))
+        entries = (
+                (256, 4, 1, self.width),
+                (257, 4, 1, self.height),
+                (258, 3, 4, bits_offset),
+                (259, 3, 1, 1), # No compression.
+                (262, 3, 1, 2), # RGB
+                (273, 4, 1, 8), # Strip offset
+                (277, 3, 1, CHANNELS),
+                (278, 4, 1, self.height),
+                (279, 4, 1, data_size),
+                (282, 5, 1, resolution_offset),
+                (283, 5, 1, resolution_offset + 8),
+                (284, 3, 1, 1), # Interleaved.
+                (296, 3, 1, 2), # Resolution in inch.
+                (338, 3, 1, 2), # Unassociated alpha.
+                )
+        self.file.write(struct.pack('<H', len(entries)))
+        for tag, value_type, count, value in entries:
+            if value_type == 3 and count == 1:
+                self.file.write(struct.pack('<HHIHH', tag, value_type, count, value, 0))
+            else:
+                self.file.write(struct.pack('<HHII', tag, value_type, count, value))
+        self.file.write(struct.pack('<I', 0))
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', ifd_offset))
+        self.file.close()
+
+
+
+def open_writer(path, width, height, dpi=0):
+    if os.path.splitext(path)[1].lower() in ('.tif', '.tiff'):
+        return TIFFWriter(path, width, height, dpi)
+    return PNGWriter(path, width, height, dpi)
+
+
+
+#
+# STITCHING
+#
+def _tile_rows(tile):
+    if tile.get('empty') or not os.path.exists(tile['path']):
+        return None, 0
+    rows = iter_image_rows(tile['path'])
+    width, height = next(rows)
+    return rows, width
+
+
+
+#
+# Writes the image described by the tile index (dict or path of tiles.json) row band by row band.
+# Missing and empty tiles are transparent. Annotation labels of the index (see
+# render_to_print_overlay) are blended onto the rows as they are written. Returns the output path.
+#
+def stitch(index, output=None):
+    if not isinstance(index, dict):
+        with open(index) as f:
+            index = json.load(f)
+    output = output or index['output']
+    width, height = index['width'], index['height']
+
+    bands = {}
+    for tile in index['tiles']:
+        bands.setdefault(tile['core'][1], []).append(tile)
+
+    rasterized = []
+    if index.get('labels'):
+        import render_to_print_overlay # Imports this module.
+        rasterized = render_to_print_overlay.rasterize(index['labels'])
+
+    writer = open_writer(output, width, height, index.get('dpi', 0))
+    try:
+        for band_top in sorted(bands):
+            tiles = sorted(bands[band_top], key=lambda t: t['core'][0])
+            readers = []
+            for tile in tiles:
+                rows, tile_width = _tile_rows(tile)
+                # Skip the overlap rows above the core:
+                for i in range(tile['core'][1] - tile['rect'][1]):
+                    if rows is not None:
+                        next(rows, None)
+                readers.append((tile, rows, tile_width))
+
+            band_bottom = tiles[0]['core'][3]
+            for y in range(band_top, band_bottom):
+                parts = []
+                for tile, rows, tile_width in readers:
+                    core_width = tile['core'][2] - tile['core'][0]
+                    row = next(rows, None) if rows is not None else None
+                    if row is None:
+                        parts.append(bytes(core_width * CHANNELS))
+                        continue
+                    start = (tile['core'][0] - tile['rect'][0]) * CHANNELS
+                    part = row[start:start + core_width * CHANNELS]
+                    parts.append(part + bytes(core_width * CHANNELS - len(part)))
+                row = b''.join(parts)
+                if rasterized:
+                    row = render_to_print_overlay.blend_label_rows(row, y, rasterized) or row
+                writer.write_row(bytes(row))
+    finally:
+        writer.close()
+    return output
+
+
+
+#
+# PASTING
+#
+# The patch's rows (RGBA) replace the columns of rect in the base's rows of rect.
+#
+def _pasted_rows(patch_rows, patch_rect, rect, height, channels):
+    start = (rect[0] - patch_rect[0]) * CHANNELS
+    end = (rect[2] - patch_rect[0]) * CHANNELS
+    for y in range(height):
+        patch_row = next(patch_rows) if patch_rect[1] <= y < patch_rect[3] else None
+        if rect[1] <= y < rect[3]:
+            yield y, _from_rgba(patch_row[start:end], channels)
+        elif y >= rect[3]:
+            return
+
+
+
+#
+# TIFF: The rows are replaced in place, in the channels of the base. Its resolution is kept.
+#
+def _paste_tiff(base_path, patch_rows, patch_rect, rect, output):
+    layout = read_tiff_layout(base_path)
+    output_tmp = "%s.%s.tmp%s" % (output, os.getpid(), os.path.splitext(output)[1])
+    shutil.copyfile(base_path, output_tmp)
+    with open(output_tmp, 'r+b') as f:
+        for y, pasted in _pasted_rows(patch_rows, patch_rect, rect, layout['height'], layout['channels']):
+            f.seek(tiff_row_offset(layout, y) + rect[0] * layout['channels'])
+            f.write(pasted)
+    os.replace(output_tmp, output)
+
+
+
+#
+# PNG: Every row depends on the one above it, so the rows are unfiltered down to the row below the
+# rect only. All rows are written as they were filtered in the channels of the base, except the
+# pasted rows and the row below them, which are written unfiltered. Ancillary chunks are kept.
+#
+def _paste_png(base_path, patch_rows, patch_rect, rect, output, dpi):
+    rows = iter_png_filtered_rows(base_path)
+    width, height, channels = next(rows)
+    pasted_rows = _pasted_rows(patch_rows, patch_rect, rect, height, channels)
+    x0, x1 = rect[0] * channels, rect[2] * channels
+    # The base may be the output, hence written next to it first:
+    output_tmp = "%s.%s.tmp%s" % (output, os.getpid(), os.path.splitext(output)[1])
+    writer = PNGWriter(output_tmp, width, height, dpi, channels=channels, chunks=png_ancillary_chunks(base_path))
+    try:
+        previous = bytearray(width * channels)
+        for y in range(height):
+            filter_type, data = next(rows)
+            if y > rect[3]:
+                writer.write_filtered_row(filter_type, data)
+                continue
+            line = _unfilter(filter_type, bytearray(data), previous, channels)
+            if rect[1] <= y < rect[3]:
+                pasted = next(pasted_rows)[1]
+                writer.write_filtered_row(0, bytes(line[:x0]) + pasted + bytes(line[x1:]))
+            elif y == rect[3] and filter_type in (2, 3, 4): # Up, Average, Paeth
+                writer.write_filtered_row(0, bytes(line))
+            else:
+                writer.write_filtered_row(filter_type, data)
+            # The next row was filtered against the original:
+            previous = line
+    finally:
+        writer.close()
+    os.replace(output_tmp, output)
+
+
+
+#
+# Any supported image to any format: Every row is decoded and written (RGBA, like stitched images).
+#
+def _paste_rows(base_path, patch_rows, patch_rect, rect, output, dpi):
+    base_rows = iter_image_rows(base_path)
+    width, height = next(base_rows)
+    pasted_rows = _pasted_rows(patch_rows, patch_rect, rect, height, CHANNELS)
+    output_tmp = "%s.%s.tmp%s" % (output, os.getpid(), os.path.splitext(output)[1])
+    writer = open_writer(output_tmp, width, height, dpi)
+    try:
+        for y in range(height):
+            row = next(base_rows)
+            if rect[1] <= y < rect[3]:
+                row = row[:rect[0] * CHANNELS] + next(pasted_rows)[1] + row[rect[2] * CHANNELS:]
+            writer.write_row(row)
+    finally:
+        writer.close()
+    os.replace(output_tmp, output)
+
+
+
+#
+# Writes a copy of the image at base_path with the pixel rectangle rect (x0, y0, x1, y1 from the
+# top left) taken from the patch, which covers patch_rect (containing rect) of the image. Used to
+# update the region of a render whose annotations changed. Kept in its format and channels, only
+# the pasted rows are rewritten: in place for uncompressed TIFF, PNG is decoded down to the rect
+# (see _paste_png). The dpi applies to rewritten PNG and converted images. Returns the output path.
+#
+def paste(base_path, patch_path, patch_rect, rect, output, dpi=0):
+    patch_rows = iter_image_rows(patch_path)
+    patch_width, patch_height = next(patch_rows)
+    if (patch_width, patch_height) != (patch_rect[2] - patch_rect[0], patch_rect[3] - patch_rect[1]):
+        raise ValueError("%s doesn't cover the pixel rectangle %s." % (patch_path, patch_rect))
+
+    base_format = image_format(base_path)
+    output_tiff = os.path.splitext(output)[1].lower() in ('.tif', '.tiff')
+    if base_format == 'TIFF' and output_tiff:
+        _paste_tiff(base_path, patch_rows, patch_rect, rect, output)
+    elif base_format == 'PNG' and not output_tiff:
+        _paste_png(base_path, patch_rows, patch_rect, rect, output, dpi)
+    else:
+        _paste_rows(base_path, patch_rows, patch_rect, rect, output, dpi)
+    return output
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: render_to_print_stitch.py tiles.json [output]")
+        sys.exit(2)
+    print("Written %s" % stitch(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
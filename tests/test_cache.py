@@ -0,0 +1,81 @@
+#
+# Tests of render_to_print_cache.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import render_to_print_cache as render_cache
+
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #
+    # Stores a render of size bytes under key, last used the given seconds ago.
+    #
+    def store(self, key, size, age):
+        render = os.path.join(self.directory, "render.png")
+        with open(render, 'wb') as f:
+            f.write(b'x' * size)
+        path = render_cache.store(self.cache, key, render, info={'key': key})
+        used = time.time() - age
+        os.utime(path, (used, used))
+        return path
+
+    def test_store_and_lookup(self):
+        path = self.store("aa01", 10, 0)
+        self.assertEqual(render_cache.lookup(self.cache, "aa01", ".png"), path)
+        self.assertIsNone(render_cache.lookup(self.cache, "aa01", ".tif"))
+        self.assertIsNone(render_cache.lookup(self.cache, "bb01", ".png"))
+        self.assertEqual(render_cache.read_info(self.cache, "aa01"), {'key': "aa01"})
+
+    def test_evict_least_recently_used_first(self):
+        self.store("aa01", 100, 300)
+        self.store("bb02", 100, 200)
+        self.store("cc03", 100, 100)
+        self.assertEqual(render_cache.cache_size(self.cache), 300)
+
+        self.assertEqual(render_cache.evict(self.cache, 200), 100)
+        self.assertIsNone(render_cache.lookup(self.cache, "aa01", ".png"))
+        self.assertIsNone(render_cache.read_info(self.cache, "aa01"))
+        self.assertEqual(render_cache.cache_size(self.cache), 200)
+
+    def test_lookup_counts_as_use(self):
+        self.store("aa01", 100, 300)
+        self.store("bb02", 100, 200)
+        render_cache.lookup(self.cache, "aa01", ".png")
+        render_cache.evict(self.cache, 100)
+        self.assertIsNotNone(render_cache.lookup(self.cache, "aa01", ".png"))
+        self.assertIsNone(render_cache.lookup(self.cache, "bb02", ".png"))
+
+    def test_evict_nothing_within_budget(self):
+        self.store("aa01", 100, 0)
+        self.assertEqual(render_cache.evict(self.cache, 100), 0)
+        self.assertEqual(render_cache.evict(os.path.join(self.directory, "missing"), 0), 0)
+
+    def test_aliases_survive_eviction(self):
+        self.store("aa01", 100, 100)
+        render_cache.store_alias(self.cache, "base01", "aa01")
+        self.assertEqual(render_cache.read_alias(self.cache, "base01"), "aa01")
+        render_cache.evict(self.cache, 0)
+        self.assertEqual(render_cache.cache_size(self.cache), 0)
+        self.assertEqual(render_cache.read_alias(self.cache, "base01"), "aa01")
+        self.assertIsNone(render_cache.lookup(self.cache, "aa01", ".png"))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
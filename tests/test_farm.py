@@ -0,0 +1,129 @@
+#
+# Tests of render_to_print_farm with fake blender executables standing in for the workers.
+#
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE)
+import render_to_print_farm as farm
+
+
+# Called like blender: <blender> -b <blend file> -P <script> -- --queue <queue> --worker <worker>
+WORKER = '''#!%(python)s
+import sys, time
+sys.path.insert(0, %(package)r)
+import render_to_print_farm as farm
+queue_dir = sys.argv[sys.argv.index("--queue") + 1]
+worker = sys.argv[sys.argv.index("--worker") + 1]
+mode = %(mode)r
+if mode == "fail":
+    sys.exit(1)
+while True:
+    claimed = farm.claim_job(queue_dir, worker)
+    if claimed is None:
+        break
+    if mode == "hang":
+        time.sleep(60)
+    path, job = claimed
+    if mode == "fail_one":
+        farm.finish_job(queue_dir, path, job, {"sheet": job["id"], "status": "failed", "error": "Broken sheet."})
+        break
+    farm.finish_job(queue_dir, path, job, {"sheet": job["id"], "status": "done", "output": job["sheet"]["output"]})
+'''
+
+
+
+class FarmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = os.path.join(self.directory, "sheets.queue")
+        self.sheets = [{'output': "//sheet_%s.png" % i} for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def blender(self, mode):
+        path = os.path.join(self.directory, "blender_" + mode)
+        with open(path, 'w') as f:
+            f.write(WORKER % {'python': sys.executable, 'package': PACKAGE, 'mode': mode})
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        return path
+
+    def run_farm(self, mode, **options):
+        return farm.run_farm("sheets.blend", self.sheets, self.queue, blender=self.blender(mode), poll_interval=.05, **options)
+
+    def test_workers_render_all_sheets(self):
+        report = self.run_farm("render", workers=2)
+        self.assertEqual((report['done'], report['failed']), (3, 0))
+        self.assertEqual([r['sheet'] for r in report['sheets']], [0, 1, 2])
+
+    def test_gives_up_on_failing_workers(self):
+        report = self.run_farm("fail", workers=2, max_idle_exits=3)
+        self.assertEqual((report['done'], report['failed']), (0, 3))
+        self.assertTrue(all("exited without finishing" in r['error'] for r in report['sheets']))
+
+    def test_failed_jobs_are_finished(self):
+        # Every worker fails one job and exits:
+        report = self.run_farm("fail_one", workers=1, max_attempts=1, max_idle_exits=1)
+        self.assertEqual((report['done'], report['failed']), (0, 3))
+        self.assertEqual([(r['error'], r['attempts']) for r in report['sheets']], [("Broken sheet.", 1)] * 3)
+
+    def test_retried_jobs_are_not_finished(self):
+        report = self.run_farm("fail_one", workers=1, max_attempts=3, max_idle_exits=2)
+        self.assertEqual((report['done'], report['failed']), (0, 3))
+        self.assertEqual(report['sheets'][0]['attempts'], 2)
+        self.assertTrue(all("exited without finishing" in r['error'] for r in report['sheets']))
+
+    def test_kills_hanging_workers(self):
+        report = self.run_farm("hang", workers=1, max_attempts=1, job_timeout=.5, max_idle_exits=1)
+        self.assertEqual(report['done'], 0)
+        self.assertEqual(report['failed'], 3)
+        self.assertIn("timeout", report['sheets'][0]['error'])
+
+
+
+class QueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = tempfile.mkdtemp()
+        farm.create_queue(self.queue, [{'output': "a.png"}, {'output': "b.png"}])
+
+    def tearDown(self):
+        shutil.rmtree(self.queue)
+
+    def test_claim_in_order(self):
+        path, job = farm.claim_job(self.queue, 1)
+        self.assertEqual(job['id'], 0)
+        self.assertIsNotNone(farm.claimed_since(self.queue, 1))
+        self.assertIsNone(farm.claimed_since(self.queue, 2))
+        farm.finish_job(self.queue, path, job, {'status': 'done'})
+        self.assertIsNone(farm.claimed_since(self.queue, 1))
+        self.assertEqual(farm.claim_job(self.queue, 2)[1]['id'], 1)
+        self.assertIsNone(farm.claim_job(self.queue, 1))
+
+    def test_release_claimed(self):
+        farm.claim_job(self.queue, 1)
+        farm.release_claimed(self.queue, 1, max_attempts=2)
+        path, job = farm.claim_job(self.queue, 1)
+        self.assertEqual((job['id'], job['attempts']), (0, 1))
+        farm.release_claimed(self.queue, 1, max_attempts=2, error="Lost.")
+        report = farm.merge_report(self.queue)
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['sheets'][0]['error'], "Lost.")
+
+    def test_fail_pending(self):
+        self.assertEqual(farm.fail_pending(self.queue, "Given up."), 2)
+        self.assertIsNone(farm.claim_job(self.queue, 1))
+        self.assertEqual(farm.merge_report(self.queue)['failed'], 2)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+#
+# Tests of render_to_print_geometry and render_to_print_presets, run with
+#
+#   python -m pytest tests  (or python -m unittest discover tests)
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import render_to_print_geometry as geometry
+import render_to_print_presets as presets
+
+
+
+@unittest.skipIf(geometry.numpy is None, "requires numpy")
+class SolverTest(unittest.TestCase):
+
+    PRESETS = ["A0_84.1_118.9", "A4_21.0_29.7", "A10_2.6_3.7", "B3_35.3_50.0", "Letter_21.6_27.9"]
+
+    # The batch solver agrees with the addon's per sheet computation:
+    def test_matches_the_scalar_functions(self):
+        margin_sets = [(0.0, 0.0, 0.0, 0.0), (0.01, 0.02, 0.005, 0.015), (0.0, 0.0, 0.0125, 0.0125),
+                (5.0, 2.5, 10.0, 1.0), (1.0, 0.01, 3.3, 0.0)]
+        presets = [p for p in self.PRESETS if p in geometry.paper_presets_data]
+        self.assertGreater(len(presets), 3)
+        for margins in margin_sets:
+            for dpi in (72, 300, 381, 1200):
+                resolution = (1700, 2300)
+                solved = geometry.solve_print_geometry([[p] for p in presets], ["Portrait", "Landscape"], dpi,
+                        *margins, resolution_x=resolution[0], resolution_y=resolution[1])
+                ref_x_m = geometry.pixels_to_printed_m(resolution[0], dpi)
+                ref_y_m = geometry.pixels_to_printed_m(resolution[1], dpi)
+                margin_top, margin_right, margin_bottom, margin_left = margins
+                for i, preset in enumerate(presets):
+                    dims = geometry.paper_presets_data[preset][1:]
+                    for j, orientation in enumerate(("Portrait", "Landscape")):
+                        width_cm, height_cm = geometry.sheet_size_cm(dims[0], dims[1], orientation)
+                        expected = (
+                            geometry.printable_pixels(width_cm, dpi, margin_left, margin_right, ref_x_m, True),
+                            geometry.printable_pixels(height_cm, dpi, margin_top, margin_bottom, ref_y_m, True),
+                            )
+                        self.assertEqual((solved['width_px'][i, j], solved['height_px'][i, j]), expected)
+                        delta = geometry.camera_delta_offset(margins, ref_x_m, ref_y_m)
+                        self.assertAlmostEqual(solved['delta_x'][i, j], delta[0])
+                        self.assertAlmostEqual(solved['delta_y'][i, j], delta[1])
+
+    def test_settles_at_the_printable_size(self):
+        # Without a render resolution percent margins refer to the printable size they result in:
+        solved = geometry.solve_print_geometry("A4_21.0_29.7", dpi=300, margin_left=10.0, margin_right=10.0)
+        width_m = geometry.pixels_to_printed_m(solved['width_px'], 300)
+        self.assertAlmostEqual(width_m * 1.2, 0.21, places=3)
+
+    def test_custom_presets_require_a_size(self):
+        custom = [p for p in geometry.paper_presets_data if geometry.paper_presets_data[p][0] == "custom"][0]
+        with self.assertRaises(ValueError):
+            geometry.solve_print_geometry(custom)
+        solved = geometry.solve_print_geometry(custom, width_cm=10.0, height_cm=20.0, dpi=254)
+        self.assertEqual((int(solved['width_px']), int(solved['height_px'])), (1000, 2000))
+
+
+
+class TileGridTest(unittest.TestCase):
+
+    def test_cores_cover_the_render_once(self):
+        width, height = 1000, 700
+        covered = [[0] * width for y in range(height)]
+        for tile in geometry.tile_grid(width, height, 256, overlap_px=8):
+            x0, y0, x1, y1 = tile['core']
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    covered[y][x] += 1
+        self.assertTrue(all(value == 1 for row in covered for value in row))
+
+    def test_rects_grow_by_the_overlap_within_the_render(self):
+        tiles = geometry.tile_grid(100, 100, 50, overlap_px=4)
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(tiles[0]['rect'], (0, 0, 54, 54))
+        self.assertEqual(tiles[3]['rect'], (46, 46, 100, 100))
+
+    def test_border_of_the_full_rect(self):
+        self.assertEqual(geometry.pixel_rect_to_border((0, 0, 200, 100), 200, 100), (0.0, 1.0, 0.0, 1.0))
+        self.assertEqual(geometry.pixel_rect_to_border((0, 0, 100, 50), 200, 100), (0.0, 0.5, 0.5, 1.0))
+
+
+
+class FittingPresetTest(unittest.TestCase):
+
+    def test_smallest_sheet(self):
+        # 0.15 x 0.28 m is too long for letter, A4 in portrait:
+        fit = geometry.smallest_fitting_preset(0.15, 0.28, use_rolls=False)
+        self.assertEqual((fit['preset'], fit['orientation']), ("A4_21.0_29.7", "Portrait"))
+        fit = geometry.smallest_fitting_preset(0.28, 0.15, use_rolls=False)
+        self.assertEqual((fit['preset'], fit['orientation']), ("A4_21.0_29.7", "Landscape"))
+
+    def test_margins_count(self):
+        fit = geometry.smallest_fitting_preset(0.2, 0.28, use_rolls=False)
+        self.assertEqual(fit['preset'], "A4_21.0_29.7")
+        # 1 cm around makes it 22 x 30 cm:
+        fit = geometry.smallest_fitting_preset(0.2, 0.28, margins=(.01, .01, .01, .01), use_rolls=False)
+        self.assertEqual(fit['preset'], "Arch A_22.9_30.5")
+
+    def test_roll_cut_to_length(self):
+        idname = presets.register_preset("roll_test_91.4", "Test roll", 91.4, 5000.0, tipo="roll", max_length_cm=5000.0)
+        try:
+            fit = geometry.smallest_fitting_preset(0.9, 3.0)
+            self.assertEqual(fit['preset'], idname)
+            self.assertEqual((fit['width_cm'], fit['height_cm']), (91.4, 300.0))
+        finally:
+            presets.unregister_preset(idname)
+
+    def test_required_side(self):
+        self.assertAlmostEqual(geometry.required_side_m(1.0, .01, .02), 1.03)
+        # Percent margins refer to the content:
+        self.assertAlmostEqual(geometry.required_side_m(2.0, 10, 0.0), 2.2)
+
+
+
+class PresetsTest(unittest.TestCase):
+
+    def test_covering_smallest_first(self):
+        covering = presets.presets_covering(28.0, 20.0)
+        self.assertEqual(covering[0], "A4_21.0_29.7")
+        self.assertNotIn("A5_14.8_21.0", covering)
+
+    def test_register_and_unregister(self):
+        idname = presets.register_preset("Test_10.0_20.0", "Test", 10.0, 20.0)
+        try:
+            self.assertIn(idname, [item[0] for item in presets.enum_items()])
+            self.assertEqual(presets.presets_covering(9.0, 19.0)[0], idname)
+        finally:
+            presets.unregister_preset(idname)
+        self.assertNotIn(idname, [item[0] for item in presets.enum_items()])
+
+    def test_presets_require_a_size(self):
+        with self.assertRaises(ValueError):
+            presets.register_preset("Test_0.0_0.0", "Test", 0.0, 0.0)
+
+
+
+class OrthoPixelRectTest(unittest.TestCase):
+
+    def test_centered_box(self):
+        self.assertEqual(geometry.ortho_pixel_rect((-1, -1, 0), (1, 1, 0), 10, 100, 50), (40, 15, 60, 35))
+
+    def test_shift_moves_the_frame(self):
+        # Shifting the frame right by a tenth of the ortho scale moves the box left by 10 pixels:
+        self.assertEqual(geometry.ortho_pixel_rect((-1, -1, 0), (1, 1, 0), 10, 100, 50, shift_x=0.1), (30, 15, 50, 35))
+        self.assertEqual(geometry.ortho_pixel_rect((-1, -1, 0), (1, 1, 0), 10, 100, 50, shift_y=0.1), (40, 25, 60, 45))
+
+    def test_outside(self):
+        self.assertIsNone(geometry.ortho_pixel_rect((20, 20, 0), (21, 21, 0), 10, 100, 50))
+
+
+
+class RectTest(unittest.TestCase):
+
+    def test_union_and_grow(self):
+        rect = geometry.union_rect([(10, 10, 20, 20), (15, 5, 30, 12)])
+        self.assertEqual(rect, (10, 5, 30, 20))
+        self.assertEqual(geometry.grow_rect(rect, 8, 32, 100), (2, 0, 32, 28))
+
+    def test_overlap(self):
+        self.assertTrue(geometry.rects_overlap((0, 0, 10, 10), (9, 9, 20, 20)))
+        self.assertFalse(geometry.rects_overlap((0, 0, 10, 10), (10, 0, 20, 10)))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
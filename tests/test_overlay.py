@@ -0,0 +1,123 @@
+#
+# Tests of render_to_print_overlay: filling label outlines and compositing them onto images.
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import render_to_print_overlay as overlay
+import render_to_print_stitch as stitch
+from test_stitch import ImageTestCase, random_image, read_rows, write_png, write_tiff
+
+
+# Outlines in units of the height, y downwards:
+SQUARE = [[0, 0, 1, 0], [1, 0, 1, 1], [1, 1, 0, 1], [0, 1, 0, 0]]
+# The lower left half of the square:
+TRIANGLE = [[0, 0, 1, 1], [1, 1, 0, 1], [0, 1, 0, 0]]
+# A square ring, 2 units wide with a hole of 1 unit in the middle:
+RING = [[0, 0, 2, 0], [2, 0, 2, 1], [2, 1, 0, 1], [0, 1, 0, 0],
+        [.5, .25, 1.5, .25], [1.5, .25, 1.5, .75], [1.5, .75, .5, .75], [.5, .75, .5, .25]]
+
+
+
+class CoverageTest(unittest.TestCase):
+
+    def test_square_covers_everything(self):
+        self.assertEqual(overlay.outline_coverage(SQUARE, 4), [[1.0] * 4] * 4)
+
+    def test_triangle_antialiased(self):
+        coverage = overlay.outline_coverage(TRIANGLE, 4)
+        for y, row in enumerate(coverage):
+            for x, value in enumerate(row):
+                self.assertAlmostEqual(value, 1.0 if x < y else .5 if x == y else 0.0)
+
+    def test_hole(self):
+        coverage = overlay.outline_coverage(RING, 8)
+        self.assertEqual(overlay.outline_size(RING, 8), (16, 8))
+        self.assertEqual(len(coverage), 8)
+        self.assertEqual(coverage[0], [1.0] * 16)
+        self.assertEqual(coverage[4][:4], [1.0] * 4)
+        self.assertEqual(coverage[4][4:12], [0.0] * 8)
+        self.assertEqual(coverage[4][12:], [1.0] * 4)
+
+    def test_area(self):
+        # The triangle covers half of its square, up to sampling:
+        coverage = overlay.outline_coverage(TRIANGLE, 37)
+        self.assertAlmostEqual(sum(map(sum, coverage)) / 37.0 ** 2, .5, places=2)
+
+    def test_empty(self):
+        self.assertEqual(overlay.outline_coverage([], 10), [])
+        self.assertEqual(overlay.outline_coverage(SQUARE, 0), [])
+
+    def test_labels_require_an_outline(self):
+        with self.assertRaises(ValueError):
+            overlay.rasterize([{'text': "1:50", 'x': 0, 'y': 0, 'height': 10}])
+
+
+
+LABELS = [
+        {'text': "a", 'x': 3, 'y': 5, 'height': 6, 'outline': TRIANGLE, 'color': [1.0, 0.0, 0.0, .5]},
+        {'text': "b", 'x': 20, 'y': 9, 'height': 5, 'outline': RING, 'color': [0.0, 0.0, 1.0, 1.0]},
+        # Partly outside of the image:
+        {'text': "c", 'x': 30, 'y': 19, 'height': 6, 'outline': SQUARE},
+        ]
+
+
+
+class CompositeTest(ImageTestCase):
+
+    #
+    # The image with the labels composited by decoding and writing every row.
+    #
+    def expected(self, image):
+        rasterized = overlay.rasterize(LABELS)
+        return [bytes(overlay.blend_label_rows(row, y, rasterized) or row) for y, row in enumerate(image)]
+
+    def test_png_rewrites_label_rows(self):
+        image = random_image(33, 23, seed=6)
+        write_png(self.path("image.png"), image, chunks=[(b'tEXt', b'Scene\x00Scene')])
+        overlay.composite(self.path("image.png"), LABELS)
+        self.assertEqual(read_rows(self.path("image.png")), ((33, 23), self.expected(image)))
+        self.assertEqual(stitch.png_ancillary_chunks(self.path("image.png")), [(b'tEXt', b'Scene\x00Scene')])
+
+    def test_tiff_in_place(self):
+        image = random_image(33, 23, seed=7)
+        write_tiff(self.path("image.tif"), image)
+        overlay.composite(self.path("image.tif"), LABELS, output=self.path("copy.tif"))
+        self.assertEqual(read_rows(self.path("image.tif")), ((33, 23), image))
+        self.assertEqual(read_rows(self.path("copy.tif")), ((33, 23), self.expected(image)))
+        overlay.composite(self.path("image.tif"), LABELS)
+        self.assertEqual(read_rows(self.path("image.tif")), ((33, 23), self.expected(image)))
+
+    def test_converted(self):
+        image = random_image(33, 23, seed=8)
+        write_png(self.path("image.png"), image)
+        overlay.composite(self.path("image.png"), LABELS, output=self.path("image.tif"))
+        self.assertEqual(read_rows(self.path("image.tif")), ((33, 23), self.expected(image)))
+
+    def test_blend_over_transparent(self):
+        row = bytes(4 * stitch.CHANNELS)
+        label = {'x': 1, 'y': 0, 'height': 1, 'outline': SQUARE, 'color': [1.0, .5, 0.0, .5]}
+        blended = overlay.blend_label_rows(row, 0, overlay.rasterize([label]))
+        self.assertEqual(bytes(blended[4:8]), bytes((255, 128, 0, 128)))
+        self.assertEqual(bytes(blended[:4]), bytes(4))
+        self.assertIsNone(overlay.blend_label_rows(row, 1, overlay.rasterize([label])))
+
+    def test_stitch_blends_labels(self):
+        import render_to_print_geometry as geometry
+        image = random_image(33, 23, seed=9)
+        tiles = geometry.tile_grid(33, 23, 16, 2)
+        for tile in tiles:
+            x0, y0, x1, y1 = tile['rect']
+            tile['path'] = self.path("tile_%s_%s.tif" % (tile['row'], tile['column']))
+            write_tiff(tile['path'], [row[x0 * 4:x1 * 4] for row in image[y0:y1]])
+        index = {'output': self.path("sheet.png"), 'width': 33, 'height': 23, 'tiles': tiles, 'labels': LABELS}
+        stitch.stitch(index)
+        self.assertEqual(read_rows(self.path("sheet.png")), ((33, 23), self.expected(image)))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+#
+# Tests of render_to_print_stitch: reading and writing PNG and TIFF rows, stitching tiles and
+# pasting regions.
+#
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import render_to_print_stitch as stitch
+
+
+def random_image(width, height, seed=0):
+    generator = random.Random(seed)
+    return [bytes(generator.randrange(256) for i in range(width * stitch.CHANNELS)) for y in range(height)]
+
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+
+def _filter(filter_type, line, previous, bpp):
+    filtered = bytearray(len(line))
+    for i in range(len(line)):
+        a = line[i - bpp] if i >= bpp else 0
+        b = previous[i]
+        c = previous[i - bpp] if i >= bpp else 0
+        predictor = (0, a, b, (a + b) >> 1, _paeth(a, b, c))[filter_type]
+        filtered[i] = (line[i] - predictor) & 0xff
+    return bytes(filtered)
+
+
+
+#
+# Writes the rows (RGBA unless channels given) as PNG, row y filtered with filters[y % len(filters)],
+# like encoders that choose the filter per row.
+#
+def write_png(path, rows, filters=(0, 1, 2, 3, 4), channels=stitch.CHANNELS, chunks=()):
+    width = len(rows[0]) // channels
+    writer = stitch.PNGWriter(path, width, len(rows), channels=channels, chunks=chunks)
+    previous = bytes(len(rows[0]))
+    for y, row in enumerate(rows):
+        filter_type = filters[y % len(filters)]
+        writer.write_filtered_row(filter_type, _filter(filter_type, row, previous, channels))
+        previous = row
+    writer.close()
+
+
+
+def write_tiff(path, rows):
+    writer = stitch.TIFFWriter(path, len(rows[0]) // stitch.CHANNELS, len(rows))
+    for row in rows:
+        writer.write_row(row)
+    writer.close()
+
+
+
+def read_rows(path):
+    rows = stitch.iter_image_rows(path)
+    size = next(rows)
+    return size, list(rows)
+
+
+
+class ImageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+
+
+class RowsTest(ImageTestCase):
+
+    def test_png_all_filters(self):
+        image = random_image(13, 11)
+        write_png(self.path("image.png"), image)
+        self.assertEqual(read_rows(self.path("image.png")), ((13, 11), image))
+
+    def test_png_filters_without_numpy(self):
+        image = random_image(7, 10, seed=1)
+        write_png(self.path("image.png"), image)
+        numpy = stitch.numpy
+        stitch.numpy = None
+        try:
+            self.assertEqual(read_rows(self.path("image.png")), ((7, 10), image))
+        finally:
+            stitch.numpy = numpy
+
+    def test_tiff(self):
+        image = random_image(9, 5)
+        write_tiff(self.path("image.tif"), image)
+        self.assertEqual(read_rows(self.path("image.tif")), ((9, 5), image))
+        layout = stitch.read_tiff_layout(self.path("image.tif"))
+        self.assertEqual((layout['width'], layout['height'], layout['channels']), (9, 5, 4))
+
+    def test_open_writer_by_extension(self):
+        image = random_image(4, 4)
+        for name in ("image.png", "image.tif"):
+            writer = stitch.open_writer(self.path(name), 4, 4, dpi=300)
+            for row in image:
+                writer.write_row(row)
+            writer.close()
+            self.assertEqual(read_rows(self.path(name)), ((4, 4), image))
+        self.assertEqual(stitch.image_format(self.path("image.png")), 'PNG')
+        self.assertEqual(stitch.image_format(self.path("image.tif")), 'TIFF')
+
+
+
+class StitchTest(ImageTestCase):
+
+    def tile_index(self, image, width, height, tile_px, overlap_px, empty=(), extension=".png"):
+        import render_to_print_geometry as geometry
+        tiles = geometry.tile_grid(width, height, tile_px, overlap_px)
+        for tile in tiles:
+            tile['path'] = self.path("tile_%03d_%03d%s" % (tile['row'], tile['column'], extension))
+            tile['empty'] = (tile['row'], tile['column']) in empty
+            if tile['empty']:
+                continue
+            x0, y0, x1, y1 = tile['rect']
+            rows = [row[x0 * stitch.CHANNELS:x1 * stitch.CHANNELS] for row in image[y0:y1]]
+            (write_png if extension == ".png" else write_tiff)(tile['path'], rows)
+        return {'output': self.path("sheet.png"), 'width': width, 'height': height, 'dpi': 300, 'tiles': tiles}
+
+    def test_round_trip(self):
+        image = random_image(23, 17, seed=2)
+        for extension in (".png", ".tif"):
+            index = self.tile_index(image, 23, 17, 8, 2, extension=extension)
+            output = stitch.stitch(index)
+            self.assertEqual(read_rows(output), ((23, 17), image))
+
+    def test_empty_tiles_are_transparent(self):
+        image = random_image(16, 16, seed=3)
+        index = self.tile_index(image, 16, 16, 8, 1, empty={(0, 1)})
+        size, rows = read_rows(stitch.stitch(index, self.path("sheet.tif")))
+        for y in range(16):
+            expected = bytearray(image[y])
+            if y < 8:
+                expected[8 * stitch.CHANNELS:] = bytes(8 * stitch.CHANNELS)
+            self.assertEqual(rows[y], bytes(expected))
+
+
+
+class PasteTest(ImageTestCase):
+
+    def test_paste(self):
+        base = random_image(20, 10, seed=4)
+        patched = random_image(20, 10, seed=5)
+        write_png(self.path("base.png"), base)
+        patch_rect, rect = (4, 2, 16, 9), (6, 3, 14, 8)
+        write_tiff(self.path("patch.tif"), [row[patch_rect[0] * 4:patch_rect[2] * 4] for row in patched[patch_rect[1]:patch_rect[3]]])
+        stitch.paste(self.path("base.png"), self.path("patch.tif"), patch_rect, rect, self.path("pasted.png"))
+        size, rows = read_rows(self.path("pasted.png"))
+        for y in range(10):
+            for x in range(20):
+                source = patched if rect[0] <= x < rect[2] and rect[1] <= y < rect[3] else base
+                self.assertEqual(rows[y][x * 4:x * 4 + 4], source[y][x * 4:x * 4 + 4])
+
+    def paste_rgba(self, patched, patch_rect, rect, extension):
+        write_tiff(self.path("patch.tif"), [row[patch_rect[0] * 4:patch_rect[2] * 4] for row in patched[patch_rect[1]:patch_rect[3]]])
+        return stitch.paste(self.path("base" + extension), self.path("patch.tif"), patch_rect, rect, self.path("pasted" + extension))
+
+    def test_paste_keeps_the_channels_and_chunks(self):
+        base = [stitch._from_rgba(row, 3) for row in random_image(20, 10, seed=6)]
+        patched = random_image(20, 10, seed=7)
+        chunks = [(b'tEXt', b'Camera\x00Camera.001'), (b'sRGB', b'\x00')]
+        write_png(self.path("base.png"), base, channels=3, chunks=chunks)
+        self.paste_rgba(patched, (2, 1, 18, 9), (3, 2, 17, 8), ".png")
+        rows = stitch.iter_png_filtered_rows(self.path("pasted.png"))
+        self.assertEqual(next(rows)[2], 3)
+        rows.close()
+        self.assertEqual(stitch.png_ancillary_chunks(self.path("pasted.png")), chunks)
+        size, rows = read_rows(self.path("pasted.png"))
+        for y in range(10):
+            expected = bytearray(stitch._to_rgba(base[y], 3))
+            if 2 <= y < 8:
+                expected[3 * 4:17 * 4] = stitch._to_rgba(stitch._from_rgba(patched[y][3 * 4:17 * 4], 3), 3)
+            self.assertEqual(rows[y], bytes(expected))
+
+    def test_paste_tiff_in_place(self):
+        base = random_image(12, 12, seed=8)
+        patched = random_image(12, 12, seed=9)
+        write_tiff(self.path("base.tif"), base)
+        self.paste_rgba(patched, (0, 0, 12, 12), (4, 4, 8, 8), ".tif")
+        size, rows = read_rows(self.path("pasted.tif"))
+        for y in range(12):
+            expected = bytearray(base[y])
+            if 4 <= y < 8:
+                expected[4 * 4:8 * 4] = patched[y][4 * 4:8 * 4]
+            self.assertEqual(rows[y], bytes(expected))
+        self.assertEqual(read_rows(self.path("base.tif")), ((12, 12), base))
+
+    def test_paste_requires_the_patch_size(self):
+        write_png(self.path("base.png"), random_image(10, 10))
+        write_png(self.path("patch.png"), random_image(3, 3))
+        with self.assertRaises(ValueError):
+            stitch.paste(self.path("base.png"), self.path("patch.png"), (0, 0, 4, 4), (1, 1, 3, 3), self.path("pasted.png"))
+
+
+
+if __name__ == "__main__":
+    unittest.main()